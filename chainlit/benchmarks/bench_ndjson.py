@@ -0,0 +1,119 @@
+"""
+Micro-benchmark for the Langflow NDJSON stream parser.
+
+Builds a synthetic stream of N token events (plus periodic add_message events and
+a large end event carrying the whole outputs tree), splits it into network-sized
+chunks and compares the legacy string-buffer loop with NDJSONEventParser.
+
+Large reads (--max-chunk 1048576) show the quadratic cost of re-slicing a str buffer.
+
+Usage:
+    python benchmarks/bench_ndjson.py [--tokens 10000] [--repeat 5] [--max-chunk 65536]
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from chainlit_app.ndjson import NDJSONEventParser, orjson, stdlib_loads  # noqa: E402
+
+
+def build_stream(tokens: int) -> bytes:
+    words = ["lorem", "ipsum", "dolor", "sit", "amet", "consectetur", "adipiscing", "elit"]
+    rng = random.Random(42)
+    text = []
+    lines = []
+    for i in range(tokens):
+        chunk = rng.choice(words) + " "
+        text.append(chunk)
+        lines.append(json.dumps({"event": "token", "data": {"chunk": chunk, "id": f"msg-{i // 500}"}}))
+        if i % 2500 == 0:
+            lines.append(json.dumps({
+                "event": "add_message",
+                "data": {"text": "".join(text), "content_blocks": [{"title": "Agent Steps", "contents": []}]},
+            }))
+    search_results = [{"title": f"result {i}", "content": " ".join(words) * 40} for i in range(200)]
+    tool_block = {"title": "Agent Steps", "contents": [{"type": "tool_use", "name": "search", "output": search_results}]}
+    message = {"text": "".join(text), "content_blocks": [tool_block]}
+    outputs = [{"outputs": [{"results": {"message": message}}]}]
+    lines.append(json.dumps({"event": "end", "data": {"result": {"outputs": outputs}}}))
+    return "\n\n".join(lines).encode() + b"\n\n"
+
+
+def split_chunks(stream: bytes, max_chunk: int, seed: int = 7) -> list:
+    rng = random.Random(seed)
+    chunks = []
+    pos = 0
+    while pos < len(stream):
+        size = rng.randint(64, max_chunk)
+        chunks.append(stream[pos:pos + size])
+        pos += size
+    return chunks
+
+
+def legacy(chunks: list) -> int:
+    count = 0
+    buffer = ""
+    for chunk in chunks:
+        buffer += chunk.decode()
+        while "\n" in buffer:
+            line_end = buffer.index("\n")
+            line = buffer[:line_end].strip()
+            buffer = buffer[line_end + 1:]
+            if not line:
+                continue
+            try:
+                event_obj = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if event_obj.get("event") and event_obj.get("data") is not None:
+                count += 1
+    return count
+
+
+def parser(chunks: list, loads=None) -> int:
+    p = NDJSONEventParser(loads=loads)
+    count = 0
+    for chunk in chunks:
+        for _ in p.feed(chunk):
+            count += 1
+    for _ in p.finish():
+        count += 1
+    return count
+
+
+def bench(name: str, fn, repeat: int):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        count = fn()
+        best = min(best, time.perf_counter() - start)
+    print(f"{name:<40} {best * 1000:9.2f} ms  ({count} events)")
+
+
+def main():
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument("--tokens", type=int, default=10_000)
+    arg_parser.add_argument("--repeat", type=int, default=5)
+    arg_parser.add_argument("--max-chunk", type=int, default=64 * 1024, help="largest network read in bytes")
+    args = arg_parser.parse_args()
+
+    stream = build_stream(args.tokens)
+    chunks = split_chunks(stream, args.max_chunk)
+    print(f"stream: {len(stream) / 1024:.1f} KiB in {len(chunks)} chunks, {args.tokens} tokens\n")
+
+    bench("legacy str buffer + json", lambda: legacy(chunks), args.repeat)
+    bench("parser + json", lambda: parser(chunks, loads=stdlib_loads), args.repeat)
+    if orjson is not None:
+        bench("parser + orjson", lambda: parser(chunks, loads=orjson.loads), args.repeat)
+    else:
+        print("(orjson not installed, skipping orjson runs)")
+
+
+if __name__ == "__main__":
+    main()
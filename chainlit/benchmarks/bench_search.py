@@ -0,0 +1,166 @@
+"""
+Benchmark for full-text search over conversation history.
+
+Seeds a PostgreSQL database with synthetic users, threads and steps (server-side, via
+generate_series), then times PostgresDataLayer.search_threads for a few query shapes against
+the old ILIKE scan. Run it against a scratch database: migrations are applied first, and the
+seeded rows (users named bench-search-*) are deleted afterwards unless --keep is given.
+
+Usage:
+    DATABASE_URL=postgresql+asyncpg://... python benchmarks/bench_search.py [--steps 1000000] [--repeat 20]
+"""
+
+import argparse
+import asyncio
+import os
+import re
+import statistics
+import sys
+import time
+
+ROOT = os.path.join(os.path.dirname(__file__), "..")
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "src"))
+
+import init_db  # noqa: E402
+from chainlit_app.data_layer import PostgresDataLayer  # noqa: E402
+
+COMMON_WORDS = [
+    "the", "model", "answer", "question", "data", "file", "result", "search", "code", "function",
+    "python", "error", "request", "server", "user", "value", "table", "query", "agent", "tool",
+]
+RARE_WORDS = 20_000
+USER_PREFIX = "bench-search-"
+
+SEED_USERS_SQL = """
+    INSERT INTO users ("id", "identifier", "metadata", "createdAt")
+    SELECT gen_random_uuid(), %(prefix)s || g, '{}', now() FROM generate_series(1, %(users)s) g
+"""
+
+SEED_THREADS_SQL = """
+    INSERT INTO threads ("id", "createdAt", "name", "userId", "userIdentifier", "metadata")
+    SELECT gen_random_uuid(), now() - random() * interval '60 days',
+           'Conversation about ' || (%(common)s::text[])[1 + floor(random() * %(common_count)s)::int]
+               || ' term' || floor(random() * %(rare)s)::int,
+           u."id", u."identifier", '{}'
+    FROM users u, generate_series(1, %(threads)s) g
+    WHERE u."identifier" LIKE %(pattern)s
+"""
+
+# The rare terms follow a skewed distribution, so some match thousands of steps and some a handful
+SEED_STEPS_SQL = """
+    INSERT INTO steps ("id", "name", "type", "threadId", "streaming", "output", "createdAt")
+    SELECT gen_random_uuid(), 'Assistant', 'assistant_message', t."id", false,
+           (SELECT string_agg(
+                CASE WHEN random() < 0.8 THEN (%(common)s::text[])[1 + floor(random() * %(common_count)s)::int]
+                     ELSE 'term' || floor(power(random(), 3) * %(rare)s)::int END, ' ')
+            FROM generate_series(1, %(words)s + g * 0)),
+           t."createdAt" + g * interval '1 second'
+    FROM threads t, generate_series(1, %(steps)s) g
+    WHERE t."userIdentifier" LIKE %(pattern)s
+"""
+
+ILIKE_SQL = """
+    SELECT t."id" FROM threads t
+    WHERE t."userId" = %(user_id)s AND (t."name" ILIKE %(search)s OR EXISTS
+        (SELECT 1 FROM steps s WHERE s."threadId" = t."id" AND s."output" ILIKE %(search)s))
+    ORDER BY t."createdAt" DESC LIMIT 10
+"""
+
+QUERIES = {
+    "common word": "python",
+    "frequent term": "term1",
+    "rare term": "term19000",
+    "two words": "server term7",
+    "phrase": '"python error"',
+    "no match": "nonexistentword",
+}
+
+
+def seed(cursor, steps: int, threads_per_user: int, steps_per_thread: int, words: int):
+    users = max(1, steps // (threads_per_user * steps_per_thread))
+    params = {
+        "prefix": USER_PREFIX,
+        "pattern": f"{USER_PREFIX}%",
+        "users": users,
+        "threads": threads_per_user,
+        "steps": steps_per_thread,
+        "words": words,
+        "common": COMMON_WORDS,
+        "common_count": len(COMMON_WORDS),
+        "rare": RARE_WORDS,
+    }
+    for label, sql in (("users", SEED_USERS_SQL), ("threads", SEED_THREADS_SQL), ("steps", SEED_STEPS_SQL)):
+        started = time.perf_counter()
+        cursor.execute(sql, params)
+        print(f"seeded {cursor.rowcount:>10} {label:<8} in {time.perf_counter() - started:7.1f}s")
+    cursor.execute("ANALYZE users; ANALYZE threads; ANALYZE steps")
+    cursor.execute('SELECT "id" FROM users WHERE "identifier" = %s', (f"{USER_PREFIX}1",))
+    return cursor.fetchone()[0]
+
+
+def report(name: str, timings: list, count: int):
+    timings = sorted(timings)
+    p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+    print(f"{name:<28} p50 {statistics.median(timings) * 1000:8.2f} ms  p95 {p95 * 1000:8.2f} ms  ({count} results)")
+
+
+async def bench_search(user_id: str, repeat: int, limit: int):
+    conninfo = re.sub(r"^postgresql(\+\w+)?://", "postgresql+asyncpg://", init_db.DATABASE_URL)
+    layer = PostgresDataLayer(conninfo=conninfo, search_config=init_db.SEARCH_TEXT_CONFIG)
+    try:
+        for name, query in QUERIES.items():
+            await layer.search_threads(user_id, query, limit=limit)
+            timings = []
+            for _ in range(repeat):
+                started = time.perf_counter()
+                rows, _ = await layer.search_threads(user_id, query, limit=limit)
+                timings.append(time.perf_counter() - started)
+            report(f"fts: {name}", timings, len(rows))
+    finally:
+        await layer.close()
+
+
+def bench_ilike(cursor, user_id: str):
+    for name, query in QUERIES.items():
+        started = time.perf_counter()
+        cursor.execute(ILIKE_SQL, {"user_id": user_id, "search": f"%{query.strip(chr(34))}%"})
+        count = len(cursor.fetchall())
+        report(f"ilike: {name}", [time.perf_counter() - started], count)
+
+
+def main():
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument("--steps", type=int, default=1_000_000, help="total steps to seed")
+    arg_parser.add_argument("--threads-per-user", type=int, default=500)
+    arg_parser.add_argument("--steps-per-thread", type=int, default=20)
+    arg_parser.add_argument("--words", type=int, default=60, help="words per step output")
+    arg_parser.add_argument("--repeat", type=int, default=20)
+    arg_parser.add_argument("--limit", type=int, default=10)
+    arg_parser.add_argument("--no-ilike", action="store_true", help="skip the (slow) ILIKE baseline")
+    arg_parser.add_argument("--keep", action="store_true", help="keep the seeded rows")
+    args = arg_parser.parse_args()
+
+    conn = init_db.connect()
+    conn.autocommit = True
+    cursor = conn.cursor()
+    try:
+        init_db.migrate(cursor)
+        cursor.execute('DELETE FROM users WHERE "identifier" LIKE %s', (f"{USER_PREFIX}%",))
+        print()
+        user_id = seed(cursor, args.steps, args.threads_per_user, args.steps_per_thread, args.words)
+        print(f"\nsearching as one user ({args.threads_per_user * args.steps_per_thread} steps) "
+              f"among {args.steps} steps, page size {args.limit}\n")
+        asyncio.run(bench_search(user_id, args.repeat, args.limit))
+        if not args.no_ilike:
+            print()
+            bench_ilike(cursor, user_id)
+    finally:
+        if not args.keep:
+            cursor.execute('DELETE FROM users WHERE "identifier" LIKE %s', (f"{USER_PREFIX}%",))
+        cursor.close()
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
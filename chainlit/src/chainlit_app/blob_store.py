@@ -0,0 +1,134 @@
+import abc
+import asyncio
+import gzip
+import hashlib
+import os
+import re
+import time
+import uuid
+from typing import Callable, Dict, Optional
+
+from chainlit_app import metrics
+from chainlit_app.config import (
+    BLOB_DELETE_GRACE,
+    BLOB_STORE_BACKEND,
+    BLOB_STORE_COMPRESSION_LEVEL,
+    BLOB_STORE_PATH,
+)
+
+_KEY = re.compile(r"^sha256:[0-9a-f]{64}$")
+
+
+def blob_key(data: bytes) -> str:
+    return "sha256:" + hashlib.sha256(data).hexdigest()
+
+
+class BlobStore(abc.ABC):
+    # Content-addressed: put() returns the key, identical payloads are stored once
+    @abc.abstractmethod
+    async def put(self, data: bytes) -> str:
+        ...
+
+    @abc.abstractmethod
+    async def get(self, key: str) -> Optional[bytes]:
+        ...
+
+    @abc.abstractmethod
+    async def delete(self, key: str):
+        ...
+
+    @abc.abstractmethod
+    def stats(self) -> dict:
+        ...
+
+
+class LocalBlobStore(BlobStore):
+    def __init__(self, root: str, compression_level: int = 6, delete_grace: float = 300.0):
+        self.root = root
+        self.compression_level = compression_level
+        # A blob (re)written this recently may belong to a step that is about to be inserted
+        self.delete_grace = delete_grace
+        self.writes = 0
+        self.deduplicated = 0
+        self.reads = 0
+        self.bytes_in = 0
+        self.bytes_stored = 0
+
+    def _path(self, key: str) -> str:
+        if not _KEY.match(key):
+            raise ValueError(f"Invalid blob key: {key!r}")
+        digest = key.split(":", 1)[1]
+        return os.path.join(self.root, digest[:2], digest[2:4], f"{digest}.gz")
+
+    def _put(self, data: bytes) -> str:
+        # Always (re)written, never skipped when present: a concurrent delete may be about to unlink it
+        key = blob_key(data)
+        path = self._path(key)
+        existed = os.path.exists(path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        compressed = gzip.compress(data, compresslevel=self.compression_level)
+        tmp = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(compressed)
+        os.replace(tmp, path)
+        if existed:
+            self.deduplicated += 1
+            return key
+        self.writes += 1
+        self.bytes_in += len(data)
+        self.bytes_stored += len(compressed)
+        return key
+
+    def _get(self, key: str) -> Optional[bytes]:
+        try:
+            with open(self._path(key), "rb") as f:
+                compressed = f.read()
+        except FileNotFoundError:
+            return None
+        self.reads += 1
+        return gzip.decompress(compressed)
+
+    def _delete(self, key: str):
+        path = self._path(key)
+        try:
+            if time.time() - os.path.getmtime(path) < self.delete_grace:
+                return
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    async def put(self, data: bytes) -> str:
+        return await asyncio.to_thread(self._put, data)
+
+    async def get(self, key: str) -> Optional[bytes]:
+        return await asyncio.to_thread(self._get, key)
+
+    async def delete(self, key: str):
+        await asyncio.to_thread(self._delete, key)
+
+    def stats(self) -> dict:
+        return {
+            "writes": self.writes,
+            "deduplicated": self.deduplicated,
+            "reads": self.reads,
+            "bytes_in": self.bytes_in,
+            "bytes_stored": self.bytes_stored,
+        }
+
+
+# Other backends (S3, GCS, ...) register a factory here under the BLOB_STORE_BACKEND name
+BACKENDS: Dict[str, Callable[[], BlobStore]] = {
+    "local": lambda: LocalBlobStore(BLOB_STORE_PATH, BLOB_STORE_COMPRESSION_LEVEL, BLOB_DELETE_GRACE),
+}
+
+_store: Optional[BlobStore] = None
+
+
+def get_blob_store() -> Optional[BlobStore]:
+    global _store
+    if _store is None and BLOB_STORE_BACKEND not in ("", "off"):
+        if BLOB_STORE_BACKEND not in BACKENDS:
+            raise ValueError(f"Unknown BLOB_STORE_BACKEND: {BLOB_STORE_BACKEND}")
+        _store = BACKENDS[BLOB_STORE_BACKEND]()
+        metrics.register("blob_store", _store.stats)
+    return _store
@@ -0,0 +1,72 @@
+import asyncio
+import logging
+from typing import Awaitable, Callable, Optional
+
+from chainlit_app import metrics
+from chainlit_app.config import STREAM_COALESCE_BYTES, STREAM_COALESCE_MS
+
+logger = logging.getLogger(__name__)
+
+_totals = {"tokens": 0, "frames": 0}
+metrics.register("token_coalescer", lambda: {
+    **_totals,
+    "tokens_per_frame": round(_totals["tokens"] / _totals["frames"], 2) if _totals["frames"] else 0.0,
+})
+
+
+class TokenCoalescer:
+    def __init__(
+        self,
+        sink: Callable[[str], Awaitable[None]],
+        window_ms: float = STREAM_COALESCE_MS,
+        max_bytes: int = STREAM_COALESCE_BYTES,
+    ):
+        self._sink = sink
+        self._window = window_ms / 1000
+        self._max_bytes = max_bytes
+        self._parts = []
+        self._size = 0
+        self._timer: Optional[asyncio.Task] = None
+        self._lock = asyncio.Lock()
+        self.tokens = 0
+        self.frames = 0
+
+    async def push(self, token: str):
+        if not token:
+            return
+        self.tokens += 1
+        _totals["tokens"] += 1
+        self._parts.append(token)
+        self._size += len(token.encode())
+
+        # The first token goes out immediately so time to first token is unchanged
+        if self.frames == 0 or self._size >= self._max_bytes or self._window <= 0:
+            await self.flush()
+        elif self._timer is None:
+            self._timer = asyncio.create_task(self._flush_later())
+
+    async def flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        await self._send()
+
+    async def close(self):
+        await self.flush()
+        logger.debug(f"Coalesced {self.tokens} tokens into {self.frames} frames")
+
+    async def _flush_later(self):
+        await asyncio.sleep(self._window)
+        self._timer = None
+        await self._send()
+
+    async def _send(self):
+        async with self._lock:
+            if not self._parts:
+                return
+            text = "".join(self._parts)
+            self._parts.clear()
+            self._size = 0
+            self.frames += 1
+            _totals["frames"] += 1
+            await self._sink(text)
@@ -1,8 +1,957 @@
+import asyncio
+import contextvars
+import copy
+import json
+import logging
+import os
+import re
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Set, Tuple
+
 import chainlit as cl
+from chainlit.data import get_data_layer as current_data_layer
 from chainlit.data.sql_alchemy import SQLAlchemyDataLayer
-from chainlit_app.config import DATABASE_URL
+from chainlit.data.utils import queue_until_user_message
+from chainlit.types import Feedback, PageInfo, PaginatedResponse, Pagination, ThreadDict, ThreadFilter
+from sqlalchemy import text
+
+from chainlit_app import metrics
+from chainlit_app.blob_store import BlobStore, get_blob_store
+from chainlit_app.cache import MemoryCache
+from chainlit_app.config import (
+    BLOB_OFFLOAD_THRESHOLD,
+    BLOB_PREVIEW_CHARS,
+    DATABASE_PARTITIONED,
+    DATABASE_URL,
+    DATA_LAYER_BATCH_SIZE,
+    DATA_LAYER_BATCHING,
+    DATA_LAYER_CACHE_CHANNEL,
+    DATA_LAYER_CACHE_MAX_ENTRIES,
+    DATA_LAYER_CACHE_TTL,
+    DATA_LAYER_FLUSH_INTERVAL,
+    DATA_LAYER_READ_CACHE,
+    SEARCH_TEXT_CONFIG,
+)
+
+logger = logging.getLogger(__name__)
+
+# Set while a batch is being built: writes issued by the parent class are collected instead of executed
+_deferred_writes: contextvars.ContextVar[Optional[List[Tuple[str, dict]]]] = contextvars.ContextVar(
+    "deferred_writes", default=None
+)
+
+_WRITE_PREFIXES = ("INSERT", "UPDATE", "DELETE")
+# Columns stored as timestamptz after init_db migration 2; Chainlit passes and expects ISO strings
+_TIMESTAMP_PARAMS = ("createdAt", "start", "end")
+_TIMESTAMP_COLUMNS_SQL = """
+    SELECT table_name, column_name FROM information_schema.columns
+    WHERE table_schema = current_schema() AND data_type = 'timestamp with time zone'
+      AND column_name IN ('createdAt', 'start', 'end')
+"""
+_WRITTEN_TABLE = re.compile(r'(?:INSERT INTO|UPDATE)\s+"?(\w+)', re.I)
+
+
+def _is_write(query: str) -> bool:
+    return query.lstrip()[:6].upper() in _WRITE_PREFIXES
+
+
+def _parse_timestamp(value):
+    if not isinstance(value, str):
+        return value
+    try:
+        parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        return value
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+
+def coerce_parameters(parameters: dict, columns=_TIMESTAMP_PARAMS) -> dict:
+    if not any(key in parameters for key in columns):
+        return parameters
+    return {key: _parse_timestamp(value) if key in columns else value for key, value in parameters.items()}
+
+
+_ELEMENT_UPSERT = re.compile(r"^\s*INSERT INTO elements (\(.*?\)) VALUES (\(.*?\)) ON CONFLICT \(id\) DO UPDATE SET .*$", re.S)
+
+
+def partition_statement(query: str) -> str:
+    # Partitioned tables only have a unique key on ("id", "createdAt").
+    # Steps keep their createdAt across updates; elements carry none, so they are replaced instead.
+    if "INSERT INTO steps" in query:
+        return query.replace("ON CONFLICT (id)", 'ON CONFLICT ("id", "createdAt")')
+    match = _ELEMENT_UPSERT.match(query)
+    if match:
+        columns, values = match.groups()
+        return f'WITH replaced AS (DELETE FROM elements WHERE "id" = :id) INSERT INTO elements {columns} VALUES {values}'
+    return query
+
+
+def step_upsert(step_dict: dict) -> Tuple[str, dict]:
+    # The statement SQLAlchemyDataLayer.create_step writes, without the update_thread it runs first
+    step_dict = dict(step_dict)
+    step_dict["showInput"] = str(step_dict.get("showInput", "")).lower() if "showInput" in step_dict else None
+    parameters = {
+        key: value
+        for key, value in step_dict.items()
+        if value is not None and not (isinstance(value, dict) and not value)
+    }
+    parameters["metadata"] = json.dumps(step_dict.get("metadata", {}))
+    parameters["generation"] = json.dumps(step_dict.get("generation", {}))
+    columns = ", ".join(f'"{key}"' for key in parameters)
+    values = ", ".join(f":{key}" for key in parameters)
+    updates = ", ".join(f'"{key}" = :{key}' for key in parameters if key != "id")
+    return f"INSERT INTO steps ({columns}) VALUES ({values}) ON CONFLICT (id) DO UPDATE SET {updates}", parameters
+
+
+# Creates the thread a batch of steps belongs to; an existing thread is left as it is
+THREAD_INSERT = 'INSERT INTO threads ("id", "createdAt") VALUES (:id, :createdAt) ON CONFLICT ("id") DO NOTHING'
+
+
+def format_timestamp(value: datetime) -> str:
+    return value.astimezone(timezone.utc).replace(tzinfo=None).isoformat() + "Z"
+
+
+OFFLOADED_FIELDS = ("input", "output", "generation")
+
+
+def preview_text(value: str, limit: int) -> str:
+    return f"{value[:limit]}\n\n… (+{len(value) - limit} chars, full content stored separately)"
+
+
+def offloaded_fields(metadata) -> Dict[str, str]:
+    # Step metadata comes back as a dict or, from some queries, as raw JSON text
+    if isinstance(metadata, str):
+        try:
+            metadata = json.loads(metadata)
+        except ValueError:
+            return {}
+    return (metadata or {}).get("blobs") or {}
+
+
+class PostgresDataLayer(SQLAlchemyDataLayer):
+    def __init__(
+        self,
+        *args,
+        partitioned: bool = False,
+        blob_store: Optional[BlobStore] = None,
+        offload_threshold: int = 32768,
+        preview_chars: int = 2000,
+        search_config: str = "english",
+        **kwargs,
+    ):
+        super().__init__(*args, **kwargs)
+        self.partitioned = partitioned
+        self.search_config = search_config
+        self.blob_store = blob_store
+        self.offload_threshold = offload_threshold
+        self.preview_chars = preview_chars
+        self.offloaded = 0
+        # table -> timestamp columns that are already timestamptz; None = unknown, assume all are
+        self._timestamp_columns: Optional[Dict[str, frozenset]] = None
+        self._column_lookup: Optional[asyncio.Task] = None
+
+    async def load_column_types(self):
+        # Before init_db migration 2 the columns are TEXT, and asyncpg needs str there and datetime after
+        try:
+            async with self.async_session() as session:
+                result = await session.execute(text(_TIMESTAMP_COLUMNS_SQL))
+                columns: Dict[str, set] = {}
+                for table, column in result.fetchall():
+                    columns.setdefault(table, set()).add(column)
+        except Exception as e:
+            logger.warning(f"Could not look up timestamp column types, assuming timestamptz: {e}")
+            return
+        self._timestamp_columns = {table: frozenset(names) for table, names in columns.items()}
+
+    async def _ensure_column_types(self):
+        if self._column_lookup is None:
+            self._column_lookup = asyncio.create_task(self.load_column_types())
+        await asyncio.shield(self._column_lookup)
+
+    def timestamp_params(self, query: str) -> frozenset:
+        if self._timestamp_columns is None:
+            return frozenset(_TIMESTAMP_PARAMS)
+        columns = self._timestamp_columns
+        match = _WRITTEN_TABLE.search(query)
+        if match:
+            return columns.get(match.group(1), frozenset())
+        return frozenset().union(*columns.values())
+
+    def prepare(self, query: str, parameters: dict) -> Tuple[str, dict]:
+        return (
+            partition_statement(query) if self.partitioned else query,
+            coerce_parameters(parameters, self.timestamp_params(query)),
+        )
+
+    async def execute_sql(self, query: str, parameters: dict):
+        await self._ensure_column_types()
+        columns = self.timestamp_params(query)
+        result = await super().execute_sql(*self.prepare(query, parameters))
+        if result is None and _is_write(query) and any(key in parameters for key in _TIMESTAMP_PARAMS):
+            # The parent logs and swallows errors; a failed write may mean migration 2 just swapped a column
+            await self.load_column_types()
+            if self.timestamp_params(query) != columns:
+                result = await super().execute_sql(*self.prepare(query, parameters))
+        return result
+
+    def clean_result(self, obj):
+        if isinstance(obj, datetime):
+            return format_timestamp(obj)
+        return super().clean_result(obj)
+
+    ###### Large payloads ######
+    async def offload_step(self, step_dict: dict) -> dict:
+        # Oversized fields go to the blob store; the row keeps a preview and the keys in metadata.blobs
+        if self.blob_store is None:
+            return step_dict
+        blobs = {}
+        offloaded = dict(step_dict)
+        for field in ("input", "output"):
+            value = step_dict.get(field)
+            if isinstance(value, str) and len(value) > self.offload_threshold:
+                blobs[field] = await self.blob_store.put(value.encode())
+                offloaded[field] = preview_text(value, self.preview_chars)
+        if step_dict.get("generation"):
+            encoded = json.dumps(step_dict["generation"])
+            if len(encoded) > self.offload_threshold:
+                blobs["generation"] = await self.blob_store.put(encoded.encode())
+                offloaded["generation"] = {}
+        if not blobs:
+            return step_dict
+        self.offloaded += len(blobs)
+        offloaded["metadata"] = {**(step_dict.get("metadata") or {}), "blobs": blobs}
+        return offloaded
+
+    @queue_until_user_message()
+    async def create_step(self, step_dict):
+        await super().create_step.__wrapped__(self, await self.offload_step(step_dict))
+
+    async def load_step_payload(self, thread_id: str, step_id: str, field: str) -> Optional[str]:
+        # Scoped to the thread so a step id alone cannot reach another user's content
+        if self.blob_store is None or field not in OFFLOADED_FIELDS:
+            return None
+        rows = await self.execute_sql(
+            'SELECT "metadata" FROM steps WHERE "id" = :id AND "threadId" = :thread_id',
+            {"id": step_id, "thread_id": thread_id},
+        )
+        if not isinstance(rows, list) or not rows:
+            return None
+        key = offloaded_fields(rows[0]["metadata"]).get(field)
+        data = await self.blob_store.get(key) if key else None
+        return data.decode() if data is not None else None
+
+    def stats(self) -> dict:
+        return {"offloaded_fields": self.offloaded}
+
+    async def delete_thread(self, thread_id: str):
+        rows = await self.execute_sql(
+            'SELECT "metadata" FROM steps WHERE "threadId" = :thread_id AND "metadata"->\'blobs\' IS NOT NULL',
+            {"thread_id": thread_id},
+        )
+        await super().delete_thread(thread_id)
+        if self.blob_store is not None and isinstance(rows, list):
+            keys = {key for row in rows for key in offloaded_fields(row["metadata"]).values()}
+            await self.delete_blobs(keys)
+
+    async def delete_blobs(self, keys: Set[str]):
+        # Identical payloads share a blob, so keys still referenced by another step are kept
+        if not keys:
+            return
+        rows = await self.execute_sql(
+            'SELECT DISTINCT b."value" AS "key" FROM steps s '
+            'CROSS JOIN LATERAL jsonb_each_text(s."metadata"->\'blobs\') b '
+            'WHERE s."metadata"->\'blobs\' IS NOT NULL AND b."value" = ANY(:keys)',
+            {"keys": sorted(keys)},
+        )
+        if not isinstance(rows, list):
+            logger.warning(f"Could not check blob references, keeping {len(keys)} blobs")
+            return
+        for key in keys - {row["key"] for row in rows}:
+            await self.blob_store.delete(key)
+
+    async def thread_id_of(self, table: str, row_id: str) -> Optional[str]:
+        rows = await self.execute_sql(f'SELECT "threadId" FROM {table} WHERE "id" = :id', {"id": row_id})
+        return rows[0]["threadId"] if isinstance(rows, list) and rows else None
+
+    async def list_threads(self, pagination: Pagination, filters: ThreadFilter) -> PaginatedResponse:
+        # Most recently active first, keyset-paginated on ("updatedAt", id): every page is one index range scan.
+        # "updatedAt" is set by a trigger on step insert (init_db migration 5).
+        if not filters.userId:
+            raise ValueError("userId is required")
+        conditions = ['t."userId" = :user_id']
+        parameters = {"user_id": filters.userId, "limit": pagination.first + 1}
+        if pagination.cursor:
+            conditions.append(
+                '(t."updatedAt", t."id") < (SELECT c."updatedAt", c."id" FROM threads c WHERE c."id" = :cursor)'
+            )
+            parameters["cursor"] = pagination.cursor
+        if filters.search:
+            conditions.append(
+                '(t."searchVector" @@ websearch_to_tsquery(CAST(:config AS regconfig), :search) OR t."id" IN '
+                '(SELECT s."threadId" FROM steps s '
+                'WHERE s."searchVector" @@ websearch_to_tsquery(CAST(:config AS regconfig), :search)))'
+            )
+            parameters.update(config=self.search_config, search=filters.search)
+        if filters.feedback is not None:
+            conditions.append(
+                'EXISTS (SELECT 1 FROM feedbacks f WHERE f."threadId" = t."id" AND f."value" = :feedback)'
+            )
+            parameters["feedback"] = int(filters.feedback)
+
+        query = f"""
+            SELECT t."id", t."createdAt", t."name", t."userId", t."userIdentifier", t."tags", t."metadata"
+            FROM threads t
+            WHERE {" AND ".join(conditions)}
+            ORDER BY t."updatedAt" DESC, t."id" DESC
+            LIMIT :limit
+        """
+        rows = await self.execute_sql(query=query, parameters=parameters)
+        rows = rows if isinstance(rows, list) else []
+        page = rows[:pagination.first]
+        threads = [
+            ThreadDict(
+                id=row["id"],
+                createdAt=row["createdAt"],
+                name=row["name"],
+                userId=row["userId"],
+                userIdentifier=row["userIdentifier"],
+                tags=row["tags"],
+                metadata=row["metadata"],
+                steps=[],
+                elements=[],
+            )
+            for row in page
+        ]
+        return PaginatedResponse(
+            pageInfo=PageInfo(
+                hasNextPage=len(rows) > pagination.first,
+                startCursor=threads[0]["id"] if threads else None,
+                endCursor=threads[-1]["id"] if threads else None,
+            ),
+            data=threads,
+        )
+
+    async def list_thread_steps(
+        self, thread_id: str, cursor: Optional[str] = None, limit: int = 100
+    ) -> Tuple[List[dict], Optional[str]]:
+        # Oldest first; pass the returned cursor back to get the next page
+        conditions = ['s."threadId" = :thread_id']
+        parameters = {"thread_id": thread_id, "limit": limit + 1}
+        if cursor:
+            conditions.append(
+                '(s."createdAt", s."id") > (SELECT c."createdAt", c."id" FROM steps c WHERE c."id" = :cursor)'
+            )
+            parameters["cursor"] = cursor
+        query = f"""
+            SELECT s.* FROM steps s
+            WHERE {" AND ".join(conditions)}
+            ORDER BY s."createdAt", s."id"
+            LIMIT :limit
+        """
+        rows = await self.execute_sql(query=query, parameters=parameters)
+        rows = rows if isinstance(rows, list) else []
+        page = rows[:limit]
+        return page, page[-1]["id"] if len(rows) > limit else None
+
+    async def search_threads(
+        self, user_id: str, query: str, limit: int = 10, cursor: Optional[str] = None
+    ) -> Tuple[List[dict], Optional[str]]:
+        # Best match per thread, ranked; both sides are GIN lookups on "searchVector" (init_db migration 4).
+        # Snippets are only built for the returned page. Pass the returned cursor back for the next page:
+        # it continues after the last ("rank", "threadId") instead of counting rows with OFFSET.
+        parameters = {"config": self.search_config, "query": query, "user_id": user_id, "limit": limit + 1}
+        after = ""
+        if cursor:
+            rank, _, thread_id = cursor.partition("/")
+            after = 'WHERE "rank" < :rank OR ("rank" = :rank AND "threadId" > :thread_id)'
+            parameters.update(rank=float(rank), thread_id=thread_id)
+        sql = f"""
+            WITH q AS (SELECT websearch_to_tsquery(CAST(:config AS regconfig), :query) AS query),
+            hits AS (
+                SELECT t."id" AS "threadId", NULL::uuid AS "stepId",
+                       ts_rank_cd(t."searchVector", q.query) * 2 AS "rank"
+                FROM threads t, q
+                WHERE t."userId" = :user_id AND t."searchVector" @@ q.query
+                UNION ALL
+                SELECT s."threadId", s."id", ts_rank_cd(s."searchVector", q.query)
+                FROM steps s JOIN threads t ON t."id" = s."threadId", q
+                WHERE t."userId" = :user_id AND s."searchVector" @@ q.query
+            ),
+            best AS (
+                SELECT DISTINCT ON ("threadId") "threadId", "stepId", "rank",
+                       count(*) OVER (PARTITION BY "threadId") AS "hits"
+                FROM hits
+                ORDER BY "threadId", "rank" DESC
+            ),
+            page AS (
+                SELECT * FROM best {after} ORDER BY "rank" DESC, "threadId" LIMIT :limit
+            )
+            SELECT p."threadId", p."stepId", p."rank", p."hits", t."name", t."createdAt",
+                   ts_headline(CAST(:config AS regconfig), coalesce(s."output", t."name", ''), q.query,
+                               'StartSel=**, StopSel=**, MaxFragments=1, MaxWords=30, MinWords=10') AS "snippet"
+            FROM page p
+            JOIN threads t ON t."id" = p."threadId"
+            LEFT JOIN steps s ON s."id" = p."stepId" AND s."threadId" = p."threadId"
+            CROSS JOIN q
+            ORDER BY p."rank" DESC, p."threadId"
+        """
+        rows = await self.execute_sql(query=sql, parameters=parameters)
+        rows = rows if isinstance(rows, list) else []
+        page = rows[:limit]
+        # repr() round-trips the float, so the next page starts exactly after this row
+        return page, f"{page[-1]['rank']!r}/{page[-1]['threadId']}" if len(rows) > limit else None
+
+
+class _PendingThread:
+    def __init__(self):
+        self.steps: "OrderedDict[str, dict]" = OrderedDict()
+        self.writes: List[Tuple[str, dict]] = []
+        self.feedbacks: "OrderedDict[str, Feedback]" = OrderedDict()
+        self.since = time.monotonic()
+
+    def __len__(self) -> int:
+        return len(self.steps) + len(self.writes) + len(self.feedbacks)
+
+    def add_step(self, step_dict: dict) -> bool:
+        """Buffer a step create or update; returns True when it was merged into a buffered one."""
+        existing = self.steps.get(step_dict["id"])
+        if existing is None:
+            self.steps[step_dict["id"]] = dict(step_dict)
+            return False
+        # The parent upsert skips None values, so they must not erase earlier ones either
+        existing.update({k: v for k, v in step_dict.items() if v is not None})
+        return True
+
+    def merge(self, newer: "_PendingThread"):
+        for step_dict in newer.steps.values():
+            self.add_step(step_dict)
+        self.writes.extend(newer.writes)
+        self.feedbacks.update(newer.feedbacks)
+
+
+class BatchingDataLayer(PostgresDataLayer):
+    def __init__(self, *args, flush_interval: float = 0.5, batch_size: int = 50, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self._pending: Dict[str, _PendingThread] = {}
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self._flusher: Optional[asyncio.Task] = None
+        self.flush_latency = metrics.LatencyStats()
+        self.batch_sizes = metrics.LatencyStats()
+        self.merged = 0
+        self.fallbacks = 0
+        self.offload_failures = 0
+
+    async def execute_sql(self, query: str, parameters: dict):
+        deferred = _deferred_writes.get()
+        if deferred is not None and _is_write(query):
+            deferred.append((query, parameters))
+            return 1
+        return await super().execute_sql(query, parameters)
+
+    def _thread(self, thread_id: str) -> _PendingThread:
+        pending = self._pending.get(thread_id)
+        if pending is None:
+            pending = self._pending[thread_id] = _PendingThread()
+        if self._flusher is None or self._flusher.done():
+            self._flusher = asyncio.create_task(self._flush_periodically())
+        return pending
+
+    async def _buffered(self, thread_id: str):
+        if len(self._pending.get(thread_id) or ()) >= self.batch_size:
+            await self.flush(thread_id)
+
+    ###### Buffered writes ######
+    @queue_until_user_message()
+    async def create_step(self, step_dict):
+        if self._thread(step_dict["threadId"]).add_step(step_dict):
+            self.merged += 1
+        await self._buffered(step_dict["threadId"])
+
+    @queue_until_user_message()
+    async def update_step(self, step_dict):
+        await BatchingDataLayer.create_step.__wrapped__(self, step_dict)
+
+    @queue_until_user_message()
+    async def delete_step(self, step_id: str):
+        for thread_id, pending in list(self._pending.items()):
+            if step_id in pending.steps:
+                await self.flush(thread_id)
+        await SQLAlchemyDataLayer.delete_step.__wrapped__(self, step_id)
+
+    @queue_until_user_message()
+    async def create_element(self, element):
+        if not element.thread_id:
+            return await SQLAlchemyDataLayer.create_element.__wrapped__(self, element)
+        # The storage key is derived from the thread owner, so the thread row must exist first
+        await self.flush(element.thread_id)
+        writes = []
+        token = _deferred_writes.set(writes)
+        try:
+            await SQLAlchemyDataLayer.create_element.__wrapped__(self, element)
+        finally:
+            _deferred_writes.reset(token)
+        if writes:
+            self._thread(element.thread_id).writes.extend(writes)
+            await self._buffered(element.thread_id)
+
+    @queue_until_user_message()
+    async def delete_element(self, element_id: str, thread_id: Optional[str] = None):
+        if thread_id:
+            await self.flush(thread_id)
+        else:
+            await self.flush_all()
+        await SQLAlchemyDataLayer.delete_element.__wrapped__(self, element_id, thread_id)
+
+    async def upsert_feedback(self, feedback: Feedback) -> str:
+        if not feedback.threadId:
+            return await super().upsert_feedback(feedback)
+        feedback.id = feedback.id or str(uuid.uuid4())
+        self._thread(feedback.threadId).feedbacks[feedback.id] = feedback
+        await self._buffered(feedback.threadId)
+        return feedback.id
+
+    async def delete_feedback(self, feedback_id: str) -> bool:
+        for thread_id, pending in list(self._pending.items()):
+            if feedback_id in pending.feedbacks:
+                await self.flush(thread_id)
+        return await super().delete_feedback(feedback_id)
+
+    async def delete_thread(self, thread_id: str):
+        async with self._lock(thread_id):
+            self._pending.pop(thread_id, None)
+        await super().delete_thread(thread_id)
+
+    ###### Reads see buffered writes ######
+    async def get_thread_author(self, thread_id: str) -> str:
+        await self.flush(thread_id)
+        return await super().get_thread_author(thread_id)
+
+    async def get_thread(self, thread_id: str):
+        await self.flush(thread_id)
+        return await super().get_thread(thread_id)
+
+    async def get_element(self, thread_id: str, element_id: str):
+        await self.flush(thread_id)
+        return await super().get_element(thread_id, element_id)
+
+    async def get_all_user_threads(self, user_id: Optional[str] = None, thread_id: Optional[str] = None):
+        if user_id:
+            await self.flush_all()
+        elif thread_id:
+            await self.flush(thread_id)
+        return await super().get_all_user_threads(user_id=user_id, thread_id=thread_id)
+
+    async def list_threads(self, pagination: Pagination, filters: ThreadFilter) -> PaginatedResponse:
+        await self.flush_all()
+        return await super().list_threads(pagination, filters)
+
+    async def list_thread_steps(self, thread_id: str, cursor: Optional[str] = None, limit: int = 100):
+        await self.flush(thread_id)
+        return await super().list_thread_steps(thread_id, cursor=cursor, limit=limit)
+
+    async def search_threads(self, user_id: str, query: str, limit: int = 10, cursor: Optional[str] = None):
+        await self.flush_all()
+        return await super().search_threads(user_id, query, limit=limit, cursor=cursor)
+
+    async def load_step_payload(self, thread_id: str, step_id: str, field: str) -> Optional[str]:
+        await self.flush(thread_id)
+        return await super().load_step_payload(thread_id, step_id, field)
+
+    async def thread_id_of(self, table: str, row_id: str) -> Optional[str]:
+        for thread_id, pending in self._pending.items():
+            if row_id in pending.steps or row_id in pending.feedbacks:
+                return thread_id
+            if any(parameters.get("id") == row_id for _, parameters in pending.writes):
+                return thread_id
+        return await super().thread_id_of(table, row_id)
+
+    ###### Flushing ######
+    def _lock(self, thread_id: str) -> asyncio.Lock:
+        lock = self._locks.get(thread_id)
+        if lock is None:
+            lock = self._locks[thread_id] = asyncio.Lock()
+        return lock
+
+    async def _offload_or_inline(self, step_dict: dict) -> dict:
+        try:
+            return await self.offload_step(step_dict)
+        except Exception as e:
+            # Kept whole in the row rather than lost with the rest of the batch
+            logger.warning(f"Could not offload step {step_dict['id']}, storing it inline: {e}")
+            self.offload_failures += 1
+            return step_dict
+
+    async def _collect(self, thread_id: str, pending: _PendingThread) -> List[Tuple[str, dict]]:
+        # The thread is created once per flush, not read and upserted for every step as create_step does
+        writes = []
+        if pending.steps:
+            writes.append((THREAD_INSERT, {"id": thread_id, "createdAt": await self.get_current_timestamp()}))
+        for step_dict in pending.steps.values():
+            # Offloaded here so only the final, merged content of a streamed step is stored
+            writes.append(step_upsert(await self._offload_or_inline(step_dict)))
+        writes.extend(pending.writes)
+        token = _deferred_writes.set(writes)
+        try:
+            for feedback in pending.feedbacks.values():
+                await SQLAlchemyDataLayer.upsert_feedback(self, feedback)
+        finally:
+            _deferred_writes.reset(token)
+        return writes
+
+    async def _execute_batch(self, writes: List[Tuple[str, dict]]):
+        await self._ensure_column_types()
+        # Identical statements run as one executemany; the last write per row id wins
+        grouped: "OrderedDict[str, OrderedDict]" = OrderedDict()
+        for query, parameters in writes:
+            rows = grouped.setdefault(query, OrderedDict())
+            key = parameters.get("id", len(rows))
+            rows.pop(key, None)
+            rows[key] = parameters
+        async with self.async_session() as session:
+            async with session.begin():
+                for query, rows in grouped.items():
+                    prepared = [self.prepare(query, row) for row in rows.values()]
+                    await session.execute(text(prepared[0][0]), [parameters for _, parameters in prepared])
+
+    async def flush(self, thread_id: str):
+        # A flush already in progress must finish before callers read the thread back
+        if thread_id not in self._pending and thread_id not in self._locks:
+            return
+        lock = self._lock(thread_id)
+        async with lock:
+            pending = self._pending.pop(thread_id, None)
+            if pending:
+                await self._flush_pending(thread_id, pending)
+        if not lock.locked() and thread_id not in self._pending:
+            self._locks.pop(thread_id, None)
+
+    def _requeue(self, thread_id: str, pending: _PendingThread):
+        # Ahead of anything buffered for the thread since the batch was taken
+        newer = self._pending.get(thread_id)
+        if newer is not None:
+            pending.merge(newer)
+        self._pending[thread_id] = pending
+
+    async def _flush_pending(self, thread_id: str, pending: _PendingThread):
+        started = time.perf_counter()
+        try:
+            writes = await self._collect(thread_id, pending)
+        except Exception:
+            # Nothing has been written yet, so the next flush can retry the whole batch
+            self._requeue(thread_id, pending)
+            raise
+        try:
+            await self._execute_batch(writes)
+        except Exception as e:
+            # One bad row must not lose the rest of the batch
+            logger.warning(f"Batched write for thread {thread_id} failed, retrying row by row: {e}")
+            self.fallbacks += 1
+            for query, parameters in writes:
+                await super().execute_sql(query, parameters)
+        self.flush_latency.observe(time.perf_counter() - started)
+        self.batch_sizes.observe(len(pending))
+
+    async def flush_all(self):
+        for thread_id in set(self._pending) | set(self._locks):
+            await self.flush(thread_id)
+
+    async def _flush_periodically(self):
+        while self._pending:
+            await asyncio.sleep(self.flush_interval)
+            due = time.monotonic() - self.flush_interval
+            for thread_id, pending in list(self._pending.items()):
+                if pending.since <= due:
+                    try:
+                        await self.flush(thread_id)
+                    except Exception as e:
+                        logger.warning(f"Background flush for thread {thread_id} failed: {e}")
+
+    async def close(self) -> None:
+        await self.flush_all()
+        if self._flusher is not None:
+            self._flusher.cancel()
+        await super().close()
+
+    def stats(self) -> dict:
+        return {
+            **super().stats(),
+            "pending_threads": len(self._pending),
+            "pending_writes": sum(len(p) for p in self._pending.values()),
+            "merged_updates": self.merged,
+            "fallbacks": self.fallbacks,
+            "offload_failures": self.offload_failures,
+            "flush_latency": self.flush_latency.snapshot(),
+            "batch_size": self.batch_sizes.snapshot(),
+        }
+
+
+NOTIFY_DELAY = 0.05
+# Postgres caps NOTIFY payloads at 8000 bytes
+NOTIFY_PAYLOAD_LIMIT = 7000
+
+
+class ReadCacheMixin:
+    # Read-through cache for get_user, get_thread_author and get_thread.
+    # Writes made through this layer invalidate locally and, with a channel, in every worker via NOTIFY.
+    _KINDS = ("users", "authors", "threads")
+
+    def __init__(self, *args, cache_ttl: float = 60, cache_max_entries: int = 1000, channel: str = "", **kwargs):
+        super().__init__(*args, **kwargs)
+        self._caches = {kind: MemoryCache(max_entries=cache_max_entries, ttl=cache_ttl) for kind in self._KINDS}
+        # Bumped by full clears; per-key invalidations only mark the loads of that key in progress
+        self._generations = {kind: 0 for kind in self._KINDS}
+        self._loading: Dict[str, Dict[str, list]] = {kind: {} for kind in self._KINDS}
+        self._cache_stats = {kind: {"hits": 0, "misses": 0, "invalidations": 0} for kind in self._KINDS}
+        self._channel = channel
+        self._origin = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self._listener: Optional[asyncio.Task] = None
+        self._outbox: set = set()
+        self._publisher: Optional[asyncio.Task] = None
+        # Without a live listener another worker's writes would go unnoticed, so the cache is bypassed
+        self._listening = not channel
+
+    def _cache_usable(self) -> bool:
+        if self._channel and self._listener is None:
+            self._listener = asyncio.create_task(self._listen())
+        return self._listening
+
+    async def _cached(self, kind: str, key: str, load):
+        if not self._cache_usable():
+            return await load()
+        cache = self._caches[kind]
+        value = await cache.get(key)
+        if value is not None:
+            self._cache_stats[kind]["hits"] += 1
+            return copy.deepcopy(value)
+        self._cache_stats[kind]["misses"] += 1
+        generation = self._generations[kind]
+        # [loads in progress, invalidations seen]
+        loading = self._loading[kind].setdefault(key, [0, 0])
+        loading[0] += 1
+        invalidations = loading[1]
+        try:
+            value = await load()
+        finally:
+            loading[0] -= 1
+            if not loading[0] and self._loading[kind].get(key) is loading:
+                del self._loading[kind][key]
+        # An invalidation that raced the load means the value may already be stale
+        if value is not None and generation == self._generations[kind] and invalidations == loading[1]:
+            await cache.set(key, copy.deepcopy(value))
+        return value
+
+    async def _evict(self, kind: str, key: Optional[str] = None):
+        self._cache_stats[kind]["invalidations"] += 1
+        if key is None:
+            self._generations[kind] += 1
+            self._caches[kind].clear()
+        else:
+            loading = self._loading[kind].get(key)
+            if loading is not None:
+                loading[1] += 1
+            await self._caches[kind].delete(key)
+
+    async def _invalidate(self, kind: str, key: Optional[str] = None):
+        await self._evict(kind, key)
+        if self._channel:
+            self._outbox.add(f"{kind}|{key or '*'}")
+            if self._publisher is None or self._publisher.done():
+                self._publisher = asyncio.create_task(self._publish())
+
+    async def _publish(self):
+        # Invalidations from one batch of writes go out together instead of one NOTIFY per step
+        await asyncio.sleep(NOTIFY_DELAY)
+        while self._outbox:
+            items, self._outbox = sorted(self._outbox), set()
+            chunk = [self._origin]
+            for item in items + [None]:
+                if item is None or sum(map(len, chunk)) + len(item) > NOTIFY_PAYLOAD_LIMIT:
+                    if len(chunk) > 1:
+                        await self.execute_sql(
+                            "SELECT pg_notify(:channel, :payload)",
+                            {"channel": self._channel, "payload": "\n".join(chunk)},
+                        )
+                    chunk = [self._origin]
+                if item is not None:
+                    chunk.append(item)
+
+    def _on_notify(self, connection, pid, channel, payload: str):
+        origin, *items = payload.split("\n")
+        if origin == self._origin:
+            return
+        for item in items:
+            kind, _, key = item.partition("|")
+            if kind in self._caches:
+                asyncio.create_task(self._evict(kind, None if key == "*" else key))
+
+    async def _listen(self):
+        import asyncpg
+
+        dsn = self._conninfo.replace("+asyncpg", "")
+        while True:
+            connection = None
+            try:
+                connection = await asyncpg.connect(dsn)
+                closed = asyncio.Event()
+                connection.add_termination_listener(lambda _: closed.set())
+                await connection.add_listener(self._channel, self._on_notify)
+                # Anything published while we were not listening is unknown
+                for kind in self._KINDS:
+                    await self._evict(kind)
+                self._listening = True
+                await closed.wait()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Cache invalidation listener failed: {e}")
+            finally:
+                self._listening = False
+                if connection is not None and not connection.is_closed():
+                    await connection.close()
+            await asyncio.sleep(5)
+
+    ###### Cached reads ######
+    async def get_user(self, identifier: str):
+        return await self._cached("users", identifier, lambda: super(ReadCacheMixin, self).get_user(identifier))
+
+    async def get_thread_author(self, thread_id: str) -> str:
+        return await self._cached("authors", thread_id, lambda: super(ReadCacheMixin, self).get_thread_author(thread_id))
+
+    async def get_thread(self, thread_id: str):
+        return await self._cached("threads", thread_id, lambda: super(ReadCacheMixin, self).get_thread(thread_id))
+
+    ###### Invalidating writes ######
+    async def create_user(self, user):
+        created = await super().create_user(user)
+        await self._invalidate("users", user.identifier)
+        return created
+
+    async def update_thread(self, thread_id: str, name=None, user_id=None, metadata=None, tags=None):
+        await super().update_thread(thread_id, name=name, user_id=user_id, metadata=metadata, tags=tags)
+        if user_id:
+            await self._invalidate("authors", thread_id)
+        await self._invalidate("threads", thread_id)
+
+    async def delete_thread(self, thread_id: str):
+        await super().delete_thread(thread_id)
+        await self._invalidate("authors", thread_id)
+        await self._invalidate("threads", thread_id)
+
+    async def _invalidate_thread(self, thread_id: Optional[str], table: str, row_id: Optional[str]):
+        # Only the affected thread; the whole kind is cleared only when the thread cannot be found
+        thread_id = thread_id or (await self.thread_id_of(table, row_id) if row_id else None)
+        await self._invalidate("threads", thread_id)
+
+    @queue_until_user_message()
+    async def create_step(self, step_dict):
+        await super().create_step.__wrapped__(self, step_dict)
+        await self._invalidate_thread(step_dict.get("threadId"), "steps", step_dict.get("id"))
+
+    @queue_until_user_message()
+    async def update_step(self, step_dict):
+        await super().update_step.__wrapped__(self, step_dict)
+        await self._invalidate_thread(step_dict.get("threadId"), "steps", step_dict.get("id"))
+
+    @queue_until_user_message()
+    async def delete_step(self, step_id: str):
+        thread_id = await self.thread_id_of("steps", step_id)
+        await super().delete_step.__wrapped__(self, step_id)
+        if thread_id:
+            await self._invalidate("threads", thread_id)
+
+    @queue_until_user_message()
+    async def create_element(self, element):
+        await super().create_element.__wrapped__(self, element)
+        await self._invalidate_thread(element.thread_id, "elements", element.id)
+
+    @queue_until_user_message()
+    async def delete_element(self, element_id: str, thread_id: Optional[str] = None):
+        thread_id = thread_id or await self.thread_id_of("elements", element_id)
+        await super().delete_element.__wrapped__(self, element_id, thread_id)
+        if thread_id:
+            await self._invalidate("threads", thread_id)
+
+    async def upsert_feedback(self, feedback: Feedback) -> str:
+        feedback_id = await super().upsert_feedback(feedback)
+        await self._invalidate_thread(feedback.threadId, "feedbacks", feedback_id)
+        return feedback_id
+
+    async def delete_feedback(self, feedback_id: str) -> bool:
+        thread_id = await self.thread_id_of("feedbacks", feedback_id)
+        deleted = await super().delete_feedback(feedback_id)
+        if thread_id:
+            await self._invalidate("threads", thread_id)
+        return deleted
+
+    async def close(self) -> None:
+        if self._listener is not None:
+            self._listener.cancel()
+        if self._publisher is not None and not self._publisher.done():
+            await self._publisher
+        await super().close()
+
+    def stats(self) -> dict:
+        result = super().stats()
+        result["read_cache"] = {
+            kind: {**self._cache_stats[kind], "entries": len(self._caches[kind])} for kind in self._KINDS
+        }
+        return result
+
+
+class CachedDataLayer(ReadCacheMixin, PostgresDataLayer):
+    pass
+
+
+class CachedBatchingDataLayer(ReadCacheMixin, BatchingDataLayer):
+    pass
+
+
+async def load_step_payload(thread_id: str, step_id: str, field: str) -> Optional[str]:
+    layer = current_data_layer()
+    if isinstance(layer, PostgresDataLayer):
+        return await layer.load_step_payload(thread_id, step_id, field)
+    return None
+
+
+async def search_threads(user_id: str, query: str, limit: int = 10, cursor: Optional[str] = None):
+    layer = current_data_layer()
+    if isinstance(layer, PostgresDataLayer):
+        return await layer.search_threads(user_id, query, limit=limit, cursor=cursor)
+    return [], None
+
+
+async def flush_thread(thread_id: Optional[str]):
+    layer = current_data_layer()
+    if thread_id and isinstance(layer, BatchingDataLayer):
+        await layer.flush(thread_id)
 
 
 @cl.data_layer
 def get_data_layer():
-    return SQLAlchemyDataLayer(conninfo=DATABASE_URL)
+    kwargs = {
+        "conninfo": DATABASE_URL,
+        "partitioned": DATABASE_PARTITIONED,
+        "blob_store": get_blob_store(),
+        "offload_threshold": BLOB_OFFLOAD_THRESHOLD,
+        "preview_chars": BLOB_PREVIEW_CHARS,
+        "search_config": SEARCH_TEXT_CONFIG,
+    }
+    if DATA_LAYER_BATCHING:
+        kwargs.update(flush_interval=DATA_LAYER_FLUSH_INTERVAL, batch_size=DATA_LAYER_BATCH_SIZE)
+    if DATA_LAYER_READ_CACHE:
+        kwargs.update(
+            cache_ttl=DATA_LAYER_CACHE_TTL,
+            cache_max_entries=DATA_LAYER_CACHE_MAX_ENTRIES,
+            channel=DATA_LAYER_CACHE_CHANNEL,
+        )
+        layer_class = CachedBatchingDataLayer if DATA_LAYER_BATCHING else CachedDataLayer
+    else:
+        layer_class = BatchingDataLayer if DATA_LAYER_BATCHING else PostgresDataLayer
+    layer = layer_class(**kwargs)
+    metrics.register("data_layer", layer.stats)
+    return layer
@@ -0,0 +1,102 @@
+import logging
+import time
+from typing import Optional
+
+import httpx
+
+from chainlit_app import metrics
+from chainlit_app.config import (
+    LANGFLOW_HTTP2,
+    LANGFLOW_KEEPALIVE_EXPIRY,
+    LANGFLOW_MAX_CONNECTIONS,
+    LANGFLOW_MAX_KEEPALIVE_CONNECTIONS,
+    LANGFLOW_POOL_TIMEOUT,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class _MeteredTransport(httpx.AsyncHTTPTransport):
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.connection_wait = metrics.LatencyStats()
+        self.requests_pending = 0
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        started = time.perf_counter()
+        acquired = False
+
+        async def trace(event_name: str, info: dict):
+            nonlocal acquired
+            if not acquired and event_name.endswith("send_request_headers.started"):
+                acquired = True
+                self.connection_wait.observe(time.perf_counter() - started)
+
+        request.extensions = {**request.extensions, "trace": trace}
+        self.requests_pending += 1
+        try:
+            return await super().handle_async_request(request)
+        finally:
+            self.requests_pending -= 1
+
+    def pool_stats(self) -> dict:
+        connections = self._pool.connections
+        return {
+            "connections": len(connections),
+            "connections_in_use": sum(1 for c in connections if not c.is_idle()),
+            "requests_pending": self.requests_pending,
+            "connection_wait": self.connection_wait.snapshot(),
+        }
+
+
+class LangflowClient:
+    def __init__(self):
+        self._client: Optional[httpx.AsyncClient] = None
+        self._transport: Optional[_MeteredTransport] = None
+
+    def _build(self) -> httpx.AsyncClient:
+        limits = httpx.Limits(
+            max_connections=LANGFLOW_MAX_CONNECTIONS,
+            max_keepalive_connections=LANGFLOW_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=LANGFLOW_KEEPALIVE_EXPIRY,
+        )
+        http2 = LANGFLOW_HTTP2
+        if http2:
+            try:
+                import h2  # noqa: F401
+            except ImportError:
+                logger.warning("LANGFLOW_HTTP2 is set but the 'h2' package is missing, falling back to HTTP/1.1")
+                http2 = False
+
+        self._transport = _MeteredTransport(limits=limits, http2=http2)
+        timeout = httpx.Timeout(120.0, pool=LANGFLOW_POOL_TIMEOUT)
+        logger.info(f"Langflow HTTP client ready (http2={http2}, max_connections={LANGFLOW_MAX_CONNECTIONS})")
+        return httpx.AsyncClient(transport=self._transport, timeout=timeout)
+
+    async def start(self):
+        if self._client is None or self._client.is_closed:
+            self._client = self._build()
+
+    async def aclose(self):
+        if self._client is not None and not self._client.is_closed:
+            await self._client.aclose()
+        self._client = None
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None or self._client.is_closed:
+            self._client = self._build()
+        return self._client
+
+    def stats(self) -> dict:
+        if self._transport is None:
+            return {}
+        return self._transport.pool_stats()
+
+
+langflow_client = LangflowClient()
+metrics.register("langflow_http_pool", langflow_client.stats)
+
+
+def get_client() -> httpx.AsyncClient:
+    return langflow_client.client
@@ -1,50 +1,215 @@
+import hashlib
 import httpx
-import json
+import logging
+import mimetypes
+import os
 import uuid
 import asyncio
-from typing import AsyncGenerator, Callable, Optional
-from chainlit_app.config import BASE_API_URL, FLOW_ID, CHAT_INPUT_ID, FILE_INPUT_ID
+from typing import AsyncGenerator, Awaitable, Callable, Iterable, List, Optional
+from chainlit_app import metrics
+from chainlit_app.cache import SQLiteCache
+from chainlit_app.config import (
+    FLOW_ID, CHAT_INPUT_ID, FILE_INPUT_ID, LANGFLOW_MAX_RETRIES,
+    UPLOAD_CACHE_ENABLED, UPLOAD_CACHE_PATH, UPLOAD_CACHE_TTL, UPLOAD_CACHE_MAX_ENTRIES,
+    SINGLEFLIGHT_ENABLED, SINGLEFLIGHT_SESSION_FLOWS, SESSIONLESS_FLOW_IDS,
+)
+from chainlit_app.http_client import get_client
+from chainlit_app.ndjson import iter_events
+from chainlit_app.resilience import CircuitOpenError, RateLimitError, resilience
+from chainlit_app.response_cache import get_response_cache, response_cache_key
+from chainlit_app.router import router
+from chainlit_app.scheduler import scheduler
+from chainlit_app.singleflight import single_flight
 
+logger = logging.getLogger(__name__)
 
-class RateLimitError(Exception):
-    def __init__(self, retry_after: int = 60):
-        self.retry_after = retry_after
-        super().__init__(f"Rate limited. Retry after {retry_after} seconds.")
+UPLOAD_CHUNK_SIZE = 256 * 1024
 
+_upload_cache: Optional[SQLiteCache] = None
+_upload_stats = {"hits": 0, "misses": 0, "stale": 0}
+metrics.register("upload_cache", lambda: dict(_upload_stats))
 
-async def upload_file_to_langflow(file_content: bytes, filename: str) -> str:
-    api_url = f"{BASE_API_URL}/api/v2/files"
-    async with httpx.AsyncClient(timeout=60.0) as client:
-        files = {"file": (filename, file_content)}
-        response = await client.post(api_url, files=files)
-        response.raise_for_status()
-        return response.json()["path"]
+
+def _multipart_file_body(local_path: str, filename: str, on_progress: Optional[Callable[[int, int], Awaitable[None]]]):
+    boundary = uuid.uuid4().hex
+    content_type = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+    quoted_name = filename.replace("\\", "\\\\").replace('"', "%22").replace("\r", "%0D").replace("\n", "%0A")
+    head = (
+        f"--{boundary}\r\n"
+        f'Content-Disposition: form-data; name="file"; filename="{quoted_name}"\r\n'
+        f"Content-Type: {content_type}\r\n\r\n"
+    ).encode()
+    tail = f"\r\n--{boundary}--\r\n".encode()
+    total = os.path.getsize(local_path)
+
+    async def body():
+        yield head
+        sent = 0
+        with open(local_path, "rb") as f:
+            while chunk := await asyncio.to_thread(f.read, UPLOAD_CHUNK_SIZE):
+                sent += len(chunk)
+                yield chunk
+                if on_progress:
+                    await on_progress(sent, total)
+        yield tail
+
+    headers = {
+        "Content-Type": f"multipart/form-data; boundary={boundary}",
+        "Content-Length": str(len(head) + total + len(tail)),
+    }
+    return body(), headers
+
+
+def get_upload_cache() -> Optional[SQLiteCache]:
+    global _upload_cache
+    if UPLOAD_CACHE_ENABLED and _upload_cache is None:
+        _upload_cache = SQLiteCache(UPLOAD_CACHE_PATH, max_entries=UPLOAD_CACHE_MAX_ENTRIES, ttl=UPLOAD_CACHE_TTL)
+    return _upload_cache
+
+
+async def file_digest(local_path: str) -> str:
+    def _hash() -> str:
+        digest = hashlib.sha256()
+        with open(local_path, "rb") as f:
+            while chunk := f.read(UPLOAD_CHUNK_SIZE):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    return await asyncio.to_thread(_hash)
+
+
+async def langflow_file_exists(file_id: str, session_id: Optional[str] = None) -> bool:
+    # The file listing is small metadata read in full, so the pooled keep-alive connection is reused;
+    # probing the download endpoint would have to drop the connection to skip the file body
+    async def check():
+        async with router.request(session_id) as base_url:
+            response = await get_client().get(f"{base_url}/api/v2/files")
+            response.raise_for_status()
+            return any(f.get("id") == file_id for f in response.json())
+
+    return await resilience.call("file_exists", check)
+
+
+async def _upload_file(local_path: str, filename: str, on_progress, session_id: Optional[str] = None) -> dict:
+    async def upload():
+        # The body is a generator, so every attempt builds a fresh one
+        body, headers = _multipart_file_body(local_path, filename, on_progress)
+        async with router.request(session_id) as base_url:
+            response = await get_client().post(f"{base_url}/api/v2/files", content=body, headers=headers)
+            response.raise_for_status()
+            return response.json()
+
+    return await resilience.call("upload_file", upload)
+
+
+async def upload_file_to_langflow(
+    local_path: str,
+    filename: str,
+    on_progress: Optional[Callable[[int, int], Awaitable[None]]] = None,
+    session_id: Optional[str] = None
+) -> str:
+    # Files live on the replica that received them, so they follow the session's routing
+    cache = get_upload_cache()
+    if cache is None:
+        return (await _upload_file(local_path, filename, on_progress, session_id))["path"]
+
+    digest = f"{router.pick(session_id).url}|{await file_digest(local_path)}"
+    cached = await cache.get(digest)
+    if cached:
+        try:
+            if await langflow_file_exists(cached["id"], session_id):
+                _upload_stats["hits"] += 1
+                return cached["path"]
+        except (httpx.HTTPError, CircuitOpenError, RateLimitError) as e:
+            logger.warning(f"Could not verify cached Langflow file {cached['id']}: {e}")
+        await cache.delete(digest)
+        _upload_stats["stale"] += 1
+
+    _upload_stats["misses"] += 1
+    uploaded = await _upload_file(local_path, filename, on_progress, session_id)
+    if uploaded.get("id"):
+        await cache.set(digest, {"id": uploaded["id"], "path": uploaded["path"]})
+    return uploaded["path"]
+
+
+def single_flight_allowed(flow_id: str) -> bool:
+    # Followers share the leader's session, so flows with session memory need an explicit opt-in
+    if not SINGLEFLIGHT_ENABLED:
+        return False
+    return SINGLEFLIGHT_SESSION_FLOWS or flow_id in SESSIONLESS_FLOW_IDS
+
+
+async def _stream_events(
+    path: str,
+    session_id: str,
+    payload: dict,
+    events: Optional[Iterable[str]],
+    max_retries: int
+) -> AsyncGenerator[dict, None]:
+    headers = {
+        "Content-Type": "application/json",
+        "Accept": "text/event-stream"
+    }
+    client = get_client()
+
+    async def open_stream():
+        backend = router.acquire(session_id)
+        try:
+            request = client.build_request("POST", f"{backend.url}{path}", json=payload, headers=headers)
+            response = await client.send(request, stream=True)
+            if response.is_error:
+                await response.aread()
+                await response.aclose()
+                response.raise_for_status()
+        except BaseException as e:
+            router.release(backend, e)
+            raise
+        return backend, response
+
+    # Retries only cover opening the stream; once events flow a failure is surfaced as-is
+    backend, response = await resilience.call("run_flow_stream", open_stream, max_retries)
+    error = None
+    try:
+        async for event in iter_events(response.aiter_bytes(), events=events):
+            yield event
+    except BaseException as e:
+        error = e
+        raise
+    finally:
+        await response.aclose()
+        router.release(backend, error)
 
 
 async def run_flow_stream(
     message: str,
     session_id: str = None,
     sender_name: str = "User",
-    file_path: Optional[str] = None,
+    file_paths: Optional[List[str]] = None,
     on_token: Optional[Callable[[str], None]] = None,
-    max_retries: int = 3,
-    retry_delay: float = 2.0
+    events: Optional[Iterable[str]] = None,
+    command: Optional[str] = None,
+    use_cache: bool = False,
+    on_queued: Optional[Callable[[int], Awaitable[None]]] = None,
+    max_retries: int = LANGFLOW_MAX_RETRIES,
+    flow_id: str = FLOW_ID,
+    chat_input_id: str = CHAT_INPUT_ID,
+    file_input_id: str = FILE_INPUT_ID,
 ) -> AsyncGenerator[dict, None]:
-    api_url = f"{BASE_API_URL}/api/v1/run/{FLOW_ID}?stream=true"
+    path = f"/api/v1/run/{flow_id}?stream=true"
     if not session_id:
         session_id = str(uuid.uuid4())
 
     tweaks = {
-        CHAT_INPUT_ID: {
+        chat_input_id: {
             "sender": "User",
             "sender_name": sender_name,
             "session_id": session_id
         }
     }
 
-    if file_path:
-        tweaks[FILE_INPUT_ID] = {
-            "path": [file_path]
+    if file_paths:
+        tweaks[file_input_id] = {
+            "path": list(file_paths)
         }
 
     payload = {
@@ -55,67 +220,36 @@ async def run_flow_stream(
         "tweaks": tweaks
     }
 
-    headers = {
-        "Content-Type": "application/json",
-        "Accept": "text/event-stream"
-    }
+    key = response_cache_key(flow_id, message, command, tweaks, events)
 
-    for attempt in range(max_retries + 1):
-        try:
-            async with httpx.AsyncClient(timeout=120.0) as client:
-                async with client.stream("POST", api_url, json=payload, headers=headers) as response:
-                    if response.status_code == 429:
-                        retry_after = int(response.headers.get("Retry-After", retry_delay * (2 ** attempt)))
-                        if attempt < max_retries:
-                            await asyncio.sleep(retry_after)
-                            continue
-                        else:
-                            raise RateLimitError(retry_after)
-
-                    response.raise_for_status()
-
-                    buffer = ""
-                    async for chunk in response.aiter_text():
-                        buffer += chunk
-
-                        while "\n" in buffer:
-                            line_end = buffer.index("\n")
-                            line = buffer[:line_end].strip()
-                            buffer = buffer[line_end + 1:]
-
-                            if not line:
-                                continue
-
-                            try:
-                                event_obj = json.loads(line)
-                                event_type = event_obj.get("event")
-                                event_data = event_obj.get("data")
-
-                                if event_type and event_data is not None:
-                                    if event_type == "token" and on_token:
-                                        token = event_data.get("chunk", "")
-                                        if token:
-                                            await on_token(token)
-
-                                    yield {"event": event_type, "data": event_data}
-                            except json.JSONDecodeError:
-                                continue
-
-                    return
-
-        except httpx.HTTPStatusError as e:
-            if e.response.status_code == 429:
-                retry_after = int(e.response.headers.get("Retry-After", retry_delay * (2 ** attempt)))
-                if attempt < max_retries:
-                    await asyncio.sleep(retry_after)
-                    continue
-                else:
-                    raise RateLimitError(retry_after)
-            raise
+    async def admitted():
+        async with scheduler.slot(sender_name, on_queued):
+            async for event in _stream_events(path, session_id, payload, events, max_retries):
+                yield event
+
+    def produce():
+        if single_flight_allowed(flow_id):
+            return single_flight.stream(key, admitted)
+        return admitted()
+
+    stream = get_response_cache().stream(key, produce) if use_cache else produce()
 
+    async for event in stream:
+        if event["event"] == "token" and on_token:
+            token = event["data"].get("chunk", "")
+            if token:
+                await on_token(token)
 
-async def run_flow(message: str, session_id: str = None, sender_name: str = "User") -> dict:
-    api_url = f"{BASE_API_URL}/api/v1/run/{FLOW_ID}"
+        yield event
+
+
+async def run_flow(
+    message: str,
+    session_id: str = None,
+    sender_name: str = "User",
+    flow_id: str = FLOW_ID,
+    chat_input_id: str = CHAT_INPUT_ID,
+) -> dict:
     if not session_id:
         session_id = str(uuid.uuid4())
 
@@ -125,7 +259,7 @@ async def run_flow(message: str, session_id: str = None, sender_name: str = "Use
         "input_value": message,
         "session_id": session_id,
         "tweaks": {
-            CHAT_INPUT_ID: {
+            chat_input_id: {
                 "sender": "User",
                 "sender_name": sender_name,
                 "session_id": session_id
@@ -135,7 +269,11 @@ async def run_flow(message: str, session_id: str = None, sender_name: str = "Use
 
     headers = {"Content-Type": "application/json"}
 
-    async with httpx.AsyncClient(timeout=120.0) as client:
-        response = await client.post(api_url, json=payload, headers=headers)
-        response.raise_for_status()
-        return response.json()
+    async def post():
+        async with router.request(session_id) as base_url:
+            response = await get_client().post(f"{base_url}/api/v1/run/{flow_id}", json=payload, headers=headers)
+            response.raise_for_status()
+            return response.json()
+
+    async with scheduler.slot(sender_name):
+        return await resilience.call("run_flow", post)
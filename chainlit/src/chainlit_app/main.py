@@ -1,23 +1,41 @@
+import asyncio
 import chainlit as cl
 import logging
+import os
+import time
+from typing import Optional
 from chainlit.types import Feedback, ThreadDict
-from chainlit_app import data_layer, auth
-from chainlit_app.langflow import run_flow_stream, RateLimitError, upload_file_to_langflow
-from chainlit_app.tools import create_tool_step, extract_agent_steps, update_tool_step
+from chainlit_app import data_layer, auth, metrics
+from chainlit_app.coalescer import TokenCoalescer
+from chainlit_app.config import (
+    FLOW_ROUTES, MAX_FILE_SIZE_MB, MAX_FILES, METRICS_LOG_INTERVAL, RESPONSE_CACHE_MODE, SEARCH_PAGE_SIZE,
+    SESSIONLESS_FLOW_IDS, UPLOAD_CONCURRENCY, default_route,
+)
+from chainlit_app.http_client import langflow_client
+from chainlit_app.langflow import run_flow_stream, CircuitOpenError, RateLimitError, upload_file_to_langflow
+from chainlit_app.response_cache import normalize_input
+from chainlit_app.router import router
+from chainlit_app.tools import (
+    EXPAND_OUTPUT_ACTION, AgentStepTracker, create_tool_step, load_tool_output, prune_tool_outputs, update_tool_step,
+)
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-MAX_FILE_SIZE_MB = 10
-MAX_FILES = 1
+STREAM_EVENTS = ("token", "add_message", "end")
+EXPAND_STEP_ACTION = "expand_step_payload"
+SEARCH_MORE_ACTION = "search_history_more"
 
 auth.setup_auth()
 _ = data_layer
 
+app_tasks = []
+
 COMMANDS = [
     {"id": "chat", "icon": "message-circle", "description": "Normal chat mode", "button": True},
     {"id": "search", "icon": "globe", "description": "Search the web", "button": True},
     {"id": "code", "icon": "code", "description": "Generate code", "button": True},
+    {"id": "history", "icon": "history", "description": "Search past conversations", "button": False},
 ]
 
 STARTERS = [
@@ -46,6 +64,47 @@ STARTERS = [
 ]
 
 
+STARTER_MESSAGES = {normalize_input(starter.message) for starter in STARTERS}
+
+route_stats = {}
+
+
+def _route_stats(name: str, flow_id: str) -> dict:
+    if name not in route_stats:
+        route_stats[name] = {
+            "flow_id": flow_id, "runs": 0, "errors": 0,
+            "first_token": metrics.LatencyStats(), "total": metrics.LatencyStats(),
+        }
+    return route_stats[name]
+
+
+metrics.register("routes", lambda: {
+    name: {
+        key: value.snapshot() if isinstance(value, metrics.LatencyStats) else value
+        for key, value in stats.items()
+    }
+    for name, stats in route_stats.items()
+})
+
+
+def select_route(command: str, has_files: bool) -> tuple:
+    name = command if command in FLOW_ROUTES else "chat"
+    route = FLOW_ROUTES[name]
+    if has_files and not route["file_input_id"]:
+        # A lightweight flow without a File component; attachments need the shared flow
+        return f"{name}+files", default_route(name)
+    return name, route
+
+
+def use_response_cache(message_text: str, file_paths: list, flow_id: str) -> bool:
+    # A replayed answer never reaches Langflow, so a flow with session memory would miss the turn
+    if file_paths or RESPONSE_CACHE_MODE == "off" or flow_id not in SESSIONLESS_FLOW_IDS:
+        return False
+    if RESPONSE_CACHE_MODE == "all":
+        return True
+    return normalize_input(message_text) in STARTER_MESSAGES
+
+
 def get_user_identifier() -> str:
     user = cl.user_session.get("user")
     if user:
@@ -53,11 +112,186 @@ def get_user_identifier() -> str:
     return "User"
 
 
+class UploadProgress:
+    def __init__(self, filenames: list, step_percent: int = 10):
+        self.step_percent = step_percent
+        self._percent = {name: 0 for name in filenames}
+        self._reported = {name: -1 for name in filenames}
+        self._msg = cl.Message(content=self._render(), author="Assistant")
+
+    def _render(self) -> str:
+        return "\n".join(f"📤 Uploading {name}... {percent}%" for name, percent in self._percent.items())
+
+    async def start(self):
+        await self._msg.send()
+
+    def reporter(self, filename: str):
+        async def report(sent: int, total: int):
+            percent = int(sent * 100 / total) if total else 100
+            if percent - self._reported[filename] < self.step_percent and percent < 100:
+                return
+            self._reported[filename] = self._percent[filename] = percent
+            self._msg.content = self._render()
+            await self._msg.update()
+        return report
+
+    async def done(self):
+        await self._msg.remove()
+
+
+async def upload_files(files: list, session_id: str) -> tuple:
+    semaphore = asyncio.Semaphore(UPLOAD_CONCURRENCY)
+    progress = UploadProgress([f.name for f in files])
+    await progress.start()
+
+    async def upload_one(file_element):
+        async with semaphore:
+            logger.info(f"Uploading file {file_element.name} to Langflow")
+            return await upload_file_to_langflow(
+                file_element.path, file_element.name,
+                on_progress=progress.reporter(file_element.name), session_id=session_id,
+            )
+
+    try:
+        results = await asyncio.gather(*(upload_one(f) for f in files), return_exceptions=True)
+    finally:
+        await progress.done()
+
+    paths, errors = [], []
+    for file_element, result in zip(files, results):
+        if isinstance(result, BaseException):
+            logger.warning(f"Upload of {file_element.name} failed: {result}")
+            errors.append(f"❌ Error uploading {file_element.name}: {str(result)}")
+        else:
+            logger.info(f"File {file_element.name} uploaded successfully, Langflow path: {result}")
+            paths.append(result)
+    return paths, errors
+
+
+async def show_tool_updates(tracker: AgentStepTracker, tool_steps: dict, data: dict):
+    for tool in tracker.update(data):
+        if not tool["name"]:
+            continue
+        step = tool_steps.get(tool["key"])
+        if step is None:
+            step = await create_tool_step(tool["name"], tool["input"])
+            tool_steps[tool["key"]] = step
+        if tool["error"]:
+            await update_tool_step(step, f"❌ {tool['error']}")
+        elif tool["output"] is not None:
+            await update_tool_step(step, tool["output"])
+
+
 def get_langflow_session_id() -> str:
     thread_id = cl.context.session.thread_id
     return thread_id or cl.user_session.get("langflow_session_id")
 
 
+async def _log_metrics_periodically():
+    while True:
+        await asyncio.sleep(METRICS_LOG_INTERVAL)
+        metrics.log_snapshot()
+
+
+@cl.on_app_startup
+async def on_app_startup():
+    await langflow_client.start()
+    await router.start()
+    removed = await asyncio.to_thread(prune_tool_outputs)
+    if removed:
+        logger.info(f"Removed {removed} expired tool outputs")
+    if METRICS_LOG_INTERVAL > 0:
+        app_tasks.append(asyncio.create_task(_log_metrics_periodically()))
+
+
+@cl.on_app_shutdown
+async def on_app_shutdown():
+    for task in app_tasks:
+        task.cancel()
+    app_tasks.clear()
+    metrics.log_snapshot()
+    await router.stop()
+    await langflow_client.aclose()
+
+
+@cl.action_callback(EXPAND_OUTPUT_ACTION)
+async def on_expand_tool_output(action: cl.Action):
+    content = await load_tool_output(action.payload.get("output_id", ""))
+    if content is None:
+        await cl.Message(content="⚠️ The full tool output is no longer available.").send()
+        return
+    await cl.Text(name="Full output", content=content, language="json", display="inline").send(for_id=action.forId)
+    await action.remove()
+
+
+async def offer_offloaded_payloads(thread: ThreadDict):
+    # Resumed threads load with previews only; the full step content is fetched on demand
+    for step in thread.get("steps") or []:
+        fields = [f for f in ("output", "input") if f in data_layer.offloaded_fields(step.get("metadata"))]
+        if fields:
+            await cl.Action(
+                name=EXPAND_STEP_ACTION,
+                payload={"step_id": step["id"], "fields": fields},
+                label="Show full content",
+            ).send(for_id=step["id"])
+
+
+@cl.action_callback(EXPAND_STEP_ACTION)
+async def on_expand_step_payload(action: cl.Action):
+    thread_id = cl.context.session.thread_id
+    step_id = action.payload.get("step_id", "")
+    loaded = False
+    for field in action.payload.get("fields") or ["output"]:
+        content = await data_layer.load_step_payload(thread_id, step_id, field)
+        if content is not None:
+            loaded = True
+            await cl.Text(name=f"Full {field}", content=content, display="inline").send(for_id=action.forId)
+    if not loaded:
+        await cl.Message(content="⚠️ The full content of this step is no longer available.").send()
+        return
+    await action.remove()
+
+
+async def show_search_results(query: str, cursor: Optional[str] = None, start: int = 0):
+    user = cl.user_session.get("user")
+    user_id = getattr(user, "id", None)
+    if not user_id:
+        await cl.Message(content="⚠️ Conversation history is only available when signed in.", author="Assistant").send()
+        return
+    if not query.strip():
+        await cl.Message(content="Type what to search for after /history.", author="Assistant").send()
+        return
+
+    rows, next_cursor = await data_layer.search_threads(user_id, query, limit=SEARCH_PAGE_SIZE, cursor=cursor)
+    if not rows:
+        content = f"No past conversations match “{query}”." if cursor is None else "No more results."
+        await cl.Message(content=content, author="Assistant").send()
+        return
+
+    lines = []
+    for number, row in enumerate(rows, start=start + 1):
+        snippet = " ".join((row["snippet"] or "").split())
+        lines.append(
+            f"{number}. **[{row['name'] or 'Untitled'}](/thread/{row['threadId']})** · {str(row['createdAt'])[:10]}\n"
+            f"   {snippet}"
+        )
+    actions = []
+    if next_cursor is not None:
+        actions.append(cl.Action(
+            name=SEARCH_MORE_ACTION,
+            payload={"query": query, "cursor": next_cursor, "start": start + len(rows)},
+            label="More results",
+        ))
+    await cl.Message(content="\n".join(lines), author="Assistant", actions=actions).send()
+
+
+@cl.action_callback(SEARCH_MORE_ACTION)
+async def on_search_more(action: cl.Action):
+    await action.remove()
+    payload = action.payload
+    await show_search_results(payload.get("query", ""), payload.get("cursor"), int(payload.get("start", 0)))
+
+
 @cl.set_starters
 async def set_starters():
     return STARTERS
@@ -73,11 +307,12 @@ async def on_chat_start():
 async def on_chat_resume(thread: ThreadDict):
     await cl.context.emitter.set_commands(COMMANDS)
     cl.user_session.set("langflow_session_id", thread["id"])
+    await offer_offloaded_payloads(thread)
 
 
 @cl.on_chat_end
 async def on_chat_end():
-    pass
+    await data_layer.flush_thread(cl.context.session.thread_id)
 
 
 @cl.on_message
@@ -86,7 +321,11 @@ async def on_message(message: cl.Message):
     sender_name = get_user_identifier()
     session_id = get_langflow_session_id()
     command = message.command
-    file_path = None
+    file_paths = []
+
+    if command == "history":
+        await show_search_results(user_input)
+        return
 
     if message.elements:
         logger.info(f"Message has {len(message.elements)} elements")
@@ -98,67 +337,67 @@ async def on_message(message: cl.Message):
 
         if len(files) > MAX_FILES:
             await cl.Message(
-                content=f"⚠️ Only {MAX_FILES} file allowed at a time. Please upload only one file.",
+                content=f"⚠️ Only {MAX_FILES} files allowed at a time. Please upload fewer files.",
                 author="Assistant"
             ).send()
             return
 
-        if files:
-            file_element = files[0]
-            try:
-                import os
-                file_size_mb = os.path.getsize(file_element.path) / (1024 * 1024)
-                if file_size_mb > MAX_FILE_SIZE_MB:
-                    await cl.Message(
-                        content=f"⚠️ File too large ({file_size_mb:.2f}MB). Maximum size is {MAX_FILE_SIZE_MB}MB.",
-                        author="Assistant"
-                    ).send()
-                    return
-
-                with open(file_element.path, "rb") as f:
-                    file_content = f.read()
-
-                logger.info(f"Uploading file {file_element.name} ({len(file_content)} bytes) to Langflow")
-                file_path = await upload_file_to_langflow(file_content, file_element.name)
-                logger.info(f"File uploaded successfully, Langflow path: {file_path}")
-
-            except Exception as e:
-                await cl.Message(
-                    content=f"❌ Error uploading file: {str(e)}",
-                    author="Assistant"
-                ).send()
+        problems = []
+        accepted = []
+        for file_element in files:
+            file_size_mb = os.path.getsize(file_element.path) / (1024 * 1024)
+            if file_size_mb > MAX_FILE_SIZE_MB:
+                problems.append(f"⚠️ {file_element.name} is too large ({file_size_mb:.2f}MB). Maximum size is {MAX_FILE_SIZE_MB}MB.")
+            else:
+                accepted.append(file_element)
+
+        if accepted:
+            file_paths, errors = await upload_files(accepted, session_id)
+            problems.extend(errors)
+
+        if problems:
+            await cl.Message(content="\n".join(problems), author="Assistant").send()
+            if not file_paths and not user_input.strip():
                 return
 
-    if command:
-        if command == "search":
-            user_input = f"[Search Mode] {user_input}"
-        elif command == "code":
-            user_input = f"[Code Mode] {user_input}"
+    route_name, route = select_route(command, bool(file_paths))
+    use_cache = use_response_cache(user_input, file_paths, route["flow_id"])
+    user_input = f"{route['prefix']}{user_input}"
+    stats = _route_stats(route_name, route["flow_id"])
+    stats["runs"] += 1
 
-    displayed_tools = {}
+    tracker = AgentStepTracker()
+    tool_steps = {}
 
     msg = cl.Message(content="", author="Assistant")
     await msg.send()
+    coalescer = TokenCoalescer(msg.stream_token)
 
+    async def on_queued(position: int):
+        msg.content = f"⏳ Queued, position {position}" if position else ""
+        await msg.update()
+
+    started = time.perf_counter()
+    first_token = True
     try:
-        async for event in run_flow_stream(user_input, session_id, sender_name, file_path=file_path):
+        async for event in run_flow_stream(
+            user_input, session_id, sender_name, file_paths=file_paths, events=STREAM_EVENTS,
+            command=command, use_cache=use_cache, on_queued=on_queued, flow_id=route["flow_id"],
+            chat_input_id=route["chat_input_id"], file_input_id=route["file_input_id"],
+        ):
             event_type = event.get("event", "")
             data = event.get("data", {})
 
             if event_type == "token":
-                chunk = data.get("chunk", "")
-                if chunk:
-                    await msg.stream_token(chunk)
-
-            elif event_type == "add_message":
-                agent_data = extract_agent_steps(data)
-                for tool in agent_data.get("tools", []):
-                    tool_name = tool.get("name")
-                    if not tool_name:
-                        continue
-                    if tool_name not in displayed_tools:
-                        step = await create_tool_step(tool_name, tool.get("input", {}))
-                        displayed_tools[tool_name] = step
+                if first_token:
+                    stats["first_token"].observe(time.perf_counter() - started)
+                    first_token = False
+                await coalescer.push(data.get("chunk", ""))
+                continue
+
+            await coalescer.flush()
+            if event_type == "add_message":
+                await show_tool_updates(tracker, tool_steps, data)
 
             elif event_type == "end":
                 result = data.get("result", {})
@@ -166,19 +405,25 @@ async def on_message(message: cl.Message):
                 for output in outputs:
                     for out in output.get("outputs", []):
                         msg_obj = out.get("results", {}).get("message", {})
-                        final_tools = extract_agent_steps(msg_obj).get("tools", [])
-                        for tool in final_tools:
-                            tool_name = tool.get("name")
-                            tool_output = tool.get("output")
-                            if tool_name and tool_output and tool_name in displayed_tools:
-                                await update_tool_step(displayed_tools[tool_name], tool_output)
+                        await show_tool_updates(tracker, tool_steps, msg_obj)
 
+        await coalescer.close()
         await msg.update()
+        stats["total"].observe(time.perf_counter() - started)
 
     except RateLimitError as e:
+        stats["errors"] += 1
+        await coalescer.close()
         msg.content = f"⚠️ Rate limited by the API. Please wait {e.retry_after} seconds and try again."
         await msg.update()
+    except CircuitOpenError as e:
+        stats["errors"] += 1
+        await coalescer.close()
+        msg.content = f"⚠️ Langflow is temporarily unavailable. Please try again in {e.retry_after} seconds."
+        await msg.update()
     except Exception as e:
+        stats["errors"] += 1
+        await coalescer.close()
         msg.content = f"❌ Error: {str(e)}"
         await msg.update()
 
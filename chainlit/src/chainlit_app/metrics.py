@@ -0,0 +1,65 @@
+import logging
+import time
+from collections import deque
+from typing import Callable, Dict
+
+logger = logging.getLogger(__name__)
+
+_providers: Dict[str, Callable[[], dict]] = {}
+
+
+class LatencyStats:
+    def __init__(self, window: int = 1000):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self._recent = deque(maxlen=window)
+
+    def observe(self, value: float):
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+        self._recent.append(value)
+
+    def snapshot(self) -> dict:
+        recent = sorted(self._recent)
+        if not recent:
+            return {"count": 0, "avg": 0.0, "p50": 0.0, "p95": 0.0, "max": 0.0}
+        return {
+            "count": self.count,
+            "avg": round(self.total / self.count, 4),
+            "p50": round(recent[len(recent) // 2], 4),
+            "p95": round(recent[min(len(recent) - 1, int(len(recent) * 0.95))], 4),
+            "max": round(self.max, 4),
+        }
+
+
+class Timer:
+    def __init__(self, stats: LatencyStats):
+        self._stats = stats
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self._stats.observe(time.perf_counter() - self._start)
+
+
+def register(name: str, provider: Callable[[], dict]):
+    _providers[name] = provider
+
+
+def snapshot() -> dict:
+    result = {}
+    for name, provider in _providers.items():
+        try:
+            result[name] = provider()
+        except Exception as e:
+            result[name] = {"error": str(e)}
+    return result
+
+
+def log_snapshot():
+    for name, values in snapshot().items():
+        logger.info(f"metrics {name}: {values}")
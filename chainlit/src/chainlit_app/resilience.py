@@ -0,0 +1,238 @@
+import asyncio
+import logging
+import random
+import time
+from collections import defaultdict
+from email.utils import parsedate_to_datetime
+from typing import Awaitable, Callable, Dict, Optional, TypeVar
+
+import httpx
+
+from chainlit_app import metrics
+from chainlit_app.config import (
+    LANGFLOW_BREAKER_FAILURES,
+    LANGFLOW_BREAKER_RESET,
+    LANGFLOW_MAX_RETRIES,
+    LANGFLOW_RATE_BURST,
+    LANGFLOW_RATE_LIMIT,
+    LANGFLOW_RETRY_BASE_DELAY,
+    LANGFLOW_RETRY_MAX_DELAY,
+)
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+RETRYABLE_STATUS = {429, 502, 503, 504}
+# Only errors raised before the request reached Langflow, so a retry cannot start a second run
+RETRYABLE_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+
+
+class RateLimitError(Exception):
+    def __init__(self, retry_after: int = 60):
+        self.retry_after = retry_after
+        super().__init__(f"Rate limited. Retry after {retry_after} seconds.")
+
+
+class CircuitOpenError(Exception):
+    def __init__(self, endpoint: str, retry_after: float):
+        self.endpoint = endpoint
+        self.retry_after = max(1, int(retry_after))
+        super().__init__(f"Langflow is unavailable ({endpoint}). Retry after {self.retry_after} seconds.")
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff_delay(attempt: int, base: float = LANGFLOW_RETRY_BASE_DELAY, cap: float = LANGFLOW_RETRY_MAX_DELAY) -> float:
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: int):
+        # rate <= 0 means no steady limit; Retry-After pauses still apply
+        self.max_rate = rate
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+
+    def _refill(self, now: float):
+        if self.rate > 0:
+            self.tokens = min(self.burst, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self):
+        while True:
+            now = time.monotonic()
+            if now < self._paused_until:
+                await asyncio.sleep(self._paused_until - now)
+                continue
+            if self.rate <= 0:
+                return
+            self._refill(now)
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def throttled(self, retry_after: float):
+        self._paused_until = max(self._paused_until, time.monotonic() + retry_after)
+        if self.rate > 0:
+            self._refill(time.monotonic())
+            self.rate = max(self.max_rate * 0.1, self.rate / 2)
+            self.tokens = 0.0
+
+    def succeeded(self):
+        if 0 < self.rate < self.max_rate:
+            self.rate = min(self.max_rate, self.rate + self.max_rate * 0.05)
+
+
+class CircuitBreaker:
+    def __init__(self, failure_threshold: int, reset_timeout: float):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.state = "closed"
+        self._opened_at = 0.0
+        self._probe_started = 0.0
+
+    def before_call(self, endpoint: str):
+        if self.state == "open":
+            remaining = self._opened_at + self.reset_timeout - time.monotonic()
+            if remaining > 0:
+                raise CircuitOpenError(endpoint, remaining)
+            # Let a single probe through
+            self.state = "half_open"
+            self._probe_started = time.monotonic()
+        elif self.state == "half_open":
+            # A probe that never reported back must not keep the circuit half open forever
+            if time.monotonic() - self._probe_started < self.reset_timeout:
+                raise CircuitOpenError(endpoint, self.reset_timeout)
+            self._probe_started = time.monotonic()
+
+    def record_success(self):
+        self.failures = 0
+        self.state = "closed"
+
+    def record_failure(self):
+        self.failures += 1
+        if self.state == "half_open" or self.failures >= self.failure_threshold:
+            if self.state != "open":
+                logger.warning(f"Circuit opened after {self.failures} consecutive failures")
+            self.state = "open"
+            self._opened_at = time.monotonic()
+
+
+class _EndpointStats:
+    def __init__(self):
+        self.calls = 0
+        self.retries = 0
+        self.failures = 0
+        self.rejected = 0
+        self.latency = metrics.LatencyStats()
+        self.retry_delay = metrics.LatencyStats()
+
+
+class Resilience:
+    def __init__(self):
+        self.bucket = TokenBucket(LANGFLOW_RATE_LIMIT, LANGFLOW_RATE_BURST)
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self._stats: Dict[str, _EndpointStats] = defaultdict(_EndpointStats)
+
+    def breaker(self, endpoint: str) -> CircuitBreaker:
+        if endpoint not in self._breakers:
+            self._breakers[endpoint] = CircuitBreaker(LANGFLOW_BREAKER_FAILURES, LANGFLOW_BREAKER_RESET)
+        return self._breakers[endpoint]
+
+    async def call(self, endpoint: str, fn: Callable[[], Awaitable[T]], max_retries: int = LANGFLOW_MAX_RETRIES) -> T:
+        stats = self._stats[endpoint]
+        breaker = self.breaker(endpoint)
+        stats.calls += 1
+        started = time.perf_counter()
+
+        for attempt in range(max_retries + 1):
+            try:
+                breaker.before_call(endpoint)
+            except CircuitOpenError:
+                stats.rejected += 1
+                raise
+            await self.bucket.acquire()
+
+            attempt_started = time.perf_counter()
+            try:
+                result = await fn()
+            except httpx.HTTPStatusError as e:
+                status = e.response.status_code
+                if status not in RETRYABLE_STATUS:
+                    if status >= 500:
+                        breaker.record_failure()
+                    else:
+                        breaker.record_success()
+                    stats.failures += 1
+                    raise
+                retry_after = parse_retry_after(e.response.headers.get("Retry-After"))
+                if status == 429:
+                    breaker.record_success()
+                    self.bucket.throttled(retry_after if retry_after is not None else backoff_delay(attempt))
+                else:
+                    breaker.record_failure()
+                if attempt == max_retries:
+                    stats.failures += 1
+                    if status == 429:
+                        raise RateLimitError(int(retry_after or LANGFLOW_RETRY_MAX_DELAY)) from e
+                    raise
+                # A 429 already paused the shared bucket for Retry-After; jitter spreads the retries out
+                delay = backoff_delay(attempt) if status == 429 else max(retry_after or 0.0, backoff_delay(attempt))
+            except RETRYABLE_ERRORS:
+                breaker.record_failure()
+                if attempt == max_retries:
+                    stats.failures += 1
+                    raise
+                delay = backoff_delay(attempt)
+            except Exception:
+                breaker.record_failure()
+                stats.failures += 1
+                raise
+            else:
+                breaker.record_success()
+                self.bucket.succeeded()
+                stats.latency.observe(time.perf_counter() - started)
+                stats.retry_delay.observe(attempt_started - started)
+                return result
+
+            stats.retries += 1
+            logger.info(f"Retrying {endpoint} in {delay:.2f}s (attempt {attempt + 1}/{max_retries})")
+            await asyncio.sleep(delay)
+
+    def stats(self) -> dict:
+        result = {
+            "rate": self.bucket.rate,
+            "endpoints": {},
+        }
+        for endpoint, stats in self._stats.items():
+            result["endpoints"][endpoint] = {
+                "calls": stats.calls,
+                "retries": stats.retries,
+                "failures": stats.failures,
+                "rejected": stats.rejected,
+                "circuit": self.breaker(endpoint).state,
+                "latency": stats.latency.snapshot(),
+                "retry_delay": stats.retry_delay.snapshot(),
+            }
+        return result
+
+
+resilience = Resilience()
+metrics.register("langflow_resilience", resilience.stats)
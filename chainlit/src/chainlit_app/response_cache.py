@@ -0,0 +1,100 @@
+import hashlib
+import json
+import logging
+from typing import AsyncIterator, Callable, Iterable, Optional, Union
+
+from chainlit_app import metrics
+from chainlit_app.cache import MemoryCache, SQLiteCache
+from chainlit_app.config import (
+    RESPONSE_CACHE_BACKEND,
+    RESPONSE_CACHE_MAX_ENTRIES,
+    RESPONSE_CACHE_PATH,
+    RESPONSE_CACHE_TTL,
+)
+
+logger = logging.getLogger(__name__)
+
+# Per-conversation values that must not split the cache
+_SESSION_FIELDS = {"session_id", "sender_name"}
+
+
+def normalize_input(message: str) -> str:
+    return " ".join(message.split()).casefold()
+
+
+def tweak_fingerprint(tweaks: dict) -> str:
+    stable = {
+        node_id: {k: v for k, v in values.items() if k not in _SESSION_FIELDS} if isinstance(values, dict) else values
+        for node_id, values in tweaks.items()
+    }
+    return hashlib.sha256(json.dumps(stable, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def response_cache_key(
+    flow_id: str,
+    message: str,
+    command: Optional[str],
+    tweaks: dict,
+    events: Optional[Iterable[str]] = None,
+) -> str:
+    parts = [
+        flow_id,
+        normalize_input(message),
+        command or "",
+        tweak_fingerprint(tweaks),
+        ",".join(sorted(events)) if events is not None else "*",
+    ]
+    return hashlib.sha256("\x1f".join(parts).encode()).hexdigest()
+
+
+class ResponseCache:
+    def __init__(self, backend: Union[MemoryCache, SQLiteCache]):
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+        self.stored = 0
+
+    async def stream(self, key: str, produce: Callable[[], AsyncIterator[dict]]) -> AsyncIterator[dict]:
+        recorded = await self.backend.get(key)
+        if recorded is not None:
+            self.hits += 1
+            for event in recorded:
+                yield event
+            return
+
+        self.misses += 1
+        events = []
+        async for event in produce():
+            events.append(event)
+            yield event
+
+        # Failed runs raise before their end event, so only complete runs are stored
+        if events and events[-1]["event"] == "end":
+            await self.backend.set(key, events)
+            self.stored += 1
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "stored": self.stored,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            "entries": len(self.backend),
+        }
+
+
+_response_cache: Optional[ResponseCache] = None
+
+
+def get_response_cache() -> ResponseCache:
+    global _response_cache
+    if _response_cache is None:
+        if RESPONSE_CACHE_BACKEND == "disk":
+            backend = SQLiteCache(RESPONSE_CACHE_PATH, max_entries=RESPONSE_CACHE_MAX_ENTRIES, ttl=RESPONSE_CACHE_TTL)
+        else:
+            backend = MemoryCache(max_entries=RESPONSE_CACHE_MAX_ENTRIES, ttl=RESPONSE_CACHE_TTL)
+        _response_cache = ResponseCache(backend)
+        metrics.register("response_cache", _response_cache.stats)
+        logger.info(f"Response cache enabled ({RESPONSE_CACHE_BACKEND} backend)")
+    return _response_cache
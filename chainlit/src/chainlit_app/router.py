@@ -0,0 +1,127 @@
+import asyncio
+import bisect
+import hashlib
+import logging
+from contextlib import asynccontextmanager
+from typing import List, Optional
+
+import httpx
+
+from chainlit_app import metrics
+from chainlit_app.config import (
+    LANGFLOW_API_URLS,
+    LANGFLOW_HEALTH_INTERVAL,
+    LANGFLOW_HEALTH_PATH,
+    LANGFLOW_HEALTH_TIMEOUT,
+)
+from chainlit_app.http_client import get_client
+from chainlit_app.resilience import RETRYABLE_ERRORS
+
+logger = logging.getLogger(__name__)
+
+VIRTUAL_NODES = 100
+
+
+def _hash(key: str) -> int:
+    return int(hashlib.md5(key.encode()).hexdigest()[:16], 16)
+
+
+class Backend:
+    def __init__(self, url: str):
+        self.url = url.rstrip("/")
+        self.healthy = True
+        self.outstanding = 0
+        self.requests = 0
+        self.failovers = 0
+
+
+class LangflowRouter:
+    def __init__(self, urls: List[str]):
+        self.backends = [Backend(url) for url in urls]
+        self._ring = sorted(
+            (_hash(f"{backend.url}#{i}"), index)
+            for index, backend in enumerate(self.backends)
+            for i in range(VIRTUAL_NODES)
+        )
+        self._ring_keys = [h for h, _ in self._ring]
+        self._probe_task: Optional[asyncio.Task] = None
+
+    def _least_outstanding(self, candidates: List[Backend]) -> Backend:
+        return min(candidates, key=lambda b: b.outstanding)
+
+    def pick(self, session_id: Optional[str] = None) -> Backend:
+        healthy = [b for b in self.backends if b.healthy] or self.backends
+        if not session_id or len(self.backends) == 1:
+            return self._least_outstanding(healthy)
+
+        position = bisect.bisect(self._ring_keys, _hash(session_id)) % len(self._ring)
+        owner = self.backends[self._ring[position][1]]
+        if owner.healthy:
+            return owner
+        owner.failovers += 1
+        return self._least_outstanding(healthy)
+
+    def acquire(self, session_id: Optional[str] = None) -> Backend:
+        backend = self.pick(session_id)
+        backend.outstanding += 1
+        backend.requests += 1
+        return backend
+
+    def release(self, backend: Backend, error: Optional[BaseException] = None):
+        backend.outstanding -= 1
+        # Connection failures take the replica out of rotation until the next successful probe
+        if isinstance(error, RETRYABLE_ERRORS) and len(self.backends) > 1:
+            self.mark(backend, healthy=False)
+
+    @asynccontextmanager
+    async def request(self, session_id: Optional[str] = None):
+        backend = self.acquire(session_id)
+        error = None
+        try:
+            yield backend.url
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            self.release(backend, error)
+
+    def mark(self, backend: Backend, healthy: bool):
+        if backend.healthy != healthy:
+            logger.warning(f"Langflow backend {backend.url} is now {'healthy' if healthy else 'unhealthy'}")
+        backend.healthy = healthy
+
+    async def probe(self, backend: Backend):
+        try:
+            response = await get_client().get(f"{backend.url}{LANGFLOW_HEALTH_PATH}", timeout=LANGFLOW_HEALTH_TIMEOUT)
+            self.mark(backend, response.status_code == 200)
+        except httpx.HTTPError:
+            self.mark(backend, False)
+
+    async def _probe_forever(self):
+        while True:
+            await asyncio.gather(*(self.probe(b) for b in self.backends))
+            await asyncio.sleep(LANGFLOW_HEALTH_INTERVAL)
+
+    async def start(self):
+        if len(self.backends) > 1 and self._probe_task is None:
+            self._probe_task = asyncio.create_task(self._probe_forever())
+
+    async def stop(self):
+        if self._probe_task is not None:
+            self._probe_task.cancel()
+            self._probe_task = None
+
+    def stats(self) -> dict:
+        return {
+            b.url: {
+                "healthy": b.healthy,
+                "outstanding": b.outstanding,
+                "requests": b.requests,
+                "failovers": b.failovers,
+            }
+            for b in self.backends
+        }
+
+
+router = LangflowRouter(LANGFLOW_API_URLS)
+metrics.register("langflow_router", router.stats)
@@ -0,0 +1,133 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import Awaitable, Callable, Deque, Optional
+
+from chainlit_app import metrics
+from chainlit_app.config import LANGFLOW_MAX_CONCURRENT_RUNS
+
+logger = logging.getLogger(__name__)
+
+
+class _Waiter:
+    def __init__(self, user: str, on_queued: Optional[Callable[[int], Awaitable[None]]]):
+        self.user = user
+        self.on_queued = on_queued
+        self.future: asyncio.Future = asyncio.get_running_loop().create_future()
+        self.position = 0
+        # Set when the position changes or the waiter is admitted
+        self.changed = asyncio.Event()
+
+
+class FairScheduler:
+    def __init__(self, max_concurrent: int):
+        self.max_concurrent = max_concurrent
+        self.active = 0
+        # Users are served round-robin; each user's own requests stay FIFO
+        self._queues: "OrderedDict[str, Deque[_Waiter]]" = OrderedDict()
+        self.queue_wait = metrics.LatencyStats()
+        self.admitted = 0
+
+    @property
+    def queue_depth(self) -> int:
+        return sum(len(q) for q in self._queues.values())
+
+    def _service_order(self) -> list:
+        queues = [list(q) for q in self._queues.values()]
+        order = []
+        depth = 0
+        while any(depth < len(q) for q in queues):
+            order.extend(q[depth] for q in queues if depth < len(q))
+            depth += 1
+        return order
+
+    def _update_positions(self):
+        # Only wakes the waiters; each reports its position from its own task, because on_queued
+        # updates a Chainlit message through the calling task's session context
+        for position, waiter in enumerate(self._service_order(), start=1):
+            if waiter.on_queued and waiter.position != position:
+                waiter.position = position
+                waiter.changed.set()
+
+    async def _report(self, waiter: _Waiter, position: int):
+        try:
+            await waiter.on_queued(position)
+        except Exception as e:
+            logger.debug(f"Queue position callback failed: {e}")
+
+    def _release(self):
+        self.active -= 1
+        admitted = False
+        while self._queues and self.active < self.max_concurrent:
+            user, queue = next(iter(self._queues.items()))
+            waiter = queue.popleft()
+            if queue:
+                self._queues.move_to_end(user)
+            else:
+                del self._queues[user]
+            self.active += 1
+            waiter.future.set_result(None)
+            waiter.changed.set()
+            admitted = True
+        if admitted:
+            self._update_positions()
+
+    async def _wait(self, waiter: _Waiter) -> int:
+        reported = 0
+        while not waiter.future.done():
+            if waiter.on_queued and waiter.position != reported:
+                reported = waiter.position
+                await self._report(waiter, reported)
+                continue
+            waiter.changed.clear()
+            await waiter.changed.wait()
+        return reported
+
+    @asynccontextmanager
+    async def slot(self, user: str, on_queued: Optional[Callable[[int], Awaitable[None]]] = None):
+        # on_queued receives the 1-based queue position while waiting and 0 once admitted
+        started = time.perf_counter()
+        reported = 0
+        if self.active < self.max_concurrent and not self._queues:
+            self.active += 1
+        else:
+            waiter = _Waiter(user, on_queued)
+            self._queues.setdefault(user, deque()).append(waiter)
+            self._update_positions()
+            try:
+                reported = await self._wait(waiter)
+            except BaseException:
+                queue = self._queues.get(user)
+                if queue and waiter in queue:
+                    queue.remove(waiter)
+                    if not queue:
+                        del self._queues[user]
+                    self._update_positions()
+                elif waiter.future.done():
+                    self._release()
+                raise
+
+        self.queue_wait.observe(time.perf_counter() - started)
+        self.admitted += 1
+        try:
+            if reported:
+                await self._report(waiter, 0)
+            yield
+        finally:
+            self._release()
+
+    def stats(self) -> dict:
+        return {
+            "active": self.active,
+            "max_concurrent": self.max_concurrent,
+            "queue_depth": self.queue_depth,
+            "queued_users": len(self._queues),
+            "admitted": self.admitted,
+            "queue_wait": self.queue_wait.snapshot(),
+        }
+
+
+scheduler = FairScheduler(LANGFLOW_MAX_CONCURRENT_RUNS)
+metrics.register("scheduler", scheduler.stats)
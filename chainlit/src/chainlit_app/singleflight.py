@@ -0,0 +1,82 @@
+import asyncio
+import logging
+from typing import AsyncIterator, Callable, Dict, Optional
+
+from chainlit_app import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class _Flight:
+    def __init__(self):
+        self.events = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.subscribers = 0
+        self.changed = asyncio.Condition()
+        self.task: Optional[asyncio.Task] = None
+
+
+class SingleFlight:
+    def __init__(self):
+        self._flights: Dict[str, _Flight] = {}
+        self.leaders = 0
+        self.followers = 0
+
+    async def stream(self, key: str, produce: Callable[[], AsyncIterator[dict]]) -> AsyncIterator[dict]:
+        flight = self._flights.get(key)
+        if flight is None:
+            flight = _Flight()
+            self._flights[key] = flight
+            flight.task = asyncio.create_task(self._run(key, flight, produce))
+            self.leaders += 1
+        else:
+            self.followers += 1
+            logger.info(f"Joining in-flight run {key[:12]} at event {len(flight.events)}")
+
+        flight.subscribers += 1
+        index = 0
+        try:
+            while True:
+                async with flight.changed:
+                    await flight.changed.wait_for(lambda: index < len(flight.events) or flight.done)
+                    batch = flight.events[index:]
+                    done = flight.done
+                index += len(batch)
+                for event in batch:
+                    yield event
+                if done and index >= len(flight.events):
+                    if flight.error is not None:
+                        raise flight.error
+                    return
+        finally:
+            flight.subscribers -= 1
+            if flight.subscribers == 0 and not flight.done:
+                # Unlisted right away, so a request arriving while the run unwinds starts a new one
+                if self._flights.get(key) is flight:
+                    del self._flights[key]
+                flight.task.cancel()
+
+    async def _run(self, key: str, flight: _Flight, produce: Callable[[], AsyncIterator[dict]]):
+        try:
+            async for event in produce():
+                async with flight.changed:
+                    flight.events.append(event)
+                    flight.changed.notify_all()
+        except asyncio.CancelledError:
+            flight.error = RuntimeError("Shared flow run was cancelled")
+        except Exception as e:
+            flight.error = e
+        finally:
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+            async with flight.changed:
+                flight.done = True
+                flight.changed.notify_all()
+
+    def stats(self) -> dict:
+        return {"leaders": self.leaders, "followers": self.followers, "in_flight": len(self._flights)}
+
+
+single_flight = SingleFlight()
+metrics.register("single_flight", single_flight.stats)
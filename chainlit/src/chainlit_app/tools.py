@@ -1,10 +1,186 @@
+import asyncio
 import json
+import logging
+import os
+import time
+import uuid
+from itertools import islice
+from typing import Dict, List, Optional, Tuple
 import chainlit as cl
 
+from chainlit_app.config import TOOL_OUTPUT_PREVIEW_CHARS, TOOL_OUTPUT_SPILL_DIR, TOOL_OUTPUT_SPILL_TTL
+
+logger = logging.getLogger(__name__)
+
+EXPAND_OUTPUT_ACTION = "expand_tool_output"
+
+PREVIEW_MAX_DEPTH = 4
+PREVIEW_MAX_ITEMS = 20
+PREVIEW_MAX_STRING = 200
+
+_pending_spills: Dict[str, asyncio.Task] = {}
+
+
+class _BudgetExceeded(Exception):
+    pass
+
+
+class _BoundedWriter:
+    def __init__(self, budget: int):
+        self.parts = []
+        self.remaining = budget
+        self.elided = False
+
+    def write(self, text: str):
+        if len(text) > self.remaining:
+            self.parts.append(text[:self.remaining])
+            self.remaining = 0
+            raise _BudgetExceeded
+        self.parts.append(text)
+        self.remaining -= len(text)
+
+
+def _write_string(writer: _BoundedWriter, value: str):
+    if len(value) > PREVIEW_MAX_STRING:
+        writer.elided = True
+        writer.write(json.dumps(value[:PREVIEW_MAX_STRING], ensure_ascii=False) + f" … (+{len(value) - PREVIEW_MAX_STRING} chars)")
+    else:
+        writer.write(json.dumps(value, ensure_ascii=False))
+
+
+def _write_value(writer: _BoundedWriter, value, depth: int):
+    if isinstance(value, str):
+        _write_string(writer, value)
+    elif isinstance(value, (dict, list, tuple)):
+        is_dict = isinstance(value, dict)
+        open_, close = ("{", "}") if is_dict else ("[", "]")
+        if not value:
+            writer.write(open_ + close)
+            return
+        if depth >= PREVIEW_MAX_DEPTH:
+            writer.elided = True
+            writer.write(f"{open_}… {len(value)} {'keys' if is_dict else 'items'}{close}")
+            return
+        pad = "\n" + "  " * (depth + 1)
+        items = value.items() if is_dict else enumerate(value)
+        writer.write(open_)
+        for i, (key, item) in enumerate(items):
+            if i == PREVIEW_MAX_ITEMS:
+                writer.elided = True
+                writer.write(f"{pad}… (+{len(value) - i} more {'keys' if is_dict else 'items'})")
+                break
+            writer.write(pad)
+            if is_dict:
+                _write_string(writer, str(key))
+                writer.write(": ")
+            _write_value(writer, item, depth + 1)
+            if i < len(value) - 1:
+                writer.write(",")
+        writer.write("\n" + "  " * depth + close)
+    elif value is None or isinstance(value, (bool, int, float)):
+        writer.write(json.dumps(value))
+    else:
+        _write_string(writer, str(value))
+
+
+def _describe(value) -> str:
+    if isinstance(value, dict):
+        return f"{len(value)} keys"
+    if isinstance(value, (list, tuple)):
+        return f"{len(value)} items"
+    if isinstance(value, str):
+        return f"{len(value)} chars"
+    return type(value).__name__
+
+
+def _outline(value) -> str:
+    # Top-level shape, so a preview cut short inside the first key still shows what else is there
+    if isinstance(value, dict):
+        parts = [f"{str(key)[:PREVIEW_MAX_STRING]}: {_describe(item)}" for key, item in islice(value.items(), PREVIEW_MAX_ITEMS)]
+        if len(value) > PREVIEW_MAX_ITEMS:
+            parts.append(f"+{len(value) - PREVIEW_MAX_ITEMS} more keys")
+        return "{" + ", ".join(parts) + "}"
+    return _describe(value)
+
+
+def preview_json(value, budget: int = TOOL_OUTPUT_PREVIEW_CHARS) -> Tuple[str, bool]:
+    # Stops serializing once the budget is spent instead of dumping the whole payload and slicing it
+    if isinstance(value, str):
+        if len(value) <= budget:
+            return value, False
+        return value[:budget] + f"\n… (+{len(value) - budget} chars)", True
+    writer = _BoundedWriter(budget)
+    try:
+        _write_value(writer, value, 0)
+    except _BudgetExceeded:
+        writer.parts.append(f"\n… (truncated, {_outline(value)})")
+        return "".join(writer.parts), True
+    return "".join(writer.parts), writer.elided
+
+
+def _dump_to_file(path: str, value):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(value, f, ensure_ascii=False, separators=(",", ":"), default=str)
+    os.replace(tmp, path)
+
+
+def _log_spill_error(task: asyncio.Task):
+    if not task.cancelled() and task.exception() is not None:
+        logger.warning(f"Could not save full tool output: {task.exception()}")
+
+
+def spill_tool_output(value) -> Optional[str]:
+    # Written compactly in a worker thread; rendering the step never waits for the full serialization
+    if not TOOL_OUTPUT_SPILL_DIR:
+        return None
+    output_id = uuid.uuid4().hex
+    task = asyncio.create_task(
+        asyncio.to_thread(_dump_to_file, os.path.join(TOOL_OUTPUT_SPILL_DIR, f"{output_id}.json"), value)
+    )
+    _pending_spills[output_id] = task
+    task.add_done_callback(_log_spill_error)
+    task.add_done_callback(lambda _: _pending_spills.pop(output_id, None))
+    return output_id
+
+
+def _read_file(path: str) -> Optional[str]:
+    try:
+        with open(path, encoding="utf-8") as f:
+            value = json.load(f)
+    except FileNotFoundError:
+        return None
+    return value if isinstance(value, str) else json.dumps(value, indent=2, ensure_ascii=False)
+
+
+async def load_tool_output(output_id: str) -> Optional[str]:
+    try:
+        output_id = uuid.UUID(str(output_id)).hex
+    except ValueError:
+        return None
+    pending = _pending_spills.get(output_id)
+    if pending is not None:
+        await asyncio.wait({pending})
+    return await asyncio.to_thread(_read_file, os.path.join(TOOL_OUTPUT_SPILL_DIR, f"{output_id}.json"))
+
+
+def prune_tool_outputs() -> int:
+    if not TOOL_OUTPUT_SPILL_DIR or not os.path.isdir(TOOL_OUTPUT_SPILL_DIR):
+        return 0
+    cutoff = time.time() - TOOL_OUTPUT_SPILL_TTL
+    removed = 0
+    with os.scandir(TOOL_OUTPUT_SPILL_DIR) as entries:
+        for entry in entries:
+            if entry.name.endswith((".json", ".json.tmp")) and entry.stat().st_mtime < cutoff:
+                os.remove(entry.path)
+                removed += 1
+    return removed
+
 
 async def create_tool_step(tool_name: str, tool_input: dict):
     step = cl.Step(name=tool_name, type="tool")
-    step.input = json.dumps(tool_input, indent=2, ensure_ascii=False) if isinstance(tool_input, dict) else str(tool_input)
+    step.input, _ = preview_json(tool_input)
     step.output = "⏳ Running..."
     step.language = "json"
     await step.send()
@@ -13,82 +189,66 @@ async def create_tool_step(tool_name: str, tool_input: dict):
 
 async def update_tool_step(step, tool_output):
     if step and tool_output:
-        step.output = format_tool_output(tool_output)
+        step.output, truncated = preview_json(tool_output)
         await step.update()
-
-
-@cl.step(type="tool")
-async def display_tool_call(tool_name: str, tool_input: dict, tool_output: str):
-    step = cl.context.current_step
-    step.name = tool_name
-    step.input = json.dumps(tool_input, indent=2, ensure_ascii=False) if isinstance(tool_input, dict) else str(tool_input)
-    step.output = tool_output
-    step.language = "json"
-    return tool_output
-
-
-@cl.step(type="run", name="Agent Steps")
-async def display_agent_steps(input_text: str, tool_calls: list):
-    step = cl.context.current_step
-    content_parts = [f"📝 **Input:**\n> {input_text}"]
-
-    if tool_calls:
-        content_parts.append("\n🔧 **Tools Used:**")
-        for tool in tool_calls:
-            tool_name = tool.get("name", "Unknown")
-            tool_input = tool.get("input", {})
-            tool_output = tool.get("output")
-
-            input_str = json.dumps(tool_input, indent=2, ensure_ascii=False) if isinstance(tool_input, dict) else str(tool_input)
-            content_parts.append(f"\n**{tool_name}**")
-            content_parts.append(f"```json\n{input_str}\n```")
-            if tool_output:
-                content_parts.append(f"➡️ Output: `{format_tool_output(tool_output)}`")
-
-    step.output = "\n".join(content_parts)
-    return step.output
-
-
-def format_tool_output(output) -> str:
-    if not output:
-        return "⏳ Running..."
-    if isinstance(output, (list, dict)):
-        s = json.dumps(output, indent=2, ensure_ascii=False)
-        return s[:500] + "\n..." if len(s) > 500 else s
-    return str(output)
-
-
-def extract_tool_calls(data: dict) -> list:
-    tools = []
-    for block in data.get("content_blocks", []):
-        if block.get("title") == "Agent Steps":
-            for content in block.get("contents", []):
-                if content.get("type") == "tool_use":
-                    tools.append({
-                        "name": content.get("name", ""),
-                        "input": content.get("tool_input", {}),
-                        "output": content.get("output")
-                    })
-    return tools
-
-
-def extract_agent_steps(data: dict) -> dict:
-    result = {
-        "input_text": "",
-        "tools": []
-    }
-
-    for block in data.get("content_blocks", []):
-        if block.get("title") == "Agent Steps":
-            for content in block.get("contents", []):
-                if content.get("type") == "text":
-                    header = content.get("header", {})
-                    if header.get("title") == "Input":
-                        result["input_text"] = content.get("text", "")
-                elif content.get("type") == "tool_use":
-                    result["tools"].append({
-                        "name": content.get("name", ""),
-                        "input": content.get("tool_input", {}),
-                        "output": content.get("output")
-                    })
-    return result
+        if truncated:
+            await offer_full_output(step, tool_output)
+
+
+async def offer_full_output(step, tool_output):
+    # The full payload goes to disk, not into the persisted step, until the user asks for it
+    output_id = spill_tool_output(tool_output)
+    if output_id:
+        await cl.Action(
+            name=EXPAND_OUTPUT_ACTION,
+            payload={"output_id": output_id},
+            label="Show full output",
+        ).send(for_id=step.id)
+
+
+class AgentStepTracker:
+    def __init__(self):
+        # (message id, block index) -> index of the first tool call that may still change
+        self._settled: Dict[Tuple[str, int], int] = {}
+        self._seen: Dict[Tuple[str, int, int], tuple] = {}
+        self._last_message_id = ""
+
+    def update(self, data: dict) -> List[dict]:
+        message_id = str(data.get("id") or self._last_message_id)
+        self._last_message_id = message_id
+        changed = []
+
+        for block_index, block in enumerate(data.get("content_blocks") or []):
+            if block.get("title") != "Agent Steps":
+                continue
+            contents = block.get("contents") or []
+            settled = self._settled.get((message_id, block_index), 0)
+            still_open = False
+
+            for index in range(settled, len(contents)):
+                content = contents[index]
+                finished = content.get("type") != "tool_use" or content.get("output") is not None or bool(content.get("error"))
+                if not finished:
+                    still_open = True
+                elif not still_open:
+                    settled = index + 1
+
+                if content.get("type") != "tool_use":
+                    continue
+                key = (message_id, block_index, index)
+                # Cheap fingerprint: tool payloads can be large, so only track what changes the display
+                fingerprint = (content.get("name"), content.get("output") is not None, bool(content.get("error")))
+                if self._seen.get(key) == fingerprint:
+                    continue
+                self._seen[key] = fingerprint
+                changed.append({
+                    "key": key,
+                    "name": content.get("name", ""),
+                    "input": content.get("tool_input", {}),
+                    "output": content.get("output"),
+                    "error": content.get("error"),
+                })
+
+            self._settled[(message_id, block_index)] = settled
+
+        return changed
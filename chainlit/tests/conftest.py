@@ -0,0 +1,44 @@
+import os
+import re
+
+import pytest
+from chainlit.context import init_http_context
+
+# Data layer tests run against a scratch Postgres database, which they reset; skipped when unset
+TEST_DATABASE_URL = os.getenv("TEST_DATABASE_URL", "")
+
+
+@pytest.fixture
+def migrated_db():
+    """Empty schema with every init_db migration applied; yields a psycopg2 cursor (autocommit)."""
+    if not TEST_DATABASE_URL:
+        pytest.skip("TEST_DATABASE_URL is not set")
+    psycopg2 = pytest.importorskip("psycopg2")
+    import init_db
+
+    conn = psycopg2.connect(re.sub(r"^postgresql\+\w+://", "postgresql://", TEST_DATABASE_URL))
+    conn.autocommit = True
+    cursor = conn.cursor()
+    cursor.execute(init_db.DROP_TABLES_SQL)
+    cursor.execute("DROP TABLE IF EXISTS schema_migrations")
+    init_db.migrate(cursor)
+    yield cursor
+    cursor.close()
+    conn.close()
+
+
+@pytest.fixture
+async def make_layer(migrated_db):
+    """Build data layers of any class against the migrated test database; they are closed afterwards."""
+    init_http_context()
+    layers = []
+
+    def make(layer_class, **kwargs):
+        url = re.sub(r"^postgresql(\+\w+)?://", "postgresql+asyncpg://", TEST_DATABASE_URL)
+        layer = layer_class(conninfo=url, **kwargs)
+        layers.append(layer)
+        return layer
+
+    yield make
+    for layer in layers:
+        await layer.close()
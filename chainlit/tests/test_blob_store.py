@@ -0,0 +1,82 @@
+import pytest
+from chainlit.data.sql_alchemy import SQLAlchemyDataLayer
+
+from chainlit_app.blob_store import BlobStore, LocalBlobStore
+from chainlit_app.data_layer import PostgresDataLayer
+
+
+class FakeDataLayer(PostgresDataLayer):
+    # Answers the two blob queries delete_thread issues; nothing touches a database
+    def __init__(self, blob_store: BlobStore, steps: list, referenced: list):
+        self.blob_store = blob_store
+        self.steps = steps
+        self.referenced = referenced
+
+    async def execute_sql(self, query: str, parameters: dict):
+        if "jsonb_each_text" in query:
+            return [{"key": key} for key in self.referenced if key in parameters["keys"]]
+        return [{"metadata": metadata} for metadata in self.steps]
+
+
+@pytest.fixture
+def store(tmp_path):
+    return LocalBlobStore(str(tmp_path), delete_grace=0)
+
+
+@pytest.fixture(autouse=True)
+def no_parent_delete(monkeypatch):
+    async def delete_thread(self, thread_id):
+        pass
+
+    monkeypatch.setattr(SQLAlchemyDataLayer, "delete_thread", delete_thread)
+
+
+def test_blob_store_is_abstract():
+    with pytest.raises(TypeError):
+        BlobStore()
+
+
+async def test_put_deduplicates_and_round_trips(store):
+    key = await store.put(b"payload")
+    assert await store.put(b"payload") == key
+    assert await store.get(key) == b"payload"
+    assert store.stats()["writes"] == 1
+    assert store.stats()["deduplicated"] == 1
+
+
+async def test_put_rewrites_a_blob_deleted_after_it_was_checked(store):
+    key = await store.put(b"payload")
+    # A delete that already found no references unlinks the file...
+    await store.delete(key)
+    # ...and a step reusing the payload must still find it after its put
+    assert await store.put(b"payload") == key
+    assert await store.get(key) == b"payload"
+
+
+async def test_recently_written_blobs_are_not_deleted(tmp_path):
+    store = LocalBlobStore(str(tmp_path), delete_grace=60)
+    key = await store.put(b"payload")
+    await store.delete(key)
+    assert await store.get(key) == b"payload"
+
+
+async def test_delete_thread_removes_only_unreferenced_blobs(store):
+    own, shared = await store.put(b"own"), await store.put(b"shared")
+    steps = [{"blobs": {"input": own, "output": shared}}, '{"blobs": {}}', None]
+    layer = FakeDataLayer(store, steps, referenced=[shared])
+    await layer.delete_thread("thread")
+    assert await store.get(own) is None
+    assert await store.get(shared) == b"shared"
+
+
+async def test_delete_thread_keeps_blobs_when_references_cannot_be_checked(store):
+    key = await store.put(b"own")
+
+    class Failing(FakeDataLayer):
+        async def execute_sql(self, query: str, parameters: dict):
+            if "jsonb_each_text" in query:
+                return None
+            return await super().execute_sql(query, parameters)
+
+    await Failing(store, [{"blobs": {"output": key}}], referenced=[]).delete_thread("thread")
+    assert await store.get(key) == b"own"
@@ -0,0 +1,60 @@
+import asyncio
+
+from chainlit_app.coalescer import TokenCoalescer
+
+
+class Sink:
+    def __init__(self):
+        self.frames = []
+
+    async def __call__(self, text: str):
+        self.frames.append(text)
+
+
+async def test_first_token_is_sent_immediately():
+    sink = Sink()
+    coalescer = TokenCoalescer(sink, window_ms=1000)
+    await coalescer.push("Hello")
+    assert sink.frames == ["Hello"]
+
+
+async def test_tokens_within_the_window_share_one_frame():
+    sink = Sink()
+    coalescer = TokenCoalescer(sink, window_ms=20)
+    for token in ("a", "b", "c", "d"):
+        await coalescer.push(token)
+    assert sink.frames == ["a"]
+    await asyncio.sleep(0.05)
+    assert sink.frames == ["a", "bcd"]
+    assert (coalescer.tokens, coalescer.frames) == (4, 2)
+
+
+async def test_size_limit_flushes_before_the_window():
+    sink = Sink()
+    coalescer = TokenCoalescer(sink, window_ms=1000, max_bytes=4)
+    for token in ("a", "bb", "cc", "d"):
+        await coalescer.push(token)
+    assert sink.frames == ["a", "bbcc"]
+    await coalescer.close()
+    assert sink.frames == ["a", "bbcc", "d"]
+
+
+async def test_close_sends_the_rest_without_waiting_for_the_timer():
+    sink = Sink()
+    coalescer = TokenCoalescer(sink, window_ms=1000)
+    for token in ("a", "b", "c"):
+        await coalescer.push(token)
+    await coalescer.close()
+    assert sink.frames == ["a", "bc"]
+    # The cancelled timer sends nothing more
+    await asyncio.sleep(0)
+    assert sink.frames == ["a", "bc"]
+    assert "".join(sink.frames) == "abc"
+
+
+async def test_no_window_sends_every_token():
+    sink = Sink()
+    coalescer = TokenCoalescer(sink, window_ms=0)
+    for token in ("a", "", "b"):
+        await coalescer.push(token)
+    assert sink.frames == ["a", "b"]
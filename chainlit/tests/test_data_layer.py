@@ -0,0 +1,333 @@
+import asyncio
+import uuid
+from datetime import datetime, timedelta, timezone
+
+import chainlit as cl
+import init_db
+import pytest
+from chainlit.types import Pagination, ThreadFilter
+
+from chainlit_app.blob_store import LocalBlobStore
+from chainlit_app.data_layer import THREAD_INSERT, BatchingDataLayer, CachedDataLayer, PostgresDataLayer
+
+
+def timestamp(offset: float = 0) -> str:
+    return (datetime.now(timezone.utc) + timedelta(seconds=offset)).replace(tzinfo=None).isoformat() + "Z"
+
+
+def step(thread_id: str, output: str = "hello", **fields) -> dict:
+    return {
+        "id": str(uuid.uuid4()),
+        "threadId": thread_id,
+        "name": "assistant",
+        "type": "assistant_message",
+        "streaming": False,
+        "output": output,
+        "createdAt": timestamp(),
+        **fields,
+    }
+
+
+async def new_user(layer, identifier: str = "alice") -> str:
+    return (await layer.create_user(cl.User(identifier=identifier))).id
+
+
+async def new_thread(layer, user_id: str, name: str = "") -> str:
+    thread_id = str(uuid.uuid4())
+    await layer.update_thread(thread_id, name=name or thread_id, user_id=user_id)
+    return thread_id
+
+
+def stored_steps(cursor, thread_id: str) -> dict:
+    cursor.execute('SELECT "id"::text, "output", "metadata" FROM steps WHERE "threadId" = %s', (thread_id,))
+    return {row[0]: (row[1], row[2]) for row in cursor.fetchall()}
+
+
+class FailingBlobStore(LocalBlobStore):
+    async def put(self, data: bytes) -> str:
+        raise OSError("disk full")
+
+
+async def listed(layer, user_id: str, first: int = 20) -> list:
+    ids, cursor = [], None
+    while True:
+        page = await layer.list_threads(Pagination(first=first, cursor=cursor), ThreadFilter(userId=user_id))
+        ids.extend(thread["id"] for thread in page.data)
+        if not page.pageInfo.hasNextPage:
+            return ids
+        cursor = page.pageInfo.endCursor
+
+
+async def test_threads_are_listed_by_latest_step(make_layer, migrated_db):
+    layer = make_layer(PostgresDataLayer)
+    user_id = await new_user(layer)
+    first, second, third = [await new_thread(layer, user_id) for _ in range(3)]
+    for thread_id in (first, second, third, first):
+        await layer.create_step(step(thread_id))
+    # Newer Chainlit versions only write createdAt for new threads; listing must not rely on it
+    migrated_db.execute("UPDATE threads SET \"createdAt\" = now() - interval '1 day'")
+
+    assert await listed(layer, user_id) == [first, third, second]
+    assert await listed(layer, user_id, first=1) == [first, third, second]
+
+
+async def test_step_updates_do_not_count_as_activity(make_layer):
+    layer = make_layer(PostgresDataLayer)
+    user_id = await new_user(layer)
+    older, newer = [await new_thread(layer, user_id) for _ in range(2)]
+    answer = step(older)
+    await layer.create_step(answer)
+    await layer.create_step(step(newer))
+    await layer.update_step({**answer, "output": "edited"})
+
+    assert await listed(layer, user_id) == [newer, older]
+
+
+async def test_activity_backfill_uses_the_newest_step(make_layer, migrated_db):
+    layer = make_layer(PostgresDataLayer)
+    user_id = await new_user(layer)
+    thread_id = await new_thread(layer, user_id)
+    await layer.create_step(step(thread_id, createdAt="2024-05-01T10:00:00Z"))
+    await layer.create_step(step(thread_id, createdAt="2024-05-02T10:00:00Z"))
+    migrated_db.execute('UPDATE threads SET "updatedAt" = NULL')
+
+    init_db.AddThreadActivity().apply(migrated_db)
+
+    migrated_db.execute('SELECT "updatedAt" FROM threads WHERE "id" = %s', (thread_id,))
+    assert migrated_db.fetchone()[0] == datetime(2024, 5, 2, 10, tzinfo=timezone.utc)
+
+
+async def test_batching_merges_updates_of_a_buffered_step(make_layer, migrated_db):
+    layer = make_layer(BatchingDataLayer, batch_size=100)
+    user_id = await new_user(layer)
+    thread_id = await new_thread(layer, user_id)
+    answer = step(thread_id, output="Hel", metadata={"model": "m"})
+    await layer.create_step(answer)
+    await layer.update_step({**answer, "output": "Hello", "metadata": None})
+
+    assert layer.merged == 1
+    assert len(layer._pending[thread_id].steps) == 1
+    await layer.flush(thread_id)
+    assert stored_steps(migrated_db, thread_id) == {answer["id"]: ("Hello", {"model": "m"})}
+
+
+async def test_flush_creates_the_thread_once_without_reading_it(make_layer, migrated_db):
+    layer = make_layer(BatchingDataLayer, batch_size=100)
+    user_id = await new_user(layer)
+    thread_id = str(uuid.uuid4())
+    steps = [step(thread_id, output=f"part {i}") for i in range(5)]
+    for step_dict in steps:
+        await layer.create_step(step_dict)
+    pending = layer._pending[thread_id]
+    issued = []
+    execute_sql = layer.execute_sql
+
+    async def record(query, parameters):
+        issued.append(query)
+        return await execute_sql(query, parameters)
+
+    layer.execute_sql = record
+    writes = await layer._collect(thread_id, pending)
+    assert [query for query, _ in writes].count(THREAD_INSERT) == 1
+    assert issued == []
+
+    layer._pending[thread_id] = pending
+    await layer.flush(thread_id)
+    assert set(stored_steps(migrated_db, thread_id)) == {s["id"] for s in steps}
+    await layer.update_thread(thread_id, user_id=user_id)
+    assert await listed(layer, user_id) == [thread_id]
+
+
+async def test_full_batch_is_flushed(make_layer, migrated_db):
+    layer = make_layer(BatchingDataLayer, batch_size=3)
+    thread_id = str(uuid.uuid4())
+    for i in range(3):
+        await layer.create_step(step(thread_id, output=f"part {i}"))
+
+    assert thread_id not in layer._pending
+    assert len(stored_steps(migrated_db, thread_id)) == 3
+
+
+async def test_reads_flush_buffered_steps_first(make_layer):
+    layer = make_layer(BatchingDataLayer, batch_size=100)
+    user_id = await new_user(layer)
+    thread_id = await new_thread(layer, user_id)
+    answer = step(thread_id, output="buffered")
+    await layer.create_step(answer)
+
+    thread = await layer.get_thread(thread_id)
+    assert [s["output"] for s in thread["steps"]] == ["buffered"]
+    steps, _ = await layer.list_thread_steps(thread_id)
+    assert [s["id"] for s in steps] == [answer["id"]]
+    assert thread_id not in layer._pending
+
+
+async def test_failed_batch_is_written_row_by_row(make_layer, migrated_db):
+    layer = make_layer(BatchingDataLayer, batch_size=100)
+    thread_id = str(uuid.uuid4())
+    good = step(thread_id)
+    await layer.create_step(good)
+    await layer.create_step(step(thread_id, parentId="not-a-uuid"))
+
+    await layer.flush(thread_id)
+
+    assert layer.fallbacks == 1
+    assert set(stored_steps(migrated_db, thread_id)) == {good["id"]}
+
+
+async def test_failed_offload_keeps_the_step_inline(make_layer, migrated_db, tmp_path):
+    layer = make_layer(BatchingDataLayer, blob_store=FailingBlobStore(str(tmp_path)), offload_threshold=10)
+    thread_id = str(uuid.uuid4())
+    answer = step(thread_id, output="x" * 100)
+    await layer.create_step(answer)
+    await layer.create_step(step(thread_id))
+
+    await layer.flush(thread_id)
+
+    assert layer.offload_failures == 1
+    assert (stored_steps(migrated_db, thread_id))[answer["id"]][0] == "x" * 100
+
+
+async def test_batch_that_cannot_be_built_is_requeued(make_layer, migrated_db):
+    layer = make_layer(BatchingDataLayer, batch_size=100)
+    thread_id = str(uuid.uuid4())
+    broken = step(thread_id, metadata={"not json": object()})
+    later = step(thread_id, output="later")
+    await layer.create_step(broken)
+    offload_step = layer.offload_step
+
+    async def buffer_during_flush(step_dict):
+        if step_dict["id"] == broken["id"]:
+            await layer.create_step(later)
+        return await offload_step(step_dict)
+
+    layer.offload_step = buffer_during_flush
+    with pytest.raises(TypeError):
+        await layer.flush(thread_id)
+    assert list(layer._pending[thread_id].steps) == [broken["id"], later["id"]]
+
+    layer.offload_step = offload_step
+    await layer.update_step({**broken, "metadata": {"fixed": True}})
+    await layer.flush(thread_id)
+    assert set(stored_steps(migrated_db, thread_id)) == {broken["id"], later["id"]}
+
+
+async def eventually(condition, timeout: float = 5):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not condition():
+        assert asyncio.get_running_loop().time() < deadline, "condition not met in time"
+        await asyncio.sleep(0.02)
+
+
+async def test_step_writes_invalidate_the_cached_thread(make_layer):
+    layer = make_layer(CachedDataLayer)
+    user_id = await new_user(layer)
+    thread_id = await new_thread(layer, user_id)
+    await layer.create_step(step(thread_id, output="first"))
+
+    assert [s["output"] for s in (await layer.get_thread(thread_id))["steps"]] == ["first"]
+    await layer.get_thread(thread_id)
+    assert layer.stats()["read_cache"]["threads"]["hits"] == 1
+
+    await layer.create_step(step(thread_id, output="second"))
+    assert [s["output"] for s in (await layer.get_thread(thread_id))["steps"]] == ["first", "second"]
+
+
+async def test_writes_in_one_worker_invalidate_the_other(make_layer):
+    writer = make_layer(CachedDataLayer, channel="test_read_cache")
+    reader = make_layer(CachedDataLayer, channel="test_read_cache")
+    user_id = await new_user(writer)
+    thread_id = await new_thread(writer, user_id)
+    await reader.get_thread(thread_id)
+    await eventually(lambda: writer._listening and reader._listening)
+    await reader.get_thread(thread_id)
+    assert len(reader._caches["threads"]) == 1
+
+    await writer.create_step(step(thread_id, output="from the other worker"))
+
+    await eventually(lambda: len(reader._caches["threads"]) == 0)
+    assert [s["output"] for s in (await reader.get_thread(thread_id))["steps"]] == ["from the other worker"]
+
+
+async def search_all(layer, user_id: str, query: str, limit: int) -> list:
+    rows, cursor = [], None
+    for _ in range(100):
+        page, cursor = await layer.search_threads(user_id, query, limit=limit, cursor=cursor)
+        rows.extend(page)
+        if cursor is None:
+            return rows
+    raise AssertionError("search kept returning more pages")
+
+
+async def test_search_returns_the_best_match_per_thread(make_layer):
+    layer = make_layer(PostgresDataLayer)
+    user_id = await new_user(layer)
+    named = await new_thread(layer, user_id, name="Kubernetes upgrade plan")
+    discussed = await new_thread(layer, user_id, name="Misc")
+    await layer.create_step(step(discussed, output="We talked about the weather."))
+    best = step(discussed, output="Draining nodes before the kubernetes upgrade avoids downtime.")
+    await layer.create_step(best)
+    other_user = await new_user(layer, "bob")
+    await layer.create_step(step(await new_thread(layer, other_user), output="kubernetes upgrade"))
+
+    rows = await search_all(layer, user_id, "kubernetes upgrade", limit=10)
+
+    assert [row["threadId"] for row in rows] == [named, discussed]
+    assert rows[0]["stepId"] is None
+    assert rows[1]["stepId"] == best["id"]
+    assert "**kubernetes**" in rows[1]["snippet"].lower()
+
+
+async def test_search_pages_by_rank_and_thread_without_repeats(make_layer):
+    layer = make_layer(PostgresDataLayer)
+    user_id = await new_user(layer)
+    threads = [await new_thread(layer, user_id, name="Misc") for _ in range(7)]
+    # Equal ranks: pages must break ties by thread id to neither skip nor repeat a thread
+    for thread_id in threads:
+        await layer.create_step(step(thread_id, output="quarterly revenue report"))
+    await layer.create_step(step(threads[3], output="revenue report, revenue report, revenue report"))
+
+    rows = await search_all(layer, user_id, "revenue report", limit=2)
+
+    assert [row["threadId"] for row in rows] == [threads[3]] + sorted(t for t in threads if t != threads[3])
+
+
+async def test_search_finds_edited_steps_only_by_their_new_text(make_layer):
+    layer = make_layer(PostgresDataLayer)
+    user_id = await new_user(layer)
+    thread_id = await new_thread(layer, user_id, name="Misc")
+    answer = step(thread_id, output="first draft about penguins")
+    await layer.create_step(answer)
+    await layer.update_step({**answer, "output": "final answer about giraffes"})
+
+    assert await search_all(layer, user_id, "penguins", limit=5) == []
+    assert [row["stepId"] for row in await search_all(layer, user_id, "giraffes", limit=5)] == [answer["id"]]
+
+
+async def test_search_vector_migration_backfills_existing_rows(make_layer, migrated_db):
+    layer = make_layer(PostgresDataLayer)
+    user_id = await new_user(layer)
+    thread_id = await new_thread(layer, user_id, name="Holiday planning")
+    await layer.create_step(step(thread_id, output="Flights to Lisbon in May"))
+    # As if the rows predated migration 4
+    migrated_db.execute('UPDATE steps SET "searchVector" = NULL')
+    migrated_db.execute('UPDATE threads SET "searchVector" = NULL')
+
+    for table, column in init_db.SEARCH_COLUMNS:
+        init_db.AddSearchVector(table, column).apply(migrated_db)
+
+    migrated_db.execute('SELECT count(*) FROM steps WHERE "searchVector" IS NULL')
+    assert migrated_db.fetchone()[0] == 0
+    assert len(await search_all(layer, user_id, "lisbon", limit=5)) == 1
+    assert len(await search_all(layer, user_id, "holiday", limit=5)) == 1
+
+
+async def test_thread_list_search_filter(make_layer):
+    layer = make_layer(PostgresDataLayer)
+    user_id = await new_user(layer)
+    match = await new_thread(layer, user_id, name="Misc")
+    await layer.create_step(step(match, output="notes on espresso machines"))
+    await layer.create_step(step(await new_thread(layer, user_id, name="Misc"), output="tea"))
+
+    page = await layer.list_threads(Pagination(first=10), ThreadFilter(userId=user_id, search="espresso"))
+    assert [thread["id"] for thread in page.data] == [match]
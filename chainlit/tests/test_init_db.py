@@ -0,0 +1,61 @@
+import re
+import uuid
+
+import init_db
+import pytest
+
+from conftest import TEST_DATABASE_URL
+
+
+def insert_threads(cursor, count: int) -> list:
+    ids = sorted(str(uuid.uuid4()) for _ in range(count))
+    for thread_id in ids:
+        cursor.execute('INSERT INTO threads ("id", "name") VALUES (%s, %s)', (thread_id, f"thread {thread_id}"))
+    return ids
+
+
+@pytest.fixture
+def small_batches(monkeypatch):
+    monkeypatch.setattr(init_db, "BACKFILL_BATCH_SIZE", 2)
+    monkeypatch.setattr(init_db, "BACKFILL_PAUSE", 0)
+
+
+def test_backfill_walks_the_table_in_keyset_batches(migrated_db, small_batches, capsys):
+    insert_threads(migrated_db, 5)
+    migrated_db.execute("UPDATE threads SET \"tags\" = NULL")
+
+    init_db.Backfill("threads", "\"tags\" = ARRAY['done']", '"tags" IS NULL').apply(migrated_db)
+
+    migrated_db.execute("SELECT count(*) FROM threads WHERE \"tags\" = ARRAY['done']")
+    assert migrated_db.fetchone()[0] == 5
+    assert re.findall(r"threads: (\d+) rows", capsys.readouterr().out) == ["2", "4", "5"]
+
+
+def test_backfill_terminates_when_rows_still_match(migrated_db, small_batches):
+    # Each row is visited once even when the assignment leaves it matching the condition
+    insert_threads(migrated_db, 5)
+
+    init_db.Backfill("threads", '"name" = "name"', "true").apply(migrated_db)
+
+
+def test_backfill_retries_a_batch_that_hits_lock_timeout(migrated_db, small_batches, monkeypatch):
+    psycopg2 = pytest.importorskip("psycopg2")
+    ids = insert_threads(migrated_db, 3)
+    monkeypatch.setattr(init_db, "LOCK_TIMEOUT", "50ms")
+    holder = psycopg2.connect(re.sub(r"^postgresql\+\w+://", "postgresql://", TEST_DATABASE_URL))
+    holder.cursor().execute('SELECT 1 FROM threads WHERE "id" = %s FOR UPDATE', (ids[0],))
+    sleeps = []
+
+    def release(seconds):
+        sleeps.append(seconds)
+        holder.rollback()
+
+    monkeypatch.setattr(init_db.time, "sleep", release)
+    try:
+        init_db.Backfill("threads", "\"tags\" = ARRAY['done']", '"tags" IS NULL').apply(migrated_db)
+    finally:
+        holder.close()
+
+    assert sleeps[0] == 1
+    migrated_db.execute("SELECT count(*) FROM threads WHERE \"tags\" = ARRAY['done']")
+    assert migrated_db.fetchone()[0] == 3
@@ -0,0 +1,107 @@
+import json
+
+import pytest
+
+from chainlit_app.ndjson import NDJSONEventParser, iter_events, orjson, stdlib_loads
+
+LOADS = [pytest.param(stdlib_loads, id="json")]
+if orjson is not None:
+    LOADS.append(pytest.param(orjson.loads, id="orjson"))
+
+
+def line(event: str, **data) -> bytes:
+    return json.dumps({"event": event, "data": data}, ensure_ascii=False).encode() + b"\n"
+
+
+def parse(chunks, events=None, loads=stdlib_loads) -> list:
+    parser = NDJSONEventParser(events=events, loads=loads)
+    result = []
+    for chunk in chunks:
+        result.extend(parser.feed(chunk))
+    result.extend(parser.finish())
+    return result
+
+
+def every_split(data: bytes):
+    for cut in range(1, len(data)):
+        yield [data[:cut], data[cut:]]
+
+
+@pytest.mark.parametrize("loads", LOADS)
+def test_split_inside_a_line(loads):
+    stream = line("token", chunk="hello ") + b"\n" + line("end", result={"ok": True})
+    for chunks in every_split(stream):
+        assert parse(chunks, loads=loads) == [
+            {"event": "token", "data": {"chunk": "hello "}},
+            {"event": "end", "data": {"result": {"ok": True}}},
+        ]
+
+
+@pytest.mark.parametrize("loads", LOADS)
+def test_split_inside_a_multibyte_character(loads):
+    stream = line("token", chunk="héllo 🌍 世界")
+    for chunks in every_split(stream):
+        assert parse(chunks, loads=loads) == [{"event": "token", "data": {"chunk": "héllo 🌍 世界"}}]
+
+
+def test_one_byte_at_a_time():
+    stream = line("token", chunk="a") + line("add_message", text="ü") + line("token", chunk="b")
+    events = parse([stream[i:i + 1] for i in range(len(stream))])
+    assert [e["event"] for e in events] == ["token", "add_message", "token"]
+
+
+def test_trailing_data_without_final_newline():
+    stream = line("token", chunk="a") + line("end", result={})[:-1]
+    assert [e["event"] for e in parse([stream])] == ["token", "end"]
+
+
+def test_incomplete_trailing_data_is_counted_as_error():
+    parser = NDJSONEventParser()
+    events = list(parser.feed(line("token", chunk="a") + b'{"event": "end", "da'))
+    events.extend(parser.finish())
+    assert [e["event"] for e in events] == ["token"]
+    assert parser.errors == 1
+
+
+def test_malformed_lines_are_skipped():
+    stream = b"".join([
+        b"not json\n",
+        line("token", chunk="a"),
+        b'{"event": "token", "data": \n',
+        b"[1, 2, 3]\n",
+        b'{"event": "token", "data": {}} trailing\n',
+        b'{"event": "token"}\n',
+        b'{"data": {"chunk": "x"}}\n',
+        b"   \r\n",
+        line("token", chunk="b"),
+    ])
+    parser = NDJSONEventParser()
+    events = list(parser.feed(stream)) + list(parser.finish())
+    assert [e["data"]["chunk"] for e in events] == ["a", "b"]
+    assert parser.errors == 4
+
+
+def test_crlf_and_blank_lines():
+    stream = line("token", chunk="a")[:-1] + b"\r\n\r\n\n" + line("token", chunk="b")
+    assert [e["data"]["chunk"] for e in parse([stream])] == ["a", "b"]
+
+
+def test_event_filter_uses_the_top_level_event():
+    stream = (
+        line("token", chunk="a")
+        + line("add_message", text="big", blocks=[{"event": "token"}])
+        + b'{"data": {"event": "token"}, "event": "end"}\n'
+    )
+    parser = NDJSONEventParser(events={"token"})
+    events = list(parser.feed(stream)) + list(parser.finish())
+    assert [e["event"] for e in events] == ["token"]
+    assert parser.skipped == 2
+
+
+async def test_iter_events():
+    async def chunks():
+        stream = line("token", chunk="a") + line("end", result={})
+        for i in range(0, len(stream), 7):
+            yield stream[i:i + 7]
+
+    assert [e["event"] async for e in iter_events(chunks())] == ["token", "end"]
@@ -0,0 +1,130 @@
+import asyncio
+import copy
+
+from chainlit_app.data_layer import ReadCacheMixin
+
+
+class MemoryLayer:
+    # Stands in for the SQL layer: threads in a dict, reads can be held open to interleave a write
+    def __init__(self, *args, **kwargs):
+        self.threads = {}
+        self.reads = 0
+        self.hold: asyncio.Event | None = None
+        self.reading = asyncio.Event()
+
+    async def get_thread(self, thread_id: str):
+        self.reads += 1
+        value = copy.deepcopy(self.threads.get(thread_id))
+        self.reading.set()
+        if self.hold is not None:
+            await self.hold.wait()
+        return value
+
+    async def update_thread(self, thread_id: str, name=None, user_id=None, metadata=None, tags=None):
+        self.threads.setdefault(thread_id, {"id": thread_id})["name"] = name
+
+    async def execute_sql(self, query: str, parameters: dict):
+        return []
+
+    async def close(self):
+        pass
+
+    def stats(self) -> dict:
+        return {}
+
+
+class CachedMemoryLayer(ReadCacheMixin, MemoryLayer):
+    pass
+
+
+async def test_reads_are_cached_until_a_write():
+    layer = CachedMemoryLayer()
+    await layer.update_thread("t1", name="first")
+
+    assert (await layer.get_thread("t1"))["name"] == "first"
+    assert (await layer.get_thread("t1"))["name"] == "first"
+    assert layer.reads == 1
+
+    await layer.update_thread("t1", name="second")
+    assert (await layer.get_thread("t1"))["name"] == "second"
+    assert layer.reads == 2
+    assert layer.stats()["read_cache"]["threads"]["invalidations"] == 2
+
+
+async def test_cached_values_are_copies():
+    layer = CachedMemoryLayer()
+    await layer.update_thread("t1", name="first")
+
+    (await layer.get_thread("t1"))["name"] = "changed by caller"
+    assert (await layer.get_thread("t1"))["name"] == "first"
+
+
+async def test_load_racing_a_write_is_not_cached():
+    layer = CachedMemoryLayer()
+    await layer.update_thread("t1", name="stale")
+    layer.hold = asyncio.Event()
+    load = asyncio.create_task(layer.get_thread("t1"))
+    await layer.reading.wait()
+
+    # The write lands while the read that saw the old row is still in flight
+    await layer.update_thread("t1", name="fresh")
+    layer.hold.set()
+    assert (await load)["name"] == "stale"
+
+    layer.hold = None
+    assert (await layer.get_thread("t1"))["name"] == "fresh"
+    assert layer.reads == 2
+
+
+async def test_remote_clear_during_a_load_is_not_cached():
+    layer = CachedMemoryLayer()
+    await layer.update_thread("t1", name="stale")
+    layer.hold = asyncio.Event()
+    load = asyncio.create_task(layer.get_thread("t1"))
+    await layer.reading.wait()
+
+    layer._on_notify(None, 0, "cache", "other-worker\nthreads|*")
+    await asyncio.sleep(0)
+    layer.hold.set()
+    await load
+
+    layer.hold = None
+    await layer.get_thread("t1")
+    assert layer.reads == 2
+
+
+async def test_cache_is_bypassed_while_the_listener_is_down(monkeypatch):
+    connected = asyncio.Event()
+
+    async def listen(self):
+        # Stays "connecting" until the test lets it through
+        await connected.wait()
+        self._listening = True
+        await asyncio.Event().wait()
+
+    monkeypatch.setattr(CachedMemoryLayer, "_listen", listen)
+    layer = CachedMemoryLayer(channel="cache")
+    await layer.update_thread("t1", name="first")
+
+    await layer.get_thread("t1")
+    await layer.get_thread("t1")
+    assert layer.reads == 2
+    assert len(layer._caches["threads"]) == 0
+
+    connected.set()
+    await asyncio.sleep(0)
+    await layer.get_thread("t1")
+    await layer.get_thread("t1")
+    assert layer.reads == 3
+    await layer.close()
+
+
+async def test_notifications_from_this_worker_are_ignored():
+    layer = CachedMemoryLayer()
+    await layer.update_thread("t1", name="first")
+    await layer.get_thread("t1")
+
+    layer._on_notify(None, 0, "cache", f"{layer._origin}\nthreads|t1")
+    await asyncio.sleep(0)
+    await layer.get_thread("t1")
+    assert layer.reads == 1
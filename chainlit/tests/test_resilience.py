@@ -0,0 +1,154 @@
+import asyncio
+import time
+from email.utils import formatdate
+
+import httpx
+import pytest
+
+from chainlit_app import resilience as resilience_module
+from chainlit_app.resilience import CircuitOpenError, RateLimitError, Resilience, TokenBucket, parse_retry_after
+
+RESET = 0.05
+
+
+@pytest.fixture
+def resilience(monkeypatch):
+    monkeypatch.setattr(resilience_module, "LANGFLOW_BREAKER_FAILURES", 2)
+    monkeypatch.setattr(resilience_module, "LANGFLOW_BREAKER_RESET", RESET)
+    monkeypatch.setattr(resilience_module, "backoff_delay", lambda attempt: 0.0)
+    return Resilience()
+
+
+def status_error(status: int, retry_after: str = None) -> httpx.HTTPStatusError:
+    request = httpx.Request("POST", "http://langflow/api/v1/run/flow")
+    headers = {"Retry-After": retry_after} if retry_after is not None else {}
+    response = httpx.Response(status, headers=headers, request=request)
+    return httpx.HTTPStatusError(f"{status}", request=request, response=response)
+
+
+async def connect_error():
+    raise httpx.ConnectError("connection refused")
+
+
+async def ok():
+    return "ok"
+
+
+async def test_breaker_opens_goes_half_open_and_closes(resilience):
+    for _ in range(2):
+        with pytest.raises(httpx.ConnectError):
+            await resilience.call("run", connect_error, max_retries=0)
+    assert resilience.breaker("run").state == "open"
+
+    calls = []
+
+    async def tracked():
+        calls.append(1)
+        return "ok"
+
+    with pytest.raises(CircuitOpenError):
+        await resilience.call("run", tracked, max_retries=0)
+    assert calls == []
+
+    await asyncio.sleep(RESET * 1.2)
+    probe_started, finish_probe = asyncio.Event(), asyncio.Event()
+
+    async def probe():
+        probe_started.set()
+        await finish_probe.wait()
+        return "probe"
+
+    probe_task = asyncio.create_task(resilience.call("run", probe, max_retries=0))
+    await probe_started.wait()
+    assert resilience.breaker("run").state == "half_open"
+    # Only the probe goes through while half open
+    with pytest.raises(CircuitOpenError):
+        await resilience.call("run", tracked, max_retries=0)
+
+    finish_probe.set()
+    assert await probe_task == "probe"
+    assert resilience.breaker("run").state == "closed"
+    assert await resilience.call("run", tracked, max_retries=0) == "ok"
+    assert resilience.stats()["endpoints"]["run"]["rejected"] == 2
+
+
+async def test_failed_probe_reopens_the_breaker(resilience):
+    for _ in range(2):
+        with pytest.raises(httpx.ConnectError):
+            await resilience.call("run", connect_error, max_retries=0)
+    await asyncio.sleep(RESET * 1.2)
+    with pytest.raises(httpx.ConnectError):
+        await resilience.call("run", connect_error, max_retries=0)
+    assert resilience.breaker("run").state == "open"
+    with pytest.raises(CircuitOpenError):
+        await resilience.call("run", ok, max_retries=0)
+
+
+async def test_client_errors_do_not_open_the_breaker(resilience):
+    async def not_found():
+        raise status_error(404)
+
+    for _ in range(3):
+        with pytest.raises(httpx.HTTPStatusError):
+            await resilience.call("run", not_found)
+    assert resilience.breaker("run").state == "closed"
+
+
+async def test_retry_after_pauses_and_refills_the_bucket():
+    bucket = TokenBucket(rate=20, burst=5)
+    for _ in range(5):
+        await bucket.acquire()
+    bucket.throttled(0.1)
+    assert bucket.rate == 10
+    assert bucket.tokens == 0
+
+    started = time.monotonic()
+    await bucket.acquire()
+    assert time.monotonic() - started >= 0.1
+    # Tokens accrue during the pause at the reduced rate: one per 0.1 s, capped at the burst
+    await asyncio.sleep(0.3)
+    bucket._refill(time.monotonic())
+    assert 2 <= bucket.tokens <= bucket.burst
+    await asyncio.sleep(0.5)
+    bucket._refill(time.monotonic())
+    assert bucket.tokens == bucket.burst
+
+
+async def test_successes_restore_the_rate_after_throttling():
+    bucket = TokenBucket(rate=20, burst=5)
+    bucket.throttled(0)
+    assert bucket.rate == 10
+    for _ in range(20):
+        bucket.succeeded()
+    assert bucket.rate == 20
+
+
+async def test_429_waits_for_retry_after_then_retries(resilience):
+    attempts = []
+
+    async def limited_once():
+        attempts.append(time.monotonic())
+        if len(attempts) == 1:
+            raise status_error(429, "0.1")
+        return "ok"
+
+    assert await resilience.call("run", limited_once, max_retries=2) == "ok"
+    assert attempts[1] - attempts[0] >= 0.1
+    assert resilience.breaker("run").state == "closed"
+    assert resilience.stats()["endpoints"]["run"]["retries"] == 1
+
+
+async def test_429_after_last_retry_raises_rate_limit_error(resilience):
+    async def limited():
+        raise status_error(429, "0")
+
+    with pytest.raises(RateLimitError):
+        await resilience.call("run", limited, max_retries=1)
+
+
+def test_parse_retry_after():
+    assert parse_retry_after("3") == 3.0
+    assert parse_retry_after("-1") == 0.0
+    assert 0 < parse_retry_after(formatdate(time.time() + 30, usegmt=True)) <= 30
+    assert parse_retry_after("soon") is None
+    assert parse_retry_after(None) is None
@@ -0,0 +1,55 @@
+import pytest
+
+from chainlit_app.cache import MemoryCache
+from chainlit_app.response_cache import ResponseCache, response_cache_key
+
+EVENTS = [
+    {"event": "token", "data": {"chunk": "Hi"}},
+    {"event": "end", "data": {"result": {}}},
+]
+
+
+def recorded(events, fail: bool = False):
+    runs = []
+
+    async def produce():
+        runs.append(1)
+        for event in events:
+            yield event
+        if fail:
+            raise RuntimeError("stream broke")
+
+    return produce, runs
+
+
+async def collect(cache: ResponseCache, key: str, produce) -> list:
+    return [event async for event in cache.stream(key, produce)]
+
+
+def test_key_ignores_session_fields_but_not_other_tweaks():
+    def key(session_id, sender_name="alice", temperature=0.1):
+        tweaks = {"ChatInput": {"session_id": session_id, "sender_name": sender_name, "temperature": temperature}}
+        return response_cache_key("flow", "  What is  Langflow? ", None, tweaks)
+
+    assert key("s1") == key("s2", sender_name="bob")
+    assert key("s1") != key("s1", temperature=0.9)
+
+
+async def test_complete_run_is_replayed():
+    cache = ResponseCache(MemoryCache())
+    produce, runs = recorded(EVENTS)
+    assert await collect(cache, "k", produce) == EVENTS
+    assert await collect(cache, "k", produce) == EVENTS
+    assert len(runs) == 1
+    assert cache.stats()["hits"] == 1
+
+
+async def test_incomplete_runs_are_not_stored():
+    cache = ResponseCache(MemoryCache())
+    produce, runs = recorded(EVENTS[:1])
+    await collect(cache, "k", produce)
+    failing, _ = recorded(EVENTS, fail=True)
+    with pytest.raises(RuntimeError):
+        await collect(cache, "k2", failing)
+    assert cache.stats()["stored"] == 0
+    assert len(cache.backend) == 0
@@ -0,0 +1,122 @@
+import asyncio
+import contextvars
+
+import pytest
+
+from chainlit_app.scheduler import FairScheduler
+
+# Stands in for Chainlit's per-session context, which Message.update() reads from the current task
+session = contextvars.ContextVar("session")
+
+
+async def wait_until(predicate):
+    for _ in range(100):
+        if predicate():
+            return
+        await asyncio.sleep(0)
+    raise AssertionError("condition not reached")
+
+
+def run_session(scheduler: FairScheduler, name: str, user: str, updates: dict, release: asyncio.Event):
+    async def on_queued(position: int):
+        updates[name].append((session.get(), position))
+
+    async def run():
+        session.set(name)
+        async with scheduler.slot(user, on_queued):
+            await release.wait()
+
+    updates[name] = []
+    return asyncio.create_task(run())
+
+
+async def test_each_session_only_receives_its_own_updates():
+    scheduler = FairScheduler(max_concurrent=1)
+    release = {name: asyncio.Event() for name in ("active", "a", "b")}
+    updates = {}
+    active = run_session(scheduler, "active", "carol", updates, release["active"])
+    await wait_until(lambda: scheduler.active == 1)
+    a = run_session(scheduler, "a", "alice", updates, release["a"])
+    await wait_until(lambda: updates["a"])
+    b = run_session(scheduler, "b", "bob", updates, release["b"])
+    await wait_until(lambda: updates["b"])
+
+    release["active"].set()
+    await active
+    await wait_until(lambda: updates["b"][-1][1] == 1)
+    release["a"].set()
+    await a
+    release["b"].set()
+    await b
+
+    assert updates["active"] == []
+    assert updates["a"] == [("a", 1), ("a", 0)]
+    assert updates["b"] == [("b", 2), ("b", 1), ("b", 0)]
+
+
+async def test_users_are_served_round_robin():
+    scheduler = FairScheduler(max_concurrent=1)
+    order = []
+    gate = asyncio.Event()
+
+    async def run(user: str, label: str):
+        async with scheduler.slot(user):
+            order.append(label)
+            await gate.wait()
+
+    first = asyncio.create_task(run("alice", "a0"))
+    await wait_until(lambda: scheduler.active == 1)
+    tasks = [asyncio.create_task(run(user, label)) for user, label in (("alice", "a1"), ("alice", "a2"), ("bob", "b1"))]
+    await wait_until(lambda: scheduler.queue_depth == 3)
+    gate.set()
+    await asyncio.gather(first, *tasks)
+    assert order == ["a0", "a1", "b1", "a2"]
+
+
+async def test_cancelled_waiter_leaves_the_queue_and_others_move_up():
+    scheduler = FairScheduler(max_concurrent=1)
+    release = {name: asyncio.Event() for name in ("active", "a", "b")}
+    updates = {}
+    active = run_session(scheduler, "active", "carol", updates, release["active"])
+    await wait_until(lambda: scheduler.active == 1)
+    a = run_session(scheduler, "a", "alice", updates, release["a"])
+    await wait_until(lambda: updates["a"])
+    b = run_session(scheduler, "b", "bob", updates, release["b"])
+    await wait_until(lambda: updates["b"])
+
+    a.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await a
+    await wait_until(lambda: updates["b"][-1][1] == 1)
+    assert scheduler.queue_depth == 1
+
+    release["active"].set()
+    release["b"].set()
+    await asyncio.gather(active, b)
+    assert updates["b"] == [("b", 2), ("b", 1), ("b", 0)]
+    assert scheduler.active == 0
+
+
+async def test_failing_callback_does_not_block_admission():
+    scheduler = FairScheduler(max_concurrent=1)
+    gate = asyncio.Event()
+
+    async def on_queued(position: int):
+        raise RuntimeError("websocket closed")
+
+    async def hold():
+        async with scheduler.slot("alice"):
+            await gate.wait()
+
+    async def queued():
+        async with scheduler.slot("bob", on_queued):
+            return True
+
+    holder = asyncio.create_task(hold())
+    await wait_until(lambda: scheduler.active == 1)
+    waiter = asyncio.create_task(queued())
+    await wait_until(lambda: scheduler.queue_depth == 1)
+    gate.set()
+    await holder
+    assert await waiter
+    assert scheduler.active == 0
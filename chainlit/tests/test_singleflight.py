@@ -0,0 +1,111 @@
+import asyncio
+
+import pytest
+
+from chainlit_app.singleflight import SingleFlight
+
+
+class Producer:
+    def __init__(self, events: int = 3):
+        self.events = events
+        self.runs = 0
+        self.closed = asyncio.Event()
+        self.release = asyncio.Event()
+
+    async def __call__(self):
+        self.runs += 1
+        try:
+            yield {"event": "token", "data": {"chunk": "0"}}
+            await self.release.wait()
+            for i in range(1, self.events):
+                yield {"event": "token", "data": {"chunk": str(i)}}
+        finally:
+            self.closed.set()
+
+
+async def consume(flight: SingleFlight, key: str, producer: Producer, received: list):
+    async for event in flight.stream(key, producer):
+        received.append(event["data"]["chunk"])
+
+
+async def wait_until(predicate):
+    for _ in range(100):
+        if predicate():
+            return
+        await asyncio.sleep(0)
+    raise AssertionError("condition not reached")
+
+
+async def test_identical_requests_share_one_run():
+    flight, producer = SingleFlight(), Producer()
+    first, second = [], []
+    tasks = [asyncio.create_task(consume(flight, "k", producer, r)) for r in (first, second)]
+    await wait_until(lambda: first and second)
+    producer.release.set()
+    await asyncio.gather(*tasks)
+    assert first == second == ["0", "1", "2"]
+    assert producer.runs == 1
+    assert flight.stats() == {"leaders": 1, "followers": 1, "in_flight": 0}
+
+
+async def test_leader_cancelled_with_remaining_subscriber():
+    flight, producer = SingleFlight(), Producer()
+    leader, follower = [], []
+    leader_task = asyncio.create_task(consume(flight, "k", producer, leader))
+    await wait_until(lambda: leader)
+    follower_task = asyncio.create_task(consume(flight, "k", producer, follower))
+    await wait_until(lambda: follower)
+
+    leader_task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await leader_task
+    assert not producer.closed.is_set()
+
+    producer.release.set()
+    await follower_task
+    assert follower == ["0", "1", "2"]
+    assert producer.runs == 1
+
+
+async def test_leader_cancelled_without_subscribers_stops_the_run():
+    flight, producer = SingleFlight(), Producer()
+    leader = []
+    leader_task = asyncio.create_task(consume(flight, "k", producer, leader))
+    await wait_until(lambda: leader)
+
+    leader_task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await leader_task
+    await asyncio.wait_for(producer.closed.wait(), 1)
+    assert flight.stats()["in_flight"] == 0
+
+
+async def test_request_after_cancellation_starts_a_new_run():
+    flight, producer = SingleFlight(), Producer()
+    leader = []
+    leader_task = asyncio.create_task(consume(flight, "k", producer, leader))
+    await wait_until(lambda: leader)
+    # The next request arrives before the cancelled run has finished unwinding
+    leader_task.cancel()
+    received = []
+    next_task = asyncio.create_task(consume(flight, "k", producer, received))
+    with pytest.raises(asyncio.CancelledError):
+        await leader_task
+    producer.release.set()
+    await next_task
+    assert received == ["0", "1", "2"]
+    assert producer.runs == 2
+
+
+async def test_producer_error_reaches_every_subscriber():
+    flight = SingleFlight()
+
+    async def failing():
+        yield {"event": "token", "data": {"chunk": "0"}}
+        await asyncio.sleep(0.01)
+        raise ValueError("boom")
+
+    results = await asyncio.gather(
+        consume(flight, "k", failing, []), consume(flight, "k", failing, []), return_exceptions=True
+    )
+    assert [type(r) for r in results] == [ValueError, ValueError]
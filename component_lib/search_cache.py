@@ -0,0 +1,218 @@
+import asyncio
+import hashlib
+import json
+import os
+import random
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Awaitable, Callable
+
+import httpx
+
+# backend_url value that answers from canned results instead of the network (tests, load runs)
+STUB_BACKEND = "stub"
+STUB_LATENCY = float(os.getenv("CACHED_SEARCH_STUB_LATENCY", "0.5"))
+DISK_CACHE_PATH = os.getenv(
+    "CACHED_SEARCH_CACHE_PATH",
+    os.path.join(os.getenv("LANGFLOW_CONFIG_DIR", "."), "search_cache.sqlite3"),
+)
+
+
+def normalize_query(query: str) -> str:
+    text = unicodedata.normalize("NFKC", query or "").casefold()
+    text = re.sub(r"[^\w\s\-+#.]", " ", text)
+    return " ".join(word.strip(".") for word in text.split() if word.strip("."))
+
+
+def search_key(backend_url: str, payload: dict) -> str:
+    # Only the key is normalized; the backend still gets the query as typed
+    normalized = {**payload, "query": normalize_query(payload.get("query", ""))}
+    return hashlib.sha256(f"{backend_url}\n{json.dumps(normalized, sort_keys=True)}".encode()).hexdigest()
+
+
+class MemoryLRU:
+    def __init__(self, max_entries: int, ttl: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, tuple[float, dict]]" = OrderedDict()
+
+    def get(self, key: str):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if self.ttl and time.time() - entry[0] > self.ttl:
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return entry[1]
+
+    def set(self, key: str, value: dict, created: float | None = None):
+        self._entries[key] = (created or time.time(), value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class DiskCache:
+    # Expiry goes by when a result was fetched, eviction by when it was last read (LRU)
+    def __init__(self, path: str, max_entries: int, ttl: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS search_cache "
+            "(key TEXT PRIMARY KEY, value TEXT NOT NULL, created REAL NOT NULL, used REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS search_cache_used ON search_cache (used)")
+
+    def get(self, key: str):
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT value, created FROM search_cache WHERE key = ?", (key,)).fetchone()
+            if row is None or (self.ttl and now - row[1] > self.ttl):
+                return None
+            self._conn.execute("UPDATE search_cache SET used = ? WHERE key = ?", (now, key))
+        return json.loads(row[0]), row[1]
+
+    def set(self, key: str, value: dict):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO search_cache (key, value, created, used) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(value), now, now),
+            )
+            if self.ttl:
+                self._conn.execute("DELETE FROM search_cache WHERE created < ?", (now - self.ttl,))
+            self._conn.execute(
+                "DELETE FROM search_cache WHERE key NOT IN "
+                "(SELECT key FROM search_cache ORDER BY used DESC LIMIT ?)",
+                (self.max_entries,),
+            )
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM search_cache").fetchone()[0]
+
+
+class SearchCache:
+    """
+    Memory LRU, optional disk tier and merging of identical in-flight searches.
+
+    One instance per configuration (see get_search_cache), shared by every run and user of the worker.
+    """
+
+    def __init__(self, max_entries: int, ttl: float, disk_path: str | None = None):
+        self.memory = MemoryLRU(max_entries, ttl)
+        self.disk = DiskCache(disk_path, max_entries * 10, ttl) if disk_path else None
+        self.inflight: dict[str, asyncio.Future] = {}
+        self.stats = {"requests": 0, "memory_hits": 0, "disk_hits": 0, "coalesced": 0, "backend_calls": 0, "errors": 0}
+
+    async def fetch(self, key: str, call: Callable[[], Awaitable[dict]]) -> tuple[dict, str]:
+        self.stats["requests"] += 1
+        result = self.memory.get(key)
+        if result is not None:
+            self.stats["memory_hits"] += 1
+            return result, "memory"
+        if self.disk is not None:
+            stored = await asyncio.to_thread(self.disk.get, key)
+            if stored is not None:
+                self.stats["disk_hits"] += 1
+                self.memory.set(key, stored[0], created=stored[1])
+                return stored[0], "disk"
+
+        loop = asyncio.get_running_loop()
+        future = self.inflight.get(key)
+        while future is not None and future.get_loop() is loop:
+            try:
+                result = await asyncio.shield(future)
+            except asyncio.CancelledError:
+                if not future.cancelled():
+                    raise
+                # The leader was cancelled, not us: take over the search (or join whoever already did)
+                future = self.inflight.get(key)
+                continue
+            self.stats["coalesced"] += 1
+            return result, "coalesced"
+
+        future = self.inflight[key] = loop.create_future()
+        try:
+            self.stats["backend_calls"] += 1
+            result = await call()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Mark retrieved so a search nobody joined does not log "exception was never retrieved"
+            future.exception()
+            raise
+        else:
+            future.set_result(result)
+            self.memory.set(key, result)
+            if self.disk is not None:
+                await asyncio.to_thread(self.disk.set, key, result)
+            return result, "miss"
+        finally:
+            if self.inflight.get(key) is future:
+                del self.inflight[key]
+
+    def snapshot(self) -> dict:
+        served = self.stats["memory_hits"] + self.stats["disk_hits"] + self.stats["coalesced"]
+        return {
+            **self.stats,
+            "hit_rate": round(served / self.stats["requests"], 3) if self.stats["requests"] else 0.0,
+            "entries": len(self.memory),
+            "in_flight": len(self.inflight),
+        }
+
+
+_caches: dict[tuple, SearchCache] = {}
+_client: httpx.AsyncClient | None = None
+
+
+def get_search_cache(max_entries: int, ttl: float, disk: bool, disk_path: str = DISK_CACHE_PATH) -> SearchCache:
+    # Components with different settings get separate caches instead of replacing each other's
+    config = (max_entries, ttl, disk_path if disk else None)
+    cache = _caches.get(config)
+    if cache is None:
+        if disk:
+            root, ext = os.path.splitext(disk_path)
+            disk_path = f"{root}-{max_entries}-{ttl:g}{ext}"
+        cache = _caches[config] = SearchCache(max_entries, ttl, disk_path if disk else None)
+    return cache
+
+
+def client() -> httpx.AsyncClient:
+    global _client
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient(timeout=90.0)
+    return _client
+
+
+async def stub_search(payload: dict) -> dict:
+    await asyncio.sleep(STUB_LATENCY)
+    rng = random.Random(payload["query"])
+    return {
+        "answer": f"Stub answer for {payload['query']}",
+        "results": [
+            {
+                "title": f"Result {i + 1} for {payload['query']}",
+                "url": f"https://example.com/{rng.randrange(10**6)}",
+                "content": f"Stub content {i + 1} about {payload['query']}.",
+                "score": round(1 - i * 0.1, 2),
+            }
+            for i in range(payload.get("max_results") or 5)
+        ],
+        "images": [],
+    }
@@ -0,0 +1,31 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Hashable
+
+
+class SharedRun:
+    """
+    One run per key for a component's outputs.
+
+    Callers with the key of the current run join it while it is in flight and reuse its result
+    afterwards; another key starts a new run. A failed or cancelled run is not reused.
+    """
+
+    def __init__(self):
+        self.key: Hashable | None = None
+        self.task: asyncio.Task | None = None
+        # Objects the key refers to by id, held so the ids can't be reused while the key is
+        self.pinned: Any = None
+
+    def _reusable(self, key: Hashable) -> bool:
+        if self.task is None or self.key != key:
+            return False
+        if not self.task.done():
+            return True
+        return not self.task.cancelled() and self.task.exception() is None
+
+    async def run(self, key: Hashable, call: Callable[[], Awaitable[Any]], pinned: Any = None) -> Any:
+        if not self._reusable(key):
+            self.key, self.pinned = key, pinned
+            self.task = asyncio.ensure_future(call())
+        # Shielded: one output being cancelled does not cancel the run the other is waiting on
+        return await asyncio.shield(self.task)
@@ -0,0 +1,214 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from langflow.custom.custom_component.component import Component
+from langflow.helpers.data import data_to_text
+from langflow.io import HandleInput, IntInput, MessageTextInput, MultilineInput, Output
+from langflow.memory import aget_messages
+from langflow.schema.message import Message
+
+try:
+    import tiktoken
+
+    _ENCODING = tiktoken.get_encoding("cl100k_base")
+except Exception:  # noqa: BLE001
+    _ENCODING = None
+
+CACHE_PATH = os.getenv(
+    "WINDOWED_MEMORY_CACHE_PATH",
+    os.path.join(os.getenv("LANGFLOW_CONFIG_DIR", "."), "windowed_memory.sqlite3"),
+)
+# Rolling summaries are dropped for sessions idle longer than this
+CACHE_TTL = float(os.getenv("WINDOWED_MEMORY_CACHE_TTL", str(30 * 24 * 3600)))
+
+SUMMARY_PROMPT = """Update the running summary of a conversation with the new messages below.
+Keep facts, names, decisions, open questions and user preferences; drop small talk.
+Answer with the updated summary only, in at most {max_tokens} tokens.
+
+Current summary:
+{summary}
+
+New messages:
+{messages}"""
+
+
+def count_tokens(text: str) -> int:
+    if _ENCODING is not None:
+        return len(_ENCODING.encode(text, disallowed_special=()))
+    return max(1, len(text) // 4)
+
+
+def truncate_tokens(text: str, max_tokens: int, keep_end: bool = False) -> str:
+    if count_tokens(text) <= max_tokens:
+        return text
+    if _ENCODING is not None:
+        tokens = _ENCODING.encode(text, disallowed_special=())
+        tokens = tokens[-max_tokens:] if keep_end else tokens[:max_tokens]
+        return _ENCODING.decode(tokens)
+    chars = max_tokens * 4
+    return text[-chars:] if keep_end else text[:chars]
+
+
+class SummaryStore:
+    # One row per flow and session: the rolling summary and the newest message folded into it.
+    # Stored on disk because Langflow rebuilds the component for every run.
+    def __init__(self, path: str, ttl: float):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS summaries ("
+            "key TEXT PRIMARY KEY, summary TEXT NOT NULL, until TEXT NOT NULL, "
+            "boundary_ids TEXT NOT NULL, updated REAL NOT NULL)"
+        )
+
+    def get(self, key: str) -> tuple[str, str, set]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT summary, until, boundary_ids, updated FROM summaries WHERE key = ?", (key,)
+            ).fetchone()
+        if row is None or (self.ttl and time.time() - row[3] > self.ttl):
+            return "", "", set()
+        return row[0], row[1], set(json.loads(row[2]))
+
+    def set(self, key: str, summary: str, until: str, boundary_ids: set):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO summaries (key, summary, until, boundary_ids, updated) VALUES (?, ?, ?, ?, ?)",
+                (key, summary, until, json.dumps(sorted(boundary_ids)), time.time()),
+            )
+            if self.ttl:
+                self._conn.execute("DELETE FROM summaries WHERE updated < ?", (time.time() - self.ttl,))
+
+
+_stores: dict[str, SummaryStore] = {}
+
+
+def get_store(path: str = CACHE_PATH) -> SummaryStore:
+    if path not in _stores:
+        _stores[path] = SummaryStore(path, CACHE_TTL)
+    return _stores[path]
+
+
+class WindowedMemoryComponent(Component):
+    display_name = "Windowed Memory"
+    description = (
+        "Chat history that fits a token budget: the most recent messages verbatim plus a cached "
+        "rolling summary of everything older."
+    )
+    icon = "message-square-more"
+    name = "WindowedMemory"
+
+    inputs = [
+        MessageTextInput(
+            name="session_id",
+            display_name="Session ID",
+            info="The session ID of the chat. If empty, the current session ID parameter will be used.",
+            value="",
+            advanced=True,
+        ),
+        IntInput(
+            name="window_tokens",
+            display_name="Window Tokens",
+            value=2000,
+            info="Token budget for the recent messages that are kept verbatim.",
+        ),
+        IntInput(
+            name="summary_tokens",
+            display_name="Summary Tokens",
+            value=500,
+            info="Token budget for the summary of messages that no longer fit the window.",
+        ),
+        HandleInput(
+            name="llm",
+            display_name="Summarizer Model",
+            input_types=["LanguageModel"],
+            info="Model used to update the summary. If empty, older messages are kept as clipped excerpts.",
+            required=False,
+        ),
+        IntInput(
+            name="n_messages",
+            display_name="Messages to Scan",
+            value=100,
+            info="How many recent messages are read per run. Must cover the window plus one turn.",
+            advanced=True,
+        ),
+        MultilineInput(
+            name="template",
+            display_name="Template",
+            info="The template to use for formatting each message. "
+            "It can contain the keys {text}, {sender} or any other key in the message data.",
+            value="{sender_name}: {text}",
+            advanced=True,
+        ),
+    ]
+
+    outputs = [
+        Output(display_name="Messages", name="messages_text", method="retrieve_messages_as_text"),
+    ]
+
+    def _format(self, messages: list[Message]) -> str:
+        return data_to_text(self.template, messages) if messages else ""
+
+    def _split_window(self, messages: list[Message]) -> tuple[list[Message], list[Message]]:
+        # Newest first until the budget is spent; an oversized newest message is clipped, never dropped
+        window: list[Message] = []
+        used = 0
+        for message in reversed(messages):
+            tokens = count_tokens(self._format([message]))
+            if window and used + tokens > self.window_tokens:
+                break
+            if not window and tokens > self.window_tokens:
+                message = message.model_copy(update={"text": truncate_tokens(message.text or "", self.window_tokens)})
+                tokens = self.window_tokens
+            window.insert(0, message)
+            used += tokens
+        return messages[: len(messages) - len(window)], window
+
+    async def _summarize(self, summary: str, messages: list[Message]) -> str:
+        if self.llm is None:
+            excerpts = "\n".join(truncate_tokens(self._format([m]), 60) for m in messages)
+            return truncate_tokens(f"{summary}\n{excerpts}".strip(), self.summary_tokens, keep_end=True)
+        prompt = SUMMARY_PROMPT.format(
+            max_tokens=self.summary_tokens, summary=summary or "(empty)", messages=self._format(messages)
+        )
+        response = await self.llm.ainvoke(prompt)
+        text = response.content if hasattr(response, "content") else str(response)
+        return truncate_tokens(text.strip(), self.summary_tokens)
+
+    async def retrieve_messages_as_text(self) -> Message:
+        session_id = self.session_id or self.graph.session_id
+        stored = await aget_messages(session_id=session_id, order="DESC", limit=self.n_messages)
+        messages = list(reversed(stored or []))
+        older, window = self._split_window(messages)
+
+        store = get_store()
+        key = f"{self.graph.flow_id}:{session_id}"
+        summary, until, boundary_ids = store.get(key)
+        # Only messages pushed out of the window since the last run are folded into the summary
+        overflow = [
+            m for m in older
+            if str(m.timestamp) > until or (str(m.timestamp) == until and str(m.id) not in boundary_ids)
+        ]
+        if overflow:
+            summary = await self._summarize(summary, overflow)
+            until = str(overflow[-1].timestamp)
+            boundary_ids = {str(m.id) for m in older if str(m.timestamp) == until}
+            store.set(key, summary, until, boundary_ids)
+
+        parts = []
+        if summary:
+            parts.append(f"Summary of earlier conversation:\n{summary}")
+        if window:
+            parts.append(self._format(window))
+        text = "\n\n".join(parts)
+        self.status = (
+            f"{len(window)} recent messages, {len(overflow)} newly summarized, ~{count_tokens(text)} tokens"
+        )
+        return Message(text=text)
@@ -0,0 +1,291 @@
+import hashlib
+import json
+import os
+import re
+import shutil
+import sys
+import types
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from langflow.custom.custom_component.component import Component
+from langflow.io import DropdownInput, HandleInput, IntInput, MessageTextInput, Output
+from langflow.schema.data import Data
+from langflow.schema.dataframe import DataFrame
+from langflow.schema.message import Message
+
+INDEX_DIR = os.getenv(
+    "LOCAL_RETRIEVAL_INDEX_DIR",
+    os.path.join(os.getenv("LANGFLOW_CONFIG_DIR", "."), "retrieval_index"),
+)
+# Open indexes kept per worker; the vectors themselves stay memory-mapped
+OPEN_INDEXES = 32
+# Rows scored per matrix product, so huge indexes never need one full score matrix in memory
+SCORE_BLOCK_ROWS = 65536
+EMBED_BATCH_SIZE = 64
+QUERY_EMBED_WORKERS = 8
+HASHING_DIM = 1024
+
+_TOKEN = re.compile(r"\w+", re.UNICODE)
+
+
+class HashingEmbedder:
+    # Offline default: signed feature hashing of words and word bigrams, log-scaled and L2-normalized
+    def __init__(self, dim: int = HASHING_DIM):
+        self.dim = dim
+        self.id = f"hashing-{dim}"
+
+    def _features(self, text: str) -> list[str]:
+        words = _TOKEN.findall(text.casefold())
+        return words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+
+    def embed(self, texts: list[str]) -> np.ndarray:
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            features = self._features(text)
+            if not features:
+                continue
+            digests = np.frombuffer(
+                b"".join(hashlib.blake2b(f.encode(), digest_size=8).digest() for f in features), dtype=np.uint64
+            )
+            columns = (digests % self.dim).astype(np.int64)
+            signs = np.where((digests >> np.uint64(63)) == 1, -1.0, 1.0).astype(np.float32)
+            np.add.at(vectors[row], columns, signs)
+        vectors = np.sign(vectors) * np.log1p(np.abs(vectors))
+        return _normalize(vectors)
+
+
+class LangChainEmbedder:
+    def __init__(self, embeddings):
+        self.embeddings = embeddings
+        self.id = f"{type(embeddings).__name__}-{getattr(embeddings, 'model', '') or getattr(embeddings, 'model_name', '')}"
+
+    def embed(self, texts: list[str]) -> np.ndarray:
+        rows = []
+        for start in range(0, len(texts), EMBED_BATCH_SIZE):
+            rows.extend(self.embeddings.embed_documents(texts[start:start + EMBED_BATCH_SIZE]))
+        return _normalize(np.asarray(rows, dtype=np.float32))
+
+    def embed_queries(self, texts: list[str]) -> np.ndarray:
+        # Always query semantics (asymmetric models prefix queries and passages differently);
+        # several questions are embedded in parallel rather than through embed_documents
+        if len(texts) == 1:
+            vectors = [self.embeddings.embed_query(texts[0])]
+        else:
+            with ThreadPoolExecutor(max_workers=min(len(texts), QUERY_EMBED_WORKERS)) as pool:
+                vectors = list(pool.map(self.embeddings.embed_query, texts))
+        return _normalize(np.asarray(vectors, dtype=np.float32))
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def chunk_text(text: str, size: int, overlap: int) -> list[str]:
+    # Windows of about `size` characters that end on whitespace where possible
+    text = re.sub(r"[ \t]+", " ", text).strip()
+    chunks = []
+    start = 0
+    while start < len(text):
+        end = min(len(text), start + size)
+        if end < len(text):
+            cut = text.rfind(" ", start + size // 2, end)
+            end = cut if cut != -1 else end
+        chunk = text[start:end].strip()
+        if chunk:
+            chunks.append(chunk)
+        if end >= len(text):
+            break
+        start = max(end - overlap, start + 1)
+    return chunks
+
+
+def top_k(vectors: np.ndarray, queries: np.ndarray, k: int) -> tuple[np.ndarray, np.ndarray]:
+    # Cosine scores (vectors are normalized) for a batch of queries, best k per query
+    k = min(k, len(vectors))
+    best_scores = np.full((len(queries), 0), -np.inf, dtype=np.float32)
+    best_rows = np.zeros((len(queries), 0), dtype=np.int64)
+    for start in range(0, len(vectors), SCORE_BLOCK_ROWS):
+        scores = queries @ np.asarray(vectors[start:start + SCORE_BLOCK_ROWS]).T
+        rows = np.arange(start, start + scores.shape[1])
+        scores = np.concatenate([best_scores, scores], axis=1)
+        rows = np.concatenate([best_rows, np.broadcast_to(rows, (len(queries), len(rows)))], axis=1)
+        keep = np.argpartition(-scores, k - 1, axis=1)[:, :k] if scores.shape[1] > k else np.argsort(-scores, axis=1)
+        best_scores = np.take_along_axis(scores, keep, axis=1)
+        best_rows = np.take_along_axis(rows, keep, axis=1)
+    order = np.argsort(-best_scores, axis=1)
+    return np.take_along_axis(best_rows, order, axis=1), np.take_along_axis(best_scores, order, axis=1)
+
+
+class LocalIndex:
+    def __init__(self, path: str):
+        self.path = path
+        self.vectors = np.load(os.path.join(path, "vectors.npy"), mmap_mode="r")
+        with open(os.path.join(path, "chunks.json"), encoding="utf-8") as f:
+            self.chunks = json.load(f)
+
+    @classmethod
+    def build(cls, path: str, chunks: list[str], vectors: np.ndarray) -> "LocalIndex":
+        # Written to a temporary directory and renamed, so readers never see a half-written index
+        tmp = f"{path}.{uuid.uuid4().hex}.tmp"
+        os.makedirs(tmp)
+        np.save(os.path.join(tmp, "vectors.npy"), vectors.astype(np.float32))
+        with open(os.path.join(tmp, "chunks.json"), "w", encoding="utf-8") as f:
+            json.dump(chunks, f, ensure_ascii=False)
+        try:
+            os.rename(tmp, path)
+        except OSError:
+            # Another worker built the same index first
+            shutil.rmtree(tmp, ignore_errors=True)
+        return cls(path)
+
+
+def _open_indexes() -> "OrderedDict[str, LocalIndex]":
+    # Langflow may re-execute component code for every build, which would reset module globals
+    holder = sys.modules.setdefault("_langflow_local_retrieval", types.ModuleType("_langflow_local_retrieval"))
+    if not hasattr(holder, "indexes"):
+        holder.indexes = OrderedDict()
+    return holder.indexes
+
+
+class LocalRetrievalComponent(Component):
+    display_name = "Local Retrieval"
+    description = (
+        "Chunks and embeds a document once, keeps the vectors in a memory-mapped index keyed by the "
+        "file hash, and returns the chunks most relevant to the query."
+    )
+    icon = "file-search"
+    name = "LocalRetrieval"
+
+    inputs = [
+        HandleInput(
+            name="document",
+            display_name="Document",
+            input_types=["Data", "DataFrame", "Message"],
+            info="Parsed document, e.g. the output of the File component.",
+            required=False,
+        ),
+        MessageTextInput(
+            name="file_path",
+            display_name="File Path",
+            info="Text file to index directly instead of a connected document.",
+            advanced=True,
+        ),
+        MessageTextInput(
+            name="query",
+            display_name="Query",
+            info="Question to retrieve context for. Several questions can be given one per line.",
+            tool_mode=True,
+        ),
+        IntInput(name="top_k", display_name="Top K", value=4, info="Chunks returned per query."),
+        IntInput(name="chunk_size", display_name="Chunk Size", value=1000, advanced=True),
+        IntInput(name="chunk_overlap", display_name="Chunk Overlap", value=150, advanced=True),
+        DropdownInput(
+            name="embedder",
+            display_name="Embedder",
+            options=["Hashing (offline)", "Connected model"],
+            value="Hashing (offline)",
+            info="The offline default needs no model or network; a connected model gives semantic matching.",
+        ),
+        HandleInput(
+            name="embedding_model",
+            display_name="Embedding Model",
+            input_types=["Embeddings"],
+            required=False,
+            advanced=True,
+        ),
+    ]
+
+    outputs = [
+        Output(display_name="Chunks", name="chunks", method="retrieve_dataframe"),
+        Output(display_name="Context", name="context", method="retrieve_context"),
+    ]
+
+    def _document_text(self) -> tuple[str, str]:
+        if self.file_path:
+            with open(self.file_path, "rb") as f:
+                raw = f.read()
+            return raw.decode("utf-8", errors="replace"), hashlib.sha256(raw).hexdigest()
+        document = self.document
+        if isinstance(document, DataFrame):
+            text = "\n\n".join(row.get_text() for row in document.to_data_list())
+        elif isinstance(document, list):
+            text = "\n\n".join(getattr(d, "text", None) or str(d) for d in document)
+        else:
+            text = getattr(document, "text", None) or ""
+        if not text:
+            msg = "Connect a document or set a file path."
+            raise ValueError(msg)
+        return text, hashlib.sha256(text.encode()).hexdigest()
+
+    def _embedder(self):
+        if self.embedder == "Connected model":
+            if self.embedding_model is None:
+                msg = "Connect an embedding model or use the offline embedder."
+                raise ValueError(msg)
+            return LangChainEmbedder(self.embedding_model)
+        return HashingEmbedder()
+
+    def _load_index(self, embedder) -> LocalIndex:
+        text, digest = self._document_text()
+        settings = f"{embedder.id}-{self.chunk_size}-{self.chunk_overlap}"
+        key = f"{digest[:32]}-{hashlib.sha256(settings.encode()).hexdigest()[:12]}"
+        indexes = _open_indexes()
+        if key in indexes:
+            indexes.move_to_end(key)
+            self._index_source = "cached"
+            return indexes[key]
+
+        path = os.path.join(INDEX_DIR, key)
+        if os.path.isdir(path):
+            index = LocalIndex(path)
+            self._index_source = "loaded"
+        else:
+            os.makedirs(INDEX_DIR, exist_ok=True)
+            chunks = chunk_text(text, self.chunk_size, self.chunk_overlap)
+            vectors = embedder.embed(chunks) if chunks else np.zeros((0, 1), dtype=np.float32)
+            index = LocalIndex.build(path, chunks, vectors)
+            self._index_source = "built"
+        indexes[key] = index
+        while len(indexes) > OPEN_INDEXES:
+            indexes.popitem(last=False)
+        return index
+
+    def retrieve(self) -> list[Data]:
+        embedder = self._embedder()
+        index = self._load_index(embedder)
+        queries = [q.strip() for q in (self.query or "").splitlines() if q.strip()]
+        # Both outputs share one search; another query (tool mode) or a rebuilt index searches again
+        mtime = os.stat(os.path.join(index.path, "vectors.npy")).st_mtime_ns
+        key = (tuple(queries), self.top_k, index.path, mtime)
+        retrieved = getattr(self, "_retrieved", None)
+        if retrieved is not None and retrieved[0] == key:
+            return retrieved[1]
+        results = []
+        if queries and index.chunks:
+            embed_queries = getattr(embedder, "embed_queries", embedder.embed)
+            rows, scores = top_k(index.vectors, embed_queries(queries), max(1, self.top_k))
+            for query_index, query in enumerate(queries):
+                for row, score in zip(rows[query_index], scores[query_index]):
+                    results.append(
+                        Data(
+                            text=index.chunks[row],
+                            data={"query": query, "chunk": int(row), "score": round(float(score), 4)},
+                        )
+                    )
+        self.status = f"{len(index.chunks)} chunks ({self._index_source} index), {len(results)} returned"
+        self._retrieved = (key, results)
+        return results
+
+    def retrieve_dataframe(self) -> DataFrame:
+        return DataFrame(self.retrieve())
+
+    def retrieve_context(self) -> Message:
+        # Chunks shared by several queries are included once, in document order
+        chunks = {}
+        for result in self.retrieve():
+            chunks.setdefault(result.data["chunk"], result.text)
+        return Message(text="\n\n---\n\n".join(chunks[row] for row in sorted(chunks)))
@@ -0,0 +1,223 @@
+import httpx
+from component_lib.search_cache import STUB_BACKEND, SearchCache, client, get_search_cache, search_key, stub_search
+from langflow.custom.custom_component.component import Component
+from langflow.inputs.inputs import BoolInput, DropdownInput, IntInput, MessageTextInput, SecretStrInput
+from langflow.logging.logger import logger
+from langflow.schema.data import Data
+from langflow.schema.dataframe import DataFrame
+from langflow.template.field.base import Output
+
+TAVILY_URL = "https://api.tavily.com/search"
+
+
+class CachedSearchComponent(Component):
+    display_name = "Cached Web Search"
+    description = (
+        "Tavily search with normalized-query caching (memory and optional disk) and merging of "
+        "identical in-flight searches. Drop-in replacement for Tavily Search API."
+    )
+    icon = "TavilyIcon"
+    name = "CachedSearch"
+
+    inputs = [
+        SecretStrInput(
+            name="api_key",
+            display_name="Tavily API Key",
+            required=False,
+            info="Your Tavily API Key. Not needed with the stub backend.",
+        ),
+        MessageTextInput(
+            name="query",
+            display_name="Search Query",
+            info="The search query you want to execute with Tavily.",
+            tool_mode=True,
+        ),
+        DropdownInput(
+            name="search_depth",
+            display_name="Search Depth",
+            info="The depth of the search.",
+            options=["basic", "advanced"],
+            value="advanced",
+            advanced=True,
+        ),
+        IntInput(
+            name="chunks_per_source",
+            display_name="Chunks Per Source",
+            info="The number of content chunks to retrieve from each source (1-3). Only works with advanced search.",
+            value=3,
+            advanced=True,
+        ),
+        DropdownInput(
+            name="topic",
+            display_name="Search Topic",
+            info="The category of the search.",
+            options=["general", "news"],
+            value="general",
+            advanced=True,
+        ),
+        IntInput(
+            name="days",
+            display_name="Days",
+            info="Number of days back from current date to include. Only available with news topic.",
+            value=7,
+            advanced=True,
+        ),
+        IntInput(
+            name="max_results",
+            display_name="Max Results",
+            info="The maximum number of search results to return.",
+            value=5,
+            advanced=True,
+        ),
+        BoolInput(
+            name="include_answer",
+            display_name="Include Answer",
+            info="Include a short answer to original query.",
+            value=True,
+            advanced=True,
+        ),
+        DropdownInput(
+            name="time_range",
+            display_name="Time Range",
+            info="The time range back from the current date to filter results.",
+            options=["day", "week", "month", "year"],
+            value=None,
+            advanced=True,
+        ),
+        BoolInput(
+            name="include_images",
+            display_name="Include Images",
+            info="Include a list of query-related images in the response.",
+            value=True,
+            advanced=True,
+        ),
+        MessageTextInput(
+            name="include_domains",
+            display_name="Include Domains",
+            info="Comma-separated list of domains to include in the search results.",
+            advanced=True,
+        ),
+        MessageTextInput(
+            name="exclude_domains",
+            display_name="Exclude Domains",
+            info="Comma-separated list of domains to exclude from the search results.",
+            advanced=True,
+        ),
+        IntInput(
+            name="cache_ttl",
+            display_name="Cache TTL (seconds)",
+            info="How long search results are reused. 0 disables expiry.",
+            value=3600,
+            advanced=True,
+        ),
+        IntInput(
+            name="cache_max_entries",
+            display_name="Cache Size",
+            info="Maximum number of searches kept in memory (least recently used are evicted).",
+            value=1000,
+            advanced=True,
+        ),
+        BoolInput(
+            name="disk_cache",
+            display_name="Disk Cache",
+            info="Also keep results in SQLite so they survive restarts and are shared between workers.",
+            value=False,
+            advanced=True,
+        ),
+        MessageTextInput(
+            name="backend_url",
+            display_name="Backend URL",
+            info=f"Search endpoint. Use '{STUB_BACKEND}' for canned offline results.",
+            value=TAVILY_URL,
+            advanced=True,
+        ),
+    ]
+
+    outputs = [
+        Output(display_name="DataFrame", name="dataframe", method="fetch_content_dataframe"),
+        Output(display_name="Cache Stats", name="cache_stats", method="cache_stats", tool_mode=False),
+    ]
+
+    def _payload(self, query: str) -> dict:
+        payload = {
+            "query": query,
+            "search_depth": self.search_depth,
+            "topic": self.topic,
+            "max_results": self.max_results,
+            "include_images": self.include_images,
+            "include_answer": self.include_answer,
+        }
+        include = [d.strip() for d in (self.include_domains or "").split(",") if d.strip()]
+        exclude = [d.strip() for d in (self.exclude_domains or "").split(",") if d.strip()]
+        if include:
+            payload["include_domains"] = sorted(include)
+        if exclude:
+            payload["exclude_domains"] = sorted(exclude)
+        if self.search_depth == "advanced" and self.chunks_per_source:
+            payload["chunks_per_source"] = self.chunks_per_source
+        if self.topic == "news" and self.days:
+            payload["days"] = int(self.days)
+        if self.time_range:
+            payload["time_range"] = self.time_range
+        return payload
+
+    def _cache(self) -> SearchCache:
+        return get_search_cache(self.cache_max_entries, self.cache_ttl, self.disk_cache)
+
+    async def _call_backend(self, payload: dict) -> dict:
+        if self.backend_url == STUB_BACKEND:
+            return await stub_search(payload)
+        response = await client().post(
+            self.backend_url or TAVILY_URL,
+            json={**payload, "api_key": self.api_key},
+            headers={"content-type": "application/json", "accept": "application/json"},
+        )
+        response.raise_for_status()
+        return response.json()
+
+    async def search(self) -> tuple[dict, str]:
+        payload = self._payload(self.query)
+        key = search_key(self.backend_url, payload)
+        return await self._cache().fetch(key, lambda: self._call_backend(payload))
+
+    async def fetch_content(self) -> list[Data]:
+        try:
+            search_results, source = await self.search()
+        except httpx.TimeoutException:
+            error_message = "Request timed out (90s). Please try again or adjust parameters."
+        except httpx.HTTPStatusError as exc:
+            error_message = f"HTTP error occurred: {exc.response.status_code} - {exc.response.text}"
+        except httpx.RequestError as exc:
+            error_message = f"Request error occurred: {exc}"
+        except ValueError as exc:
+            error_message = f"Invalid response format: {exc}"
+        else:
+            data_results = []
+            if self.include_answer and search_results.get("answer"):
+                data_results.append(Data(text=search_results["answer"]))
+            for result in search_results.get("results", []):
+                content = result.get("content", "")
+                result_data = {
+                    "title": result.get("title"),
+                    "url": result.get("url"),
+                    "content": content,
+                    "score": result.get("score"),
+                }
+                data_results.append(Data(text=content, data=result_data))
+            if self.include_images and search_results.get("images"):
+                data_results.append(Data(text="Images found", data={"images": search_results["images"]}))
+            stats = self._cache().snapshot()
+            self.status = f"{source} · hit rate {stats['hit_rate']:.0%} over {stats['requests']} searches"
+            return data_results
+
+        self._cache().stats["errors"] += 1
+        logger.error(error_message)
+        return [Data(text=error_message, data={"error": error_message})]
+
+    async def fetch_content_dataframe(self) -> DataFrame:
+        return DataFrame(await self.fetch_content())
+
+    def cache_stats(self) -> Data:
+        stats = self._cache().snapshot()
+        self.status = stats
+        return Data(data=stats)
@@ -0,0 +1,234 @@
+import asyncio
+import time
+from typing import Any
+
+from component_lib.shared_run import SharedRun
+from langflow.custom.custom_component.component import Component
+from langflow.io import DropdownInput, FloatInput, HandleInput, IntInput, MessageTextInput, MultilineInput, Output
+from langflow.schema.data import Data
+from langflow.schema.dataframe import DataFrame
+from langflow.schema.message import Message
+
+MAX_ITEMS = 50
+
+
+def _item_text(item: Any) -> str:
+    if isinstance(item, str):
+        return item
+    text = getattr(item, "text", None)
+    if text:
+        return text
+    data = getattr(item, "data", None)
+    if isinstance(data, dict):
+        return str(data.get("query") or data.get("text") or data)
+    return str(item)
+
+
+def _output_text(value: Any) -> str:
+    if isinstance(value, str):
+        return value
+    if isinstance(value, list):
+        return "\n\n".join(_output_text(v) for v in value)
+    # Run outputs of a sub-flow: RunOutputs -> ResultData -> {"message": Message}
+    outputs = getattr(value, "outputs", None)
+    if isinstance(outputs, list):
+        return "\n\n".join(_output_text(o) for o in outputs if o is not None)
+    results = getattr(value, "results", None)
+    if isinstance(results, dict):
+        message = results.get("message") or next(iter(results.values()), "")
+        return _output_text(message)
+    for attribute in ("text", "content"):
+        text = getattr(value, attribute, None)
+        if isinstance(text, str):
+            return text
+    return str(value)
+
+
+class ParallelFanOutComponent(Component):
+    display_name = "Parallel Fan-Out"
+    description = (
+        "Runs a tool or a sub-flow over several sub-queries at once, with a concurrency cap and a "
+        "per-item timeout. Failed or slow items are reported without losing the others."
+    )
+    icon = "split"
+    name = "ParallelFanOut"
+
+    inputs = [
+        MultilineInput(
+            name="queries",
+            display_name="Sub-queries",
+            info="One sub-query per line. Combined with Items when both are set.",
+            tool_mode=True,
+        ),
+        HandleInput(
+            name="items",
+            display_name="Items",
+            input_types=["Data", "DataFrame", "Message"],
+            info="Data items or messages to process; their text is used as the sub-query.",
+            is_list=True,
+            required=False,
+        ),
+        DropdownInput(
+            name="target",
+            display_name="Run With",
+            options=["Tool", "Sub-flow"],
+            value="Tool",
+            info="Run each item through the connected tool, or through another flow.",
+        ),
+        HandleInput(
+            name="tools",
+            display_name="Tool",
+            input_types=["Tool"],
+            is_list=True,
+            required=False,
+            info="Tool to run for each item (e.g. a search component in Tool mode).",
+        ),
+        MessageTextInput(
+            name="tool_name",
+            display_name="Tool Name",
+            info="Which tool to use when the connected toolkit has several. Empty = the first one.",
+            advanced=True,
+        ),
+        MessageTextInput(
+            name="tool_argument",
+            display_name="Tool Argument",
+            info="Argument that receives the item text. Empty = the tool's only argument, or 'query'.",
+            advanced=True,
+        ),
+        MessageTextInput(
+            name="flow_name",
+            display_name="Sub-flow Name",
+            info="Flow to run for each item when Run With is Sub-flow; the item is its chat input.",
+        ),
+        IntInput(
+            name="max_concurrency",
+            display_name="Max Concurrency",
+            value=4,
+            info="How many items run at the same time.",
+        ),
+        FloatInput(
+            name="item_timeout",
+            display_name="Item Timeout (seconds)",
+            value=30.0,
+            info="Items that take longer are reported as timed out.",
+        ),
+    ]
+
+    outputs = [
+        Output(display_name="Results", name="results", method="run_all_dataframe"),
+        Output(display_name="Combined", name="combined", method="run_all_message"),
+    ]
+
+    def _collect_items(self) -> list[str]:
+        texts = [line.strip() for line in (self.queries or "").splitlines() if line.strip()]
+        items = self.items or []
+        for item in items if isinstance(items, list) else [items]:
+            if isinstance(item, DataFrame):
+                texts.extend(_item_text(row) for row in item.to_data_list())
+            else:
+                texts.append(_item_text(item))
+        if len(texts) > MAX_ITEMS:
+            msg = f"Too many items to fan out ({len(texts)}); the limit is {MAX_ITEMS}."
+            raise ValueError(msg)
+        return texts
+
+    def _select_tool(self):
+        tools = self.tools or []
+        tools = tools if isinstance(tools, list) else [tools]
+        if not tools:
+            msg = "Connect a tool, or set Run With to Sub-flow."
+            raise ValueError(msg)
+        if self.tool_name:
+            for tool in tools:
+                if tool.name == self.tool_name:
+                    return tool
+            msg = f"Tool '{self.tool_name}' not found; available: {', '.join(t.name for t in tools)}"
+            raise ValueError(msg)
+        return tools[0]
+
+    def _tool_input(self, tool, text: str):
+        args = list(getattr(tool, "args", None) or {})
+        if self.tool_argument:
+            return {self.tool_argument: text}
+        if len(args) == 1:
+            return {args[0]: text}
+        if "query" in args:
+            return {"query": text}
+        return text
+
+    async def _run_one(self, text: str) -> Any:
+        if self.target == "Sub-flow":
+            if not self.flow_name:
+                msg = "Set the sub-flow name."
+                raise ValueError(msg)
+            return await self.run_flow(inputs={"input_value": text}, flow_name=self.flow_name)
+        tool = self._select_tool()
+        return await tool.ainvoke(self._tool_input(tool, text))
+
+    def _run_key(self, texts: list[str], tools: list) -> tuple:
+        # Tools are compared by identity: the same connected toolkit means the same run
+        return (
+            tuple(texts),
+            self.target,
+            tuple(id(tool) for tool in tools),
+            self.tool_name,
+            self.tool_argument,
+            self.flow_name,
+            self.max_concurrency,
+            self.item_timeout,
+        )
+
+    async def run_all(self) -> list[Data]:
+        # Both outputs share one run when both are connected, including while it is still in flight;
+        # a tool-mode call with other inputs runs again
+        texts = self._collect_items()
+        tools = self.tools if isinstance(self.tools, list) else [self.tools] if self.tools else []
+        shared = getattr(self, "_fanout_run", None)
+        if shared is None:
+            shared = self._fanout_run = SharedRun()
+        return await shared.run(self._run_key(texts, tools), lambda: self._fan_out(texts), pinned=tools)
+
+    async def _fan_out(self, texts: list[str]) -> list[Data]:
+        semaphore = asyncio.Semaphore(max(1, self.max_concurrency))
+        # Identical sub-queries run once and share the result
+        unique = list(dict.fromkeys(texts))
+
+        async def run(text: str) -> dict:
+            async with semaphore:
+                started = time.perf_counter()
+                try:
+                    output = await asyncio.wait_for(self._run_one(text), timeout=self.item_timeout or None)
+                except asyncio.TimeoutError:
+                    result = {"status": "timeout", "output": "", "error": f"timed out after {self.item_timeout}s"}
+                except Exception as e:  # noqa: BLE001
+                    result = {"status": "error", "output": "", "error": f"{type(e).__name__}: {e}"}
+                else:
+                    result = {"status": "ok", "output": _output_text(output), "error": None}
+                result["elapsed"] = round(time.perf_counter() - started, 3)
+                return result
+
+        started = time.perf_counter()
+        outcomes = dict(zip(unique, await asyncio.gather(*(run(text) for text in unique))))
+        elapsed = time.perf_counter() - started
+
+        results = [
+            Data(text=outcomes[text]["output"], data={"index": index, "input": text, **outcomes[text]})
+            for index, text in enumerate(texts)
+        ]
+        ok = sum(1 for outcome in outcomes.values() if outcome["status"] == "ok")
+        slowest = max((outcome["elapsed"] for outcome in outcomes.values()), default=0.0)
+        self.status = (
+            f"{ok}/{len(unique)} succeeded in {elapsed:.2f}s "
+            f"(slowest item {slowest:.2f}s, sum {sum(o['elapsed'] for o in outcomes.values()):.2f}s)"
+        )
+        return results
+
+    async def run_all_dataframe(self) -> DataFrame:
+        return DataFrame(await self.run_all())
+
+    async def run_all_message(self) -> Message:
+        sections = []
+        for result in await self.run_all():
+            body = result.data["output"] if result.data["status"] == "ok" else f"(no result: {result.data['error']})"
+            sections.append(f"### {result.data['input']}\n{body}")
+        return Message(text="\n\n".join(sections))
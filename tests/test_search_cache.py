@@ -0,0 +1,119 @@
+import asyncio
+
+import pytest
+
+from component_lib import search_cache
+from component_lib.search_cache import SearchCache, get_search_cache, search_key
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def time(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(search_cache, "time", clock)
+    return clock
+
+
+class Backend:
+    def __init__(self, latency: float = 0.02):
+        self.latency = latency
+        self.queries = []
+
+    def call(self, query: str):
+        async def run():
+            self.queries.append(query)
+            await asyncio.sleep(self.latency)
+            return {"answer": f"answer for {query}"}
+
+        return run
+
+
+def key(query: str) -> str:
+    return search_key("stub", {"query": query, "max_results": 3})
+
+
+def test_key_normalizes_only_the_query():
+    assert key("  What IS Python?? ") == key("what is python")
+    assert search_key("stub", {"query": "python", "max_results": 3}) != search_key(
+        "stub", {"query": "python", "max_results": 5}
+    )
+
+
+def test_memory_hit_and_ttl_expiry(clock):
+    cache, backend = SearchCache(max_entries=10, ttl=60), Backend(latency=0)
+
+    async def run():
+        sources = [(await cache.fetch(key("Python?"), backend.call("Python?")))[1]]
+        clock.now += 59
+        sources.append((await cache.fetch(key("python"), backend.call("python")))[1])
+        clock.now += 2
+        sources.append((await cache.fetch(key("python"), backend.call("python")))[1])
+        return sources
+
+    assert asyncio.run(run()) == ["miss", "memory", "miss"]
+    # The backend got the query as typed
+    assert backend.queries == ["Python?", "python"]
+
+
+def test_concurrent_identical_searches_are_coalesced():
+    cache, backend = SearchCache(max_entries=10, ttl=60), Backend()
+
+    async def run():
+        return await asyncio.gather(*(cache.fetch(key("python"), backend.call("python")) for _ in range(3)))
+
+    results = asyncio.run(run())
+    assert sorted(source for _, source in results) == ["coalesced", "coalesced", "miss"]
+    assert len(backend.queries) == 1
+
+
+def test_follower_takes_over_when_the_leader_is_cancelled():
+    cache, backend = SearchCache(max_entries=10, ttl=60), Backend()
+
+    async def run():
+        leader = asyncio.create_task(cache.fetch(key("python"), backend.call("python")))
+        await asyncio.sleep(0.005)
+        follower = asyncio.create_task(cache.fetch(key("python"), backend.call("python")))
+        await asyncio.sleep(0.005)
+        leader.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        return await follower
+
+    result, source = asyncio.run(run())
+    assert source == "miss"
+    assert result == {"answer": "answer for python"}
+    assert len(backend.queries) == 2
+
+
+def test_differently_configured_caches_are_separate(tmp_path, monkeypatch):
+    monkeypatch.setattr(search_cache, "_caches", {})
+    path = str(tmp_path / "cache.sqlite3")
+    small = get_search_cache(10, 60, disk=False, disk_path=path)
+    on_disk = get_search_cache(10, 60, disk=True, disk_path=path)
+    assert get_search_cache(10, 60, disk=False, disk_path=path) is small
+    assert small.disk is None and on_disk.disk is not None
+    small.memory.set("k", {"v": 1})
+    # Another component with other settings neither replaces nor clears it
+    assert get_search_cache(20, 60, disk=False, disk_path=path) is not small
+    assert get_search_cache(10, 60, disk=False, disk_path=path).memory.get("k") == {"v": 1}
+
+
+def test_disk_cache_evicts_least_recently_used(tmp_path, clock):
+    disk = search_cache.DiskCache(str(tmp_path / "cache.sqlite3"), max_entries=2, ttl=0)
+    disk.set("a", {"v": "a"})
+    clock.now += 1
+    disk.set("b", {"v": "b"})
+    clock.now += 1
+    assert disk.get("a") is not None
+    clock.now += 1
+    disk.set("c", {"v": "c"})
+    assert disk.get("a") is not None
+    assert disk.get("b") is None
+    assert disk.get("c") is not None
@@ -0,0 +1,93 @@
+import asyncio
+
+from component_lib.shared_run import SharedRun
+
+
+class Runner:
+    def __init__(self, latency: float = 0.02, fail: bool = False):
+        self.latency = latency
+        self.fail = fail
+        self.calls = 0
+
+    def call(self, value):
+        async def run():
+            self.calls += 1
+            await asyncio.sleep(self.latency)
+            if self.fail:
+                raise RuntimeError("tool down")
+            return [value]
+
+        return run
+
+
+def test_follower_joins_the_leaders_run():
+    async def scenario():
+        shared, runner = SharedRun(), Runner()
+        leader = asyncio.ensure_future(shared.run(("a",), runner.call("a")))
+        await asyncio.sleep(0)
+        follower = asyncio.ensure_future(shared.run(("a",), runner.call("a")))
+        assert await leader is await follower
+        assert runner.calls == 1
+        assert shared.key == ("a",)
+
+    asyncio.run(scenario())
+
+
+def test_finished_run_is_reused_for_the_same_key():
+    async def scenario():
+        shared, runner = SharedRun(), Runner()
+        first = await shared.run(("a",), runner.call("a"))
+        assert await shared.run(("a",), runner.call("a")) is first
+        assert runner.calls == 1
+
+    asyncio.run(scenario())
+
+
+def test_other_key_runs_again():
+    async def scenario():
+        shared, runner = SharedRun(), Runner()
+        assert await shared.run(("a",), runner.call("a")) == ["a"]
+        assert await shared.run(("b",), runner.call("b")) == ["b"]
+        assert runner.calls == 2
+        assert shared.key == ("b",)
+
+    asyncio.run(scenario())
+
+
+def test_cancelled_follower_does_not_cancel_the_run():
+    async def scenario():
+        shared, runner = SharedRun(), Runner(latency=0.05)
+        leader = asyncio.ensure_future(shared.run(("a",), runner.call("a")))
+        follower = asyncio.ensure_future(shared.run(("a",), runner.call("a")))
+        await asyncio.sleep(0.01)
+        follower.cancel()
+        assert await leader == ["a"]
+        assert follower.cancelled()
+        assert runner.calls == 1
+
+    asyncio.run(scenario())
+
+
+def test_failed_run_is_shared_but_not_reused():
+    async def scenario():
+        shared, runner = SharedRun(), Runner(fail=True)
+        results = await asyncio.gather(
+            shared.run(("a",), runner.call("a")), shared.run(("a",), runner.call("a")), return_exceptions=True
+        )
+        assert all(isinstance(r, RuntimeError) for r in results)
+        assert runner.calls == 1
+        runner.fail = False
+        assert await shared.run(("a",), runner.call("a")) == ["a"]
+        assert runner.calls == 2
+
+    asyncio.run(scenario())
+
+
+def test_pinned_objects_are_held_with_the_key():
+    async def scenario():
+        shared, runner = SharedRun(), Runner()
+        tools = [object()]
+        await shared.run(tuple(id(t) for t in tools), runner.call("a"), pinned=tools)
+        assert shared.pinned is tools
+
+    asyncio.run(scenario())